@@ -33,7 +33,7 @@ class Backend():
 
 		form   = parameters['format']
 		if form == 'console':
-			self._back = ConsoleOut(parameters['widths'])
+			self._back = ConsoleOut(parameters['widths'], parameters.get('flags', []))
 		elif form == 'plain':
 			self._back = PlainOut(parameters['widths'], parameters['flags'], outp)
 		elif form == 'latex':
@@ -32,11 +32,12 @@ class ConsoleOut():
 	:parameter widths: Column widths.
 	:type widths: [int,]
 	"""
-	def __init__(self, widths):
+	def __init__(self, widths, flags = []):
 		if not widths:
 			self._widths = [30]
 		else:
 			self._widths = widths
+		self._flags = flags
 		logger.debug(str(self._widths))
 	
 	def writeout(self, msg, variables):
@@ -44,11 +45,17 @@ class ConsoleOut():
 		if msg == 'reviews':
 			header, data = reviews(variables)
 		elif msg == 'entries':
-			header, data = entries(variables)
+			header, data, crefs = entries(variables)
 		elif msg == 'custom':
 			header = variables["header"]
 			data   = variables["data"]
 		
+		self.printTable(header, data)
+		if msg == 'entries' and crefs and not '-nocref' in self._flags:
+			print "Referenced entries:"
+			self.printTable(*crefEntries(variables, crefs))
+
+	def printTable(self, header, data):
 		data = map(lambda x: ['' if v is None else v for v in x], data)
 		print wrap.indent([header]+data, hasHeader=True, separateRows=True,
 		             prefix='| ', postfix=' |', 
@@ -56,7 +63,7 @@ class ConsoleOut():
 			         widths = self._widths)
 
 def reviews(variables):
-	dbCon = dbapi.Connection(variables['db'])
+	dbCon = dbapi.getConnection(variables)
 	col_names, rows = dbCon.qGetSources(
 		srcs      = variables['sources'])
 	rows = map(list,rows)	
@@ -64,16 +71,26 @@ def reviews(variables):
 
 
 def entries(variables):
-	dbCon = dbapi.Connection(variables['db'])
+	dbCon = dbapi.getConnection(variables)
 	header, rows = dbCon.qGetEntries(
 		filterExp = variables['filter'],
-		srcs      = variables['sources'])	
+		srcs      = variables['sources'],
+		engine    = variables.get('engine', 'like'),
+		search    = variables.get('search'))
 	printdata = []
+	crefs = []
 	for row in rows:
 		row = list(row)
+		if row[header.index('Crefs')]:
+			crefs.extend([x.strip() for x in row[header.index('Crefs')].split(',')])
 		del row[header.index('Crefs')]
 		del row[header.index('Cites')]
 		printdata.append(row)
 	del header[header.index('Cites')]
 	del header[header.index('Crefs')]
-	return header, printdata
+	return header, printdata, crefs
+
+def crefEntries(variables, crefs):
+	dbCon = dbapi.getConnection(variables)
+	header, rows = dbCon.qGetCrefClosure(crefs)
+	return header, map(list, rows)
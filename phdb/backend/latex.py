@@ -54,14 +54,43 @@ class LaTeXOut():
 		f = open(self._output, "w")
 		writeheader(f)
 		f.write("\section{Query results}\n")
-		dbCon = dbapi.Connection(variables['db'])
-		col_names, rows = dbCon.qGetSources(
+		dbCon = dbapi.getConnection(variables)
+		col_names, rows = dbCon.qIterSources(
 			srcs      = variables['sources'])	
-		rows = map(lambda x: ['' if v is None else v for v in list(x)], rows)
+		rows = (['' if v is None else v for v in list(x)] for x in rows)
 		writeTable(f, col_names, rows, self._widths, "Tab01")
 		writefooter(f)
 		f.close()
 
+	def entries(self, variables):
+		f = open(self._output, "w")
+		writeheader(f)
+		f.write("\section{Query results}\n")
+		dbCon = dbapi.getConnection(variables)
+		header, rows = dbCon.qIterEntries(
+			filterExp = variables['filter'],
+			srcs      = variables['sources'],
+			engine    = variables.get('engine', 'like'),
+			search    = variables.get('search'))
+		crefIdx = header.index('Crefs')
+		citeIdx = header.index('Cites')
+		crefs = []
+		def printdata():
+			for row in rows:
+				row = ['' if v is None else v for v in list(row)]
+				if row[crefIdx]:
+					crefs.extend([x.strip() for x in row[crefIdx].split(',')])
+				yield [v for i, v in enumerate(row) if not i in [crefIdx, citeIdx]]
+		header = [v for i, v in enumerate(header) if not i in [crefIdx, citeIdx]]
+		writeTable(f, header, printdata(), self._widths, "Tab01")
+		if not '-nocref' in self._flags and crefs:
+			f.write("\n\section{Indirect references}\n")
+			header, rows = dbCon.qIterCrefClosure(crefs)
+			rows = (['' if v is None else v for v in list(x)] for x in rows)
+			writeTable(f, header, rows, self._widths, "Tab02")
+		writefooter(f)
+		f.close()
+
 """
 	def entries(self, var):
 		f = open(self._output, "w")
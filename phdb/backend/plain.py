@@ -10,6 +10,7 @@
 import textwrap
 import logging
 import os
+from itertools import chain
 
 import plainformatter as wrap
 import phdb.core.sqlite3cmd as dbapi
@@ -53,62 +54,54 @@ class PlainOut():
 
 
 def reviews(variables, widths, output):
-	dbCon = dbapi.Connection(variables['db'])
-	header, data = dbCon.qGetSources(
+	dbCon = dbapi.getConnection(variables)
+	header, data = dbCon.qIterSources(
 	srcs      = variables['sources'])	
 
-	data = map(lambda x: ['' if v is None else v for v in list(x)], data)
-	content = wrap.indent([header]+data, hasHeader=True, separateRows=True,
-	             prefix='| ', postfix=' |', 
-	             wrapfunc=lambda (x,y): wrap.wrap_onspace_strict(x,y), 
-		         widths = widths)
-	f = open(output, "w")
-	f.write(content)
-	f.close()
+	data = (['' if v is None else v for v in list(x)] for x in data)
+	writeTable(header, data, widths, output, "w")
 
 
 def entries(variables, widths, flags, output):
-	dbCon = dbapi.Connection(variables['db'])
-	header, rows = dbCon.qGetEntries(
+	dbCon = dbapi.getConnection(variables)
+	header, rows = dbCon.qIterEntries(
 		filterExp = variables['filter'],
-		srcs      = variables['sources'])	
-	printdata = []
+		srcs      = variables['sources'],
+		engine    = variables.get('engine', 'like'),
+		search    = variables.get('search'))
+	crefIdx = header.index('Crefs')
+	citeIdx = header.index('Cites')
 	crefs = []
-	for row in rows:
-		row = ['' if v is None else v for v in list(row)]
-		crossrefs = row[header.index('Crefs')]
-		if crossrefs : 
-			if ',' in crossrefs: crefs.append(','.split(crossrefs))
-			else: crefs.append(crossrefs)
-		del row[header.index('Crefs')]
-		del row[header.index('Cites')]
-		printdata.append(row)
-	del header[header.index('Cites')]
-	del header[header.index('Crefs')]
-
-	content = wrap.indent([header]+printdata, hasHeader=True, separateRows=True,
-	             prefix='| ', postfix=' |', 
-	             wrapfunc=lambda (x,y): wrap.wrap_onspace_strict(x,y), 
-		         widths = widths)
-	f = open(output, "w")
-	f.write(content)
-	f.close()
-
-	if not '-nocref' in flags:
-		newsrcs = set([x.split('/')[0] for x in crefs])
-		header, rows = dbCon.qGetCrefs(
-			lables    = crefs,
-			srcs      = newsrcs)
-		content = wrap.indent([header]+rows, hasHeader=True, separateRows=True,
-			         prefix='| ', postfix=' |', 
-			         wrapfunc=lambda (x,y): wrap.wrap_onspace_strict(x,y), 
-				     widths = widths)
+	def printdata():
+		for row in rows:
+			row = ['' if v is None else v for v in list(row)]
+			crossrefs = row[crefIdx]
+			if crossrefs : 
+				crefs.extend([x.strip() for x in crossrefs.split(',')])
+			yield [v for i, v in enumerate(row) if not i in [crefIdx, citeIdx]]
+	header = [v for i, v in enumerate(header) if not i in [crefIdx, citeIdx]]
+	writeTable(header, printdata(), widths, output, "w")
+
+	if not '-nocref' in flags and crefs:
+		header, rows = dbCon.qIterCrefClosure(crefs)
 		f = open(output, "a")
 		f.write("\n\nReferenced entries:\n\n")
-		f.write(content)
 		f.close()
+		writeTable(header, rows, widths, output, "a")
+
+
+def writeTable(header, rows, widths, output, mode):
+	"""Writes a table to a file, one row at a time."""
+	f = open(output, mode)
+	for line in wrap.indentStream(chain([header], rows), separateRows=True,
+	             prefix='| ', postfix=' |', 
+	             wrapfunc=lambda (x,y): wrap.wrap_onspace_strict(x,y), 
+		         widths = widths):
+		f.write(line + "\n")
+	f.close()
 
 
-def custom(variables):
-	pass
+def custom(variables, widths, output):
+	data = (['' if v is None else v for v in list(x)] for x in variables['data'])
+	writeTable(variables['header'], data, widths, output, "w")
 
@@ -13,7 +13,7 @@ import re
 import math
 import logging
 
-from itertools import izip_longest
+from itertools import izip_longest, chain
 
 try:
 	confPath = os.path.join(os.getenv('PHDB_CFG_PATH'), "logger.conf")
@@ -67,6 +67,29 @@ def indent(rows, hasHeader=False, headerChar='-', delim=' | ', justify='left',
 		if separateRows or hasHeader: print >> output, rowSeparator; hasHeader=False
 	return output.getvalue()
 
+def indentStream(rows, headerChar='-', delim=' | ', separateRows=False, prefix='', 
+                 postfix='', wrapfunc=lambda x:x, widths=[30]):
+	"""Same as :func:`indent` for a table with a header and left-justified columns,
+	but consumes the rows lazily and yields the table line by line (without line
+	endings). Since the rows are not known in advance, each column takes its full
+	width from `widths`; the last width is used for all remaining columns.
+	   - rows: An iterable of sequences of items. The first one is the header."""
+	rows = iter(rows)
+	header = next(rows)
+	colWidths = [w for (x,w) in izip_longest(header, widths, fillvalue=widths[-1])]
+	colWidths = colWidths[:len(header)]
+	rowSeparator = headerChar * (len(prefix) + len(postfix) + sum(colWidths) + \
+		                         len(delim)*(len(colWidths)-1))
+	yield rowSeparator
+	isHeader = True
+	for row in chain([header], rows):
+		items = [wrapfunc((str(item),width)).split('\n') for (item,width) in zip(row,colWidths)]
+		for line in izip_longest(*items, fillvalue=''):
+			yield prefix \
+				+ delim.join([item.ljust(width) for (item,width) in zip(line,colWidths)]) \
+				+ postfix
+		if separateRows or isHeader: yield rowSeparator; isHeader=False
+
 def wrap_onspace(text, width):
 	"""
 	A word-wrap function that preserves existing line breaks
@@ -0,0 +1,395 @@
+"""
+.. module:: phdb.core.asyncdb
+   :platform: Unix
+   :synopsis: Non-blocking facade over :class:`phdb.core.sqlite3cmd.Connection`.
+
+The queries of an :class:`AsyncConnection` run in a bounded pool of reader threads,
+and all changes in a single writer thread, so they are applied in the order they
+were submitted. Each thread owns its own :class:`phdb.core.sqlite3cmd.Connection`,
+since SQLite connections cannot be shared between threads. The methods return at
+once, with a :class:`Future` for the result or a :class:`RowStream` over the rows.
+
+Both can be cancelled, which interrupts a statement already running. A service
+with an event loop can be notified with :func:`Future.addDoneCallback`, which is
+called from the worker thread.
+
+.. note::
+
+   Concurrent readers and a writer work best with the `fast-read` profile (see
+   :data:`phdb.tools.settings.PROFILES`), where readers do not wait for commits.
+
+.. moduleauthor:: George Ungureanu <ugeorge@kth.se>
+
+"""
+
+import logging
+import threading
+import Queue
+
+import sqlite3cmd as dbapi
+
+logger = logging.getLogger('')
+
+#default number of reader threads (and connections) of a connection
+READERS = 4
+
+#number of row batches buffered by a stream before its reader waits for the consumer
+STREAM_BUFFER = 8
+
+#interval in seconds at which a waiting reader checks if its stream was cancelled
+POLL = 0.1
+
+class CancelledError(Exception):
+	"""Raised when the result of a cancelled operation is requested."""
+	pass
+
+class TimeoutError(Exception):
+	"""Raised when a result is not ready within the given time."""
+	pass
+
+class Future(object):
+	"""The result of an operation submitted to an :class:`AsyncConnection`."""
+	def __init__(self):
+		self._lock      = threading.Lock()
+		self._done      = threading.Event()
+		self._result    = None
+		self._error     = None
+		self._cancelled = False
+		self._interrupt = None
+		self._callbacks = []
+
+	def cancel(self):
+		"""Cancels the operation. If it is running, its statement is interrupted.
+
+		:returns: bool -- `False` if the operation had already finished.
+		"""
+		with self._lock:
+			if self._done.is_set():
+				return False
+			self._cancelled = True
+			if self._interrupt:
+				self._interrupt()
+				return True
+		self._finish()
+		return True
+
+	def cancelled(self):
+		return self._cancelled
+
+	def done(self):
+		return self._done.is_set()
+
+	def result(self, timeout = None):
+		"""Waits for the operation to finish and returns its result.
+
+		:parameter timeout: Maximum time to wait, in seconds. Waits forever if `None`.
+		:type timeout: float.
+		:raises: :class:`CancelledError`, :class:`TimeoutError`, or the exception
+		  raised by the operation.
+		"""
+		if not self._done.wait(timeout):
+			raise TimeoutError("the operation did not finish in " + str(timeout) + " s")
+		if self._cancelled:
+			raise CancelledError("the operation was cancelled")
+		if self._error is not None:
+			raise self._error
+		return self._result
+
+	def addDoneCallback(self, callback):
+		"""Calls `callback(future)` when the operation finishes, or at once if it has.
+		The callback runs in the thread finishing the operation."""
+		with self._lock:
+			if not self._done.is_set():
+				self._callbacks.append(callback)
+				return
+		callback(self)
+
+	def _start(self, interrupt):
+		"""Helper. Marks the operation as running. Returns `False` if it was cancelled."""
+		with self._lock:
+			if self._cancelled:
+				return False
+			self._interrupt = interrupt
+			return True
+
+	def _finish(self, result = None, error = None):
+		"""Helper. Stores the outcome and notifies the waiting threads and callbacks."""
+		with self._lock:
+			self._interrupt = None
+			self._result    = result
+			self._error     = error
+			self._done.set()
+			callbacks, self._callbacks = self._callbacks, []
+		for callback in callbacks:
+			try:
+				callback(self)
+			except Exception as e:
+				logger.error("Callback failed: " + str(e))
+
+
+#marks the end of the rows of a stream
+_END = object()
+
+class RowStream(object):
+	"""Iterator over the rows of a query running in a reader thread. The rows arrive
+	in batches while the query runs, and at most :data:`STREAM_BUFFER` batches wait
+	to be consumed.
+
+	:attribute future: Finishes with the number of rows when all were read.
+	"""
+	def __init__(self):
+		self.future  = Future()
+		self._queue  = Queue.Queue(STREAM_BUFFER)
+		self._header = None
+		self._ready  = threading.Event()
+		self._batch  = iter([])
+
+	def header(self, timeout = None):
+		"""Waits for the query to start and returns its column headers.
+
+		:raises: :class:`TimeoutError`, or as :func:`Future.result` if the query
+		  failed before returning rows.
+		"""
+		if not self._ready.wait(timeout):
+			raise TimeoutError("the query did not start in " + str(timeout) + " s")
+		if self._header is None:
+			self.future.result()
+		return self._header
+
+	def cancel(self):
+		"""Stops the query. The rows not consumed yet are discarded."""
+		return self.future.cancel()
+
+	def __iter__(self):
+		return self
+
+	def next(self):
+		if self.future.cancelled():
+			raise CancelledError("the query was cancelled")
+		for row in self._batch:
+			return row
+		while True:
+			if self.future.cancelled():
+				raise CancelledError("the query was cancelled")
+			try:
+				batch = self._queue.get(timeout = POLL)
+			except Queue.Empty:
+				if self.future.done(): # failed, the error is raised below
+					self.future.result()
+					raise StopIteration
+				continue
+			if batch is _END:
+				self._queue.put(_END)
+				self.future.result()
+				raise StopIteration
+			self._batch = iter(batch)
+			for row in self._batch:
+				return row
+
+	def _fill(self, connection, method, args, kwargs):
+		"""Helper. Runs in the reader thread: executes the query and queues its rows.
+
+		:returns: int -- the number of rows.
+		"""
+		header, rows = getattr(connection, method)(*args, **kwargs)
+		self._header = header
+		self._ready.set()
+		count = 0
+		batch = []
+		try:
+			for row in rows:
+				batch.append(row)
+				if len(batch) == dbapi.BATCH:
+					count += len(batch)
+					if not self._put(batch):
+						return count
+					batch = []
+			count += len(batch)
+			if batch and not self._put(batch):
+				return count
+			self._put(_END)
+			return count
+		finally:
+			if hasattr(rows, 'close'):
+				rows.close()
+
+	def _put(self, item):
+		"""Helper. Queues an item, waiting for room. Returns `False` if cancelled."""
+		while not self.future.cancelled():
+			try:
+				self._queue.put(item, timeout = POLL)
+				return True
+			except Queue.Full:
+				continue
+		return False
+
+	def _end(self, future):
+		"""Helper. Unblocks the callers of :func:`header` when the query fails."""
+		self._ready.set()
+
+
+class _Executor(object):
+	"""Helper. A fixed number of threads, each with its own connection, executing
+	submitted operations in order.
+
+	:parameter factory: Creates the connection of a thread, in that thread.
+	:parameter threads: Number of threads.
+	:parameter name: Prefix of the thread names.
+	"""
+	def __init__(self, factory, threads, name):
+		self._tasks   = Queue.Queue()
+		self._threads = []
+		for i in range(threads):
+			thread = threading.Thread(target = self._work, args = (factory,),
+			                          name = name + '-' + str(i))
+			thread.daemon = True
+			thread.start()
+			self._threads.append(thread)
+
+	def submit(self, operation, future = None):
+		"""Queues `operation(connection)`.
+
+		:returns: :class:`Future`
+		"""
+		future = future or Future()
+		self._tasks.put((future, operation))
+		return future
+
+	def shutdown(self):
+		"""Lets the threads finish the queued operations, then stops them."""
+		for thread in self._threads:
+			self._tasks.put(None)
+		for thread in self._threads:
+			thread.join()
+
+	def _work(self, factory):
+		try:
+			connection = factory()
+		except Exception as e:
+			logger.error("Cannot open the database: " + str(e))
+			connection, error = None, e
+		while True:
+			task = self._tasks.get()
+			if task is None:
+				break
+			future, operation = task
+			if connection is None:
+				future._finish(error = error)
+				continue
+			if not future._start(lambda: connection.connection.interrupt()):
+				continue
+			try:
+				future._finish(operation(connection))
+			except Exception as e:
+				future._finish(error = e)
+		if connection is not None:
+			connection.close()
+
+
+class AsyncConnection(object):
+	"""Non-blocking counterpart of :class:`phdb.core.sqlite3cmd.Connection`. The
+	`qGet...` methods return a :class:`Future` with the same result as the blocking
+	method, the `qIter...` methods a :class:`RowStream`.
+
+	:parameter db: Path to the database.
+	:type db: str.
+	:parameter readers: Number of reader threads, i.e. queries running at once.
+	:type readers: int.
+	:parameter profile: Performance profile of the connections (see
+	  :class:`phdb.core.sqlite3cmd.Connection`).
+	:type profile: str.
+	"""
+	def __init__(self, db, readers = READERS, profile = None):
+		self.db = db
+		factory = lambda: dbapi.Connection(db, profile)
+		self._readers = _Executor(factory, readers, 'phdb-reader')
+		self._writer  = _Executor(factory, 1, 'phdb-writer')
+
+	def close(self):
+		"""Finishes the submitted operations and closes all connections."""
+		self._readers.shutdown()
+		self._writer.shutdown()
+
+	def _read(self, method, *args, **kwargs):
+		"""Helper. Submits a query to the readers."""
+		return self._readers.submit(lambda c: getattr(c, method)(*args, **kwargs))
+
+	def _write(self, method, *args, **kwargs):
+		"""Helper. Submits a change to the writer."""
+		return self._writer.submit(lambda c: getattr(c, method)(*args, **kwargs))
+
+	def _iterate(self, method, *args, **kwargs):
+		"""Helper. Submits a streaming query to the readers."""
+		stream = RowStream()
+		stream.future.addDoneCallback(stream._end)
+		self._readers.submit(lambda c: stream._fill(c, method, args, kwargs), stream.future)
+		return stream
+
+	def qGetEntries(self, *args, **kwargs):
+		"""See :func:`phdb.core.sqlite3cmd.Connection.qGetEntries`."""
+		return self._read('qGetEntries', *args, **kwargs)
+
+	def qGetSources(self, *args, **kwargs):
+		"""See :func:`phdb.core.sqlite3cmd.Connection.qGetSources`."""
+		return self._read('qGetSources', *args, **kwargs)
+
+	def qGetCrefs(self, *args, **kwargs):
+		"""See :func:`phdb.core.sqlite3cmd.Connection.qGetCrefs`."""
+		return self._read('qGetCrefs', *args, **kwargs)
+
+	def qGetCrefClosure(self, *args, **kwargs):
+		"""See :func:`phdb.core.sqlite3cmd.Connection.qGetCrefClosure`."""
+		return self._read('qGetCrefClosure', *args, **kwargs)
+
+	def qGetCustom(self, q):
+		"""See :func:`phdb.core.sqlite3cmd.Connection.qGetCustom`. Statements which
+		are not queries go to the writer."""
+		if _isQuery(q):
+			return self._read('qGetCustom', q)
+		return self._write('qGetCustom', q)
+
+	def qIterEntries(self, *args, **kwargs):
+		"""See :func:`phdb.core.sqlite3cmd.Connection.qIterEntries`."""
+		return self._iterate('qIterEntries', *args, **kwargs)
+
+	def qIterSources(self, *args, **kwargs):
+		"""See :func:`phdb.core.sqlite3cmd.Connection.qIterSources`."""
+		return self._iterate('qIterSources', *args, **kwargs)
+
+	def qIterCrefs(self, *args, **kwargs):
+		"""See :func:`phdb.core.sqlite3cmd.Connection.qIterCrefs`."""
+		return self._iterate('qIterCrefs', *args, **kwargs)
+
+	def qIterCustom(self, q):
+		"""See :func:`phdb.core.sqlite3cmd.Connection.qIterCustom`. Only for queries."""
+		return self._iterate('qIterCustom', q)
+
+	def insert(self, *args):
+		"""See :func:`phdb.core.sqlite3cmd.Connection.insert`."""
+		return self._write('insert', *args)
+
+	def insertOrIgnore(self, *args):
+		"""See :func:`phdb.core.sqlite3cmd.Connection.insertOrIgnore`."""
+		return self._write('insertOrIgnore', *args)
+
+	def insertOrReplace(self, *args):
+		"""See :func:`phdb.core.sqlite3cmd.Connection.insertOrReplace`."""
+		return self._write('insertOrReplace', *args)
+
+	def insertUnique(self, *args):
+		"""See :func:`phdb.core.sqlite3cmd.Connection.insertUnique`."""
+		return self._write('insertUnique', *args)
+
+	def commit(self):
+		"""Commits the changes submitted so far."""
+		return self._write('commit')
+
+	def rollback(self):
+		"""Discards the changes submitted since the last commit."""
+		return self._write('rollback')
+
+
+def _isQuery(q):
+	"""Helper. Checks if a statement only reads the database."""
+	words = q.split(None, 1)
+	return bool(words) and words[0].upper() in ['SELECT', 'WITH', 'EXPLAIN']
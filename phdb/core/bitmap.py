@@ -0,0 +1,111 @@
+"""
+.. module:: phdb.core.bitmap
+   :platform: Unix
+   :synopsis: In-memory bitmap index over the tag associations of a database.
+
+Loads `Tags__Entries` once into one bitset per tag and evaluates filter expression
+trees (see :mod:`phdb.core.filtergrammar`) with bitwise operations. The bitsets are
+plain Python integers, where bit *n* is set if the entry with `Id` *n* carries the
+tag. An index is rebuilt only when `PRAGMA data_version` reports that the database
+was changed by another connection.
+
+.. moduleauthor:: George Ungureanu <ugeorge@kth.se>
+
+"""
+
+import os
+import logging
+import binascii
+
+from versioned import VersionedCache
+
+logger = logging.getLogger('')
+
+class TagBitmapIndex(VersionedCache):
+	"""Bitmap index of the tags in a database. Holds its own connection, used only
+	for loading the associations and for polling the data version.
+
+	:parameter db: Path to the database.
+	:type db: str.
+	"""
+	def __init__(self, db):
+		VersionedCache.__init__(self, db)
+		self.tags     = {}
+		self.universe = 0
+
+	def _load(self):
+		ids = {}
+		for entry, tag in self._con.execute(_linksQuery(self._con)):
+			ids.setdefault(tag, []).append(int(entry))
+		self.tags = dict((tag, _toBitset(lst)) for tag, lst in ids.iteritems())
+		self.universe = _toBitset([x[0] for x in self._con.execute("SELECT Id FROM Entries")])
+		logger.debug("Loaded bitmap index with " + str(len(self.tags)) + " tags")
+
+	def evaluate(self, op, l, r = None):
+		"""Evaluates a filter expression tree.
+
+		:returns: long -- the bitset of the matching entries.
+		"""
+		if op == 'TAG':
+			return self.tags.get(l, 0)
+		elif op == 'WILDB':
+			return reduce(lambda x, y: x | y,
+				[b for t, b in self.tags.iteritems() if t.endswith(l)], 0)
+		elif op == 'WILDA':
+			return reduce(lambda x, y: x | y,
+				[b for t, b in self.tags.iteritems() if t.startswith(l)], 0)
+		elif op == '/':
+			return self.universe & ~self.evaluate(*l)
+		elif op == '()':
+			return self.evaluate(*l)
+		elif op == '&':
+			return self.evaluate(*l) & self.evaluate(*r)
+		elif op == '|':
+			return self.evaluate(*l) | self.evaluate(*r)
+
+	def match(self, filterTree):
+		"""Returns the ids of the entries matching a filter expression tree.
+
+		:parameter filterTree: As returned by :func:`phdb.core.filtergrammar.getExpTree`
+		:returns: [int,] -- sorted entry ids.
+		"""
+		return _fromBitset(self.evaluate(*filterTree))
+
+
+_indexes = {}
+
+def getIndex(db):
+	"""Returns the (up to date) bitmap index of a database. Indexes are kept for
+	the lifetime of the program, so repeated queries reuse them.
+
+	:parameter db: Path to the database.
+	:type db: str.
+	:returns: :class:`TagBitmapIndex`
+	"""
+	path = os.path.abspath(db)
+	if not path in _indexes:
+		_indexes[path] = TagBitmapIndex(path)
+	_indexes[path].refresh()
+	return _indexes[path]
+
+def _linksQuery(con):
+	"""Helper. Reads the (entry, tag) pairs, in either layout of the tag tables (see
+	:data:`phdb.core.sqlite3cmd.TAG_TABLES`)."""
+	columns = [x[1] for x in con.execute("PRAGMA table_info(Tags__Entries)")]
+	if 'TagId' in columns:
+		return "SELECT te.Entry, t.Tag FROM Tags__Entries AS te JOIN Tags AS t ON t.Id = te.TagId"
+	return "SELECT Entry, Tag FROM Tags__Entries"
+
+def _toBitset(ids):
+	"""Helper. Builds a bitset from a list of non-negative integers in linear time."""
+	if not ids:
+		return 0
+	buf = bytearray(max(ids) / 8 + 1)
+	for i in ids:
+		buf[i >> 3] |= 1 << (i & 7)
+	buf.reverse()
+	return long(binascii.hexlify(buf), 16)
+
+def _fromBitset(bits):
+	"""Helper. Lists the positions of the set bits, in increasing order."""
+	return [i for i, b in enumerate(bin(bits)[:1:-1]) if b == '1']
@@ -1,8 +1,11 @@
 import os
 import logging
+import threading
 import ply.lex  as lex
 import ply.yacc as yacc
 
+import phdb.tools.utils as utils
+
 try:
 	confPath = os.path.join(os.getenv('PHDB_CFG_PATH'), "logger.conf")
 	logging.config.fileConfig(confPath)
@@ -24,8 +27,6 @@ def t_error(t):
     log.warn ("Ignoring illegal character " + str(t.value[0]))
     t.lexer.skip(1)
 
-lex.lex() # Build the lexer
-
 def p_exp_or(p):
 	'''expr : term OR term'''
 	p[0] = ('|',p[1], p[3])
@@ -70,10 +71,38 @@ def p_wildtag_wilda(p):
 def p_error(t): 
 	raise NameError("Syntax error at '%s'" % t.value)
 
-yacc.yacc() 
 
+# The lexer and parser are built on first use, from the tables shipped in lextab.py
+# and parsetab.py. If the grammar changes, regenerate the tables with:
+#   lex.lex(module=filtergrammar, optimize=1, outputdir='phdb/core')
+#   yacc.yacc(module=filtergrammar, optimize=1, debug=False, outputdir='phdb/core')
+_lexer  = None
+_parser = None
+_lock   = threading.Lock()
+_trees  = utils.LRUCache(256)
+
+def _build():
+	"""Helper. Builds the lexer and the parser without writing any files."""
+	global _lexer, _parser
+	_lexer  = lex.lex(optimize=1, lextab='phdb.core.lextab')
+	_parser = yacc.yacc(optimize=1, write_tables=False, debug=False,
+						tabmodule='phdb.core.parsetab')
 
 def getExpTree(filtExp):
-	return yacc.parse(filtExp)
+	"""Parses a filter expression. Trees are immutable and the most recently used
+	ones are cached, so repeated expressions skip parsing.
+
+	:parameter filtExp: Filter expression.
+	:type filtExp: str.
+	:returns: (str, ...) -- the expression tree.
+	"""
+	tree = _trees.get(filtExp)
+	if tree is None:
+		with _lock:
+			if _parser is None:
+				_build()
+			tree = _parser.parse(filtExp, lexer=_lexer)
+		_trees.put(filtExp, tree)
+	return tree
 
 
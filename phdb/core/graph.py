@@ -0,0 +1,212 @@
+"""
+.. module:: phdb.core.graph
+   :platform: Unix
+   :synopsis: In-memory citation graph over the cross-references of a database.
+
+Loads `Xrefs` (`RefBy` cites `RefTo`) once into compact adjacency arrays in CSR
+(compressed sparse row) form: the BibRefs are interned as consecutive integers,
+the neighbours of node *v* are `index[pointer[v]:pointer[v+1]]`, and both arrays
+are :mod:`array` arrays of machine integers. The graph is kept in both directions
+(cites and cited by). The graph and the results computed on it are rebuilt only
+when `PRAGMA data_version` reports that the database was changed.
+
+.. moduleauthor:: George Ungureanu <ugeorge@kth.se>
+
+"""
+
+import os
+import logging
+import collections
+from array import array
+
+from versioned import VersionedCache
+
+logger = logging.getLogger('')
+
+#directions in which the edges can be followed
+DIRECTIONS = ['out', 'in', 'both']
+
+class CitationGraph(VersionedCache):
+	"""Citation graph of a database. Holds its own connection, used only for loading
+	the cross-references and for polling the data version.
+
+	:parameter db: Path to the database.
+	:type db: str.
+	"""
+	def __init__(self, db):
+		VersionedCache.__init__(self, db)
+		self.names    = []
+		self.ids      = {}
+		self._out     = (array('i', [0]), array('i'))
+		self._in      = (array('i', [0]), array('i'))
+		self._results = {}
+
+	def _load(self):
+		edges = self._con.execute("SELECT RefBy, RefTo FROM Xrefs").fetchall()
+		names = set(x[0] for x in self._con.execute("SELECT BibRef FROM Source"))
+		for refBy, refTo in edges:
+			names.add(refBy)
+			names.add(refTo)
+		self.names = sorted(names)
+		self.ids   = dict((name, i) for i, name in enumerate(self.names))
+		pairs = [(self.ids[refBy], self.ids[refTo]) for refBy, refTo in edges]
+		self._out = _toCsr(len(self.names), pairs)
+		self._in  = _toCsr(len(self.names), [(b, a) for a, b in pairs])
+		self._results = {}
+		logger.debug("Loaded citation graph with " + str(len(self.names)) + " nodes and "
+			+ str(len(pairs)) + " edges")
+
+	def edges(self):
+		"""
+		:returns: int -- the number of citations.
+		"""
+		return len(self._out[1])
+
+	def _adjacent(self, node, direction):
+		"""Helper. The nodes adjacent to a node in the given direction."""
+		if direction == 'both':
+			return self._adjacent(node, 'out') + self._adjacent(node, 'in')
+		pointer, index = self._out if direction == 'out' else self._in
+		return index[pointer[node]:pointer[node + 1]]
+
+	def _cached(self, key, compute):
+		"""Helper. Memoizes results until the graph is reloaded."""
+		if not key in self._results:
+			self._results[key] = compute()
+		return self._results[key]
+
+	def neighbours(self, bibref, hops = 1, direction = 'out'):
+		"""Returns the sources within a number of citations from a source.
+
+		:parameter bibref: The source.
+		:type bibref: str.
+		:parameter hops: The maximum number of citations followed.
+		:type hops: int.
+		:parameter direction: `out` follows the cited sources, `in` the citing sources
+		  and `both` follows both.
+		:type direction: str.
+		:returns: [(str,int),] -- the sources and their distance, closest first.
+		:raises: KeyError if the source is not in the graph.
+		"""
+		start = self.ids[bibref]
+		def compute():
+			distance = {start : 0}
+			frontier = [start]
+			for hop in range(1, hops + 1):
+				reached = []
+				for node in frontier:
+					for other in self._adjacent(node, direction):
+						if not other in distance:
+							distance[other] = hop
+							reached.append(other)
+				frontier = reached
+			del distance[start]
+			return sorted([(self.names[n], d) for n, d in distance.iteritems()],
+				key = lambda x: (x[1], x[0]))
+		return self._cached(('neighbours', start, hops, direction), compute)
+
+	def degrees(self, direction = 'in'):
+		"""Ranks the sources by the number of citations they receive (`in`) or make
+		(`out`).
+
+		:returns: [(str,int),] -- the sources and their degree, highest first.
+		"""
+		pointer = (self._out if direction == 'out' else self._in)[0]
+		def compute():
+			ranks = [(self.names[n], pointer[n + 1] - pointer[n])
+				for n in range(len(self.names))]
+			return sorted(ranks, key = lambda x: (-x[1], x[0]))
+		return self._cached(('degrees', direction), compute)
+
+	def pageRank(self, damping = 0.85, iterations = 100, tolerance = 1e-10):
+		"""Ranks the sources by PageRank, with the rank of sources citing nothing
+		spread evenly over all sources.
+
+		:parameter damping: The probability of following a citation.
+		:type damping: float.
+		:parameter iterations: The maximum number of power iterations.
+		:type iterations: int.
+		:parameter tolerance: Stops when the ranks change less than this (L1 norm).
+		:type tolerance: float.
+		:returns: [(str,float),] -- the sources and their rank, highest first.
+		"""
+		def compute():
+			n = len(self.names)
+			if not n:
+				return []
+			pointer, index = self._out
+			rank = [1.0 / n] * n
+			for iteration in range(iterations):
+				dangling = sum(rank[v] for v in range(n) if pointer[v] == pointer[v + 1])
+				base = (1.0 - damping) / n + damping * dangling / n
+				new  = [base] * n
+				for v in range(n):
+					start, end = pointer[v], pointer[v + 1]
+					if start == end:
+						continue
+					share = damping * rank[v] / (end - start)
+					for w in index[start:end]:
+						new[w] += share
+				change = sum(abs(a - b) for a, b in zip(new, rank))
+				rank = new
+				if change < tolerance:
+					break
+			return sorted([(self.names[v], rank[v]) for v in range(n)],
+				key = lambda x: (-x[1], x[0]))
+		return self._cached(('pagerank', damping, iterations, tolerance), compute)
+
+	def components(self):
+		"""Groups the sources in connected components, ignoring the direction of the
+		citations.
+
+		:returns: [[str,],] -- the components, largest first.
+		"""
+		def compute():
+			parent = range(len(self.names))
+			def find(v):
+				while parent[v] != v:
+					parent[v] = parent[parent[v]]
+					v = parent[v]
+				return v
+			pointer, index = self._out
+			for v in range(len(self.names)):
+				for w in index[pointer[v]:pointer[v + 1]]:
+					a, b = find(v), find(w)
+					if a != b:
+						parent[max(a, b)] = min(a, b)
+			groups = collections.defaultdict(list)
+			for v in range(len(self.names)):
+				groups[find(v)].append(self.names[v])
+			return sorted(groups.values(), key = lambda x: (-len(x), x[0]))
+		return self._cached(('components',), compute)
+
+
+_graphs = {}
+
+def getGraph(db):
+	"""Returns the (up to date) citation graph of a database. Graphs are kept for
+	the lifetime of the program, so repeated queries reuse them.
+
+	:parameter db: Path to the database.
+	:type db: str.
+	:returns: :class:`CitationGraph`
+	"""
+	path = os.path.abspath(db)
+	if not path in _graphs:
+		_graphs[path] = CitationGraph(path)
+	_graphs[path].refresh()
+	return _graphs[path]
+
+def _toCsr(size, pairs):
+	"""Helper. Builds the CSR arrays of `size` nodes from (from, to) pairs."""
+	pointer = array('i', [0]) * (size + 1)
+	for a, b in pairs:
+		pointer[a + 1] += 1
+	for v in range(size):
+		pointer[v + 1] += pointer[v]
+	index = array('i', [0]) * len(pairs)
+	fill  = pointer[:-1]
+	for a, b in pairs:
+		index[fill[a]] = b
+		fill[a] += 1
+	return pointer, index
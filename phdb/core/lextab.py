@@ -0,0 +1,10 @@
+# lextab.py. This file automatically created by PLY (version 3.11). Don't edit!
+_tabversion   = '3.10'
+_lextokens    = set(('AND', 'LPAR', 'NOT', 'OR', 'RPAR', 'TAG', 'WILD'))
+_lexreflags   = 64
+_lexliterals  = ''
+_lexstateinfo = {'INITIAL': 'inclusive'}
+_lexstatere   = {'INITIAL': [('(?P<t_TAG>[a-zA-Z_][a-zA-Z0-9_-]*)|(?P<t_RPAR>\\))|(?P<t_WILD>\\*)|(?P<t_LPAR>\\()|(?P<t_OR>\\|)|(?P<t_NOT>/)|(?P<t_AND>&)', [None, (None, 'TAG'), (None, 'RPAR'), (None, 'WILD'), (None, 'LPAR'), (None, 'OR'), (None, 'NOT'), (None, 'AND')])]}
+_lexstateignore = {'INITIAL': ' \t\x0b\r'}
+_lexstateerrorf = {'INITIAL': 't_error'}
+_lexstateeoff = {}
@@ -4,3 +4,4 @@ TAGGED = 'Tagged_as'
 BIBREFSOURCE = 'Source'
 REFERS = 'Refers_To'
 TAGS = 'Tags'
+DATABASE = 'Db'
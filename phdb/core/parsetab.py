@@ -0,0 +1,40 @@
+
+# parsetab.py
+# This file is automatically generated. Do not edit.
+# pylint: disable=W,C,R
+_tabversion = '3.10'
+
+_lr_method = 'LALR'
+
+_lr_signature = 'AND LPAR NOT OR RPAR TAG WILDexpr : term OR termexpr : termterm : factor AND factorterm : factorfactor : wildtagfactor : NOT factorfactor : LPAR expr RPARwildtag : TAGwildtag : WILD TAGwildtag : TAG WILD'
+    
+_lr_action_items = {'AND':([3,6,7,11,12,14,15,],[-5,-8,13,-9,-10,-6,-7,]),'LPAR':([0,1,8,10,13,],[1,1,1,1,1,]),'RPAR':([2,3,6,7,9,11,12,14,15,16,17,],[-2,-5,-8,-4,15,-9,-10,-6,-7,-1,-3,]),'WILD':([0,1,6,8,10,13,],[5,5,12,5,5,5,]),'TAG':([0,1,5,8,10,13,],[6,6,11,6,6,6,]),'NOT':([0,1,8,10,13,],[8,8,8,8,8,]),'OR':([2,3,6,7,11,12,14,15,17,],[10,-5,-8,-4,-9,-10,-6,-7,-3,]),'$end':([2,3,4,6,7,11,12,14,15,16,17,],[-2,-5,0,-8,-4,-9,-10,-6,-7,-1,-3,]),}
+
+_lr_action = {}
+for _k, _v in _lr_action_items.items():
+   for _x,_y in zip(_v[0],_v[1]):
+      if not _x in _lr_action:  _lr_action[_x] = {}
+      _lr_action[_x][_k] = _y
+del _lr_action_items
+
+_lr_goto_items = {'expr':([0,1,],[4,9,]),'term':([0,1,10,],[2,2,16,]),'wildtag':([0,1,8,10,13,],[3,3,3,3,3,]),'factor':([0,1,8,10,13,],[7,7,14,7,17,]),}
+
+_lr_goto = {}
+for _k, _v in _lr_goto_items.items():
+   for _x, _y in zip(_v[0], _v[1]):
+       if not _x in _lr_goto: _lr_goto[_x] = {}
+       _lr_goto[_x][_k] = _y
+del _lr_goto_items
+_lr_productions = [
+  ("S' -> expr","S'",1,None,None,None),
+  ('expr -> term OR term','expr',3,'p_exp_or','filtergrammar.py',31),
+  ('expr -> term','expr',1,'p_exp_term','filtergrammar.py',35),
+  ('term -> factor AND factor','term',3,'p_term_and','filtergrammar.py',39),
+  ('term -> factor','term',1,'p_term_factor','filtergrammar.py',43),
+  ('factor -> wildtag','factor',1,'p_factor_tag','filtergrammar.py',47),
+  ('factor -> NOT factor','factor',2,'p_not','filtergrammar.py',51),
+  ('factor -> LPAR expr RPAR','factor',3,'p_par','filtergrammar.py',55),
+  ('wildtag -> TAG','wildtag',1,'p_wildtag_tag','filtergrammar.py',59),
+  ('wildtag -> WILD TAG','wildtag',2,'p_wildtag_wildb','filtergrammar.py',63),
+  ('wildtag -> TAG WILD','wildtag',2,'p_wildtag_wilda','filtergrammar.py',67),
+]
@@ -0,0 +1,95 @@
+"""
+.. module:: phdb.core.querybuilder
+   :platform: Unix
+   :synopsis: Builds SQL statements with a stable text and `?` placeholders.
+
+The :mod:`sqlite3` module caches the compiled statements of a connection by their
+text, so a statement is compiled only once if its text does not change with the
+values it uses. All values are therefore passed as parameters. Lists of values
+(e.g. for `IN`) are either padded to a few fixed sizes, or passed as a single JSON
+array and read with `json_each`.
+
+.. moduleauthor:: George Ungureanu <ugeorge@kth.se>
+
+"""
+
+import json
+import sqlite3 as lite
+
+#lists longer than this are passed as one JSON array, if SQLite supports it
+JSON_LIST = 64
+
+#without JSON support, longer lists are split in chunks of this size, which is
+#below the smallest SQLITE_MAX_VARIABLE_NUMBER (999)
+CHUNK = 512
+
+class Query():
+	"""Accumulates the text and the parameters of a statement, in order.
+
+	:parameter text: The beginning of the statement.
+	:type text: str.
+	"""
+	def __init__(self, text = ''):
+		self.parts  = [text]
+		self.params = []
+
+	def add(self, text, params = ()):
+		"""Appends a piece of the statement and its parameters.
+
+		:returns: :class:`Query` -- itself, so calls can be chained.
+		"""
+		self.parts.append(text)
+		self.params.extend(params)
+		return self
+
+	def build(self):
+		"""
+		:returns: str, (str,) -- the SQL text and its parameters.
+		"""
+		return ''.join(self.parts), tuple(self.params)
+
+def inList(column, values):
+	"""Builds the condition `column IN (values)`. Its text depends only on the size
+	bucket of `values`: lists are padded with their last value up to the next power
+	of two, and lists longer than :data:`JSON_LIST` are passed as a JSON array.
+
+	:parameter column: The column (or expression) tested.
+	:type column: str.
+	:parameter values: The values.
+	:type values: [str,]
+	:returns: str, (str,) -- the SQL condition and its parameters.
+	"""
+	values = list(values)
+	if not values:
+		return "0", ()
+	if len(values) > JSON_LIST and hasJson():
+		return column + " IN (SELECT value FROM json_each(?))", (json.dumps(values),)
+	chunks = [values[i:i + CHUNK] for i in range(0, len(values), CHUNK)]
+	text   = []
+	params = []
+	for chunk in chunks:
+		size = bucket(len(chunk))
+		text.append(column + " IN (" + ','.join('?' * size) + ")")
+		params.extend(chunk + chunk[-1:] * (size - len(chunk)))
+	if len(text) == 1:
+		return text[0], tuple(params)
+	return "(" + " OR ".join(text) + ")", tuple(params)
+
+def bucket(size):
+	"""Returns the smallest power of two not smaller than `size`."""
+	n = 1
+	while n < size:
+		n *= 2
+	return n
+
+_json = []
+
+def hasJson():
+	"""Checks (once) if the SQLite library provides the JSON1 functions."""
+	if not _json:
+		try:
+			lite.connect(':memory:').execute("SELECT value FROM json_each('[1]')")
+			_json.append(True)
+		except lite.OperationalError:
+			_json.append(False)
+	return _json[0]
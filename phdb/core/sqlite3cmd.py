@@ -8,15 +8,26 @@
 """
 
 import os
+import math
+import json
+import array
 import re
 import logging
-import difflib
+import itertools
+import collections
+import time
 import sys
+import threading
 import sqlite3 as lite
 
 from names import *
 from filtergrammar import getExpTree
+import bitmap
+import querybuilder
+from querybuilder import Query, inList
+import typos
 import phdb.tools.utils as utils
+import phdb.tools.settings as settings
 
 try:
 	confPath = os.path.join(os.getenv('PHDB_CFG_PATH'), "logger.conf")
@@ -49,7 +60,7 @@ def isDatabase(filename):
 		    return False
 
 
-def createDb(name, loc, resources):
+def createDb(name, loc, resources, tagIds = False):
 	"""Creates an SQLite3 :ref:idb from a chosen frontend.
 
 	:parameter name: The name of the new database.
@@ -63,6 +74,9 @@ def createDb(name, loc, resources):
 	:type ftype: str.
 	:parameter inp: The location of the frontend container folder.
 	:type inp: str.
+	:parameter tagIds: If `True`, the tag tables have the integer-keyed layout
+	  (see :data:`TAG_TABLES`).
+	:type tagIds: bool.
 	"""    
 	connection = lite.connect(os.path.join(loc,name+'.db'))
 	with connection:
@@ -73,12 +87,14 @@ def createDb(name, loc, resources):
 
 		#create database tables
 		cursor.execute("pragma foreign_keys=ON")
+		cursor.execute("DROP TABLE IF EXISTS EntriesFts")
 		cursor.execute("DROP TABLE IF EXISTS Xrefs")
 		cursor.execute("DROP TABLE IF EXISTS Source")
 		cursor.execute("DROP TABLE IF EXISTS Entries")
 		cursor.execute("DROP TABLE IF EXISTS Tags")
 		cursor.execute("DROP TABLE IF EXISTS Tags__Entries")
 		cursor.execute("DROP TABLE IF EXISTS Resources")
+		cursor.execute("DROP TABLE IF EXISTS Manifest")
 		cursor.execute("CREATE TABLE Source( \
 			BibRef TEXT UNIQUE NOT NULL PRIMARY KEY, \
 			Link TEXT, \
@@ -90,35 +106,267 @@ def createDb(name, loc, resources):
 			Info TEXT,  \
 			Label TEXT, \
 			Cites TEXT, \
-			Crefs TEXT)")
-		cursor.execute("CREATE TABLE Tags(\
-			Tag TEXT UNIQUE NOT NULL PRIMARY KEY)")
+			Crefs TEXT, \
+			" + TAGGED + " TEXT)")
+		cursor.execute(TAG_TABLES[tagIds][0])
 		cursor.execute("CREATE TABLE Xrefs(\
 			RefBy TEXT NOT NULL,\
 			RefTo TEXT NOT NULL,\
 			FOREIGN KEY(RefBy) REFERENCES Source(BibRef) ,\
 			FOREIGN KEY(RefTo) REFERENCES Source(BibRef), \
 			PRIMARY KEY (RefBy, RefTo))")
-		cursor.execute("CREATE TABLE Tags__Entries(\
-			Entry INT,\
-			Tag TEXT)")
+		cursor.execute(TAG_TABLES[tagIds][1])
 		cursor.execute("CREATE TABLE resources(Path TEXT)")
-		cursor.execute("INSERT INTO resources VALUES('" + resources + "')")
+		cursor.execute("INSERT INTO resources VALUES(?)", (resources,))
+		_upgradeSchema(cursor)
 	return
 
+#the tag tables, for each layout. Originally the associations repeat the tag text;
+#with integer tag ids (see Connection.migrateTagIds) they hold two integers only
+TAG_TABLES = {
+	False : ["CREATE TABLE Tags(\
+			Tag TEXT UNIQUE NOT NULL PRIMARY KEY)",
+	         "CREATE TABLE Tags__Entries(\
+			Entry INT,\
+			Tag TEXT)"],
+	True  : ["CREATE TABLE Tags(\
+			Id INTEGER PRIMARY KEY, \
+			Tag TEXT UNIQUE NOT NULL)",
+	         "CREATE TABLE Tags__Entries(\
+			Entry INTEGER NOT NULL, \
+			TagId INTEGER NOT NULL, \
+			PRIMARY KEY (Entry, TagId)) WITHOUT ROWID"],
+	}
+
+#the input files harvested into the database, with their size, modification time,
+#SHA-1 of the contents and the BibRef of the source they produced (NULL if none), so
+#that only the files which changed are harvested again
+MANIFEST_TABLE = "CREATE TABLE IF NOT EXISTS Manifest(\
+			Path TEXT PRIMARY KEY, \
+			Size INTEGER, \
+			Mtime REAL, \
+			Hash TEXT, \
+			BibRef TEXT)"
+
+#secondary indexes serving the joins and filters of the pre-defined queries
+INDEXES = [
+	"CREATE INDEX IF NOT EXISTS Entries_Source ON Entries(Source)",
+	"CREATE INDEX IF NOT EXISTS Entries_Label ON Entries(Label)",
+	]
+
+#indexes of the tag associations, for each layout. The primary key of the integer
+#layout already serves the lookups by entry
+TAG_INDEXES = {
+	False : ["CREATE INDEX IF NOT EXISTS TagsEntries_EntryTag ON Tags__Entries(Entry, Tag)",
+	         "CREATE INDEX IF NOT EXISTS TagsEntries_TagEntry ON Tags__Entries(Tag, Entry)"],
+	True  : ["CREATE INDEX IF NOT EXISTS TagsEntries_TagEntry ON Tags__Entries(TagId, Entry)"],
+	}
+
+#full-text index over the text columns of the entries, kept in sync by triggers.
+#The first module available in the SQLite library is used.
+FTS_MODULES = ['fts5', 'fts4']
+FTS_COLUMNS = ['Info', 'At', 'Label']
+
+FTS_TABLE = {
+	'fts5' : "CREATE VIRTUAL TABLE EntriesFts USING fts5(" + ', '.join(FTS_COLUMNS) \
+	         + ", content='Entries', content_rowid='Id')",
+	'fts4' : "CREATE VIRTUAL TABLE EntriesFts USING fts4(content='Entries', " \
+	         + ', '.join(FTS_COLUMNS) + ")",
+	}
+
+_ftsCols = ', '.join(FTS_COLUMNS)
+_ftsNew  = ', '.join(['new.' + c for c in FTS_COLUMNS])
+_ftsOld  = ', '.join(['old.' + c for c in FTS_COLUMNS])
+
+FTS_TRIGGERS = {
+	'fts5' : [
+		"CREATE TRIGGER IF NOT EXISTS EntriesFts_Insert AFTER INSERT ON Entries BEGIN \
+			INSERT INTO EntriesFts(rowid, " + _ftsCols + ") VALUES (new.Id, " + _ftsNew + "); END",
+		"CREATE TRIGGER IF NOT EXISTS EntriesFts_Delete AFTER DELETE ON Entries BEGIN \
+			INSERT INTO EntriesFts(EntriesFts, rowid, " + _ftsCols + ") \
+			VALUES ('delete', old.Id, " + _ftsOld + "); END",
+		"CREATE TRIGGER IF NOT EXISTS EntriesFts_Update AFTER UPDATE OF " + _ftsCols + " ON Entries BEGIN \
+			INSERT INTO EntriesFts(EntriesFts, rowid, " + _ftsCols + ") \
+			VALUES ('delete', old.Id, " + _ftsOld + "); \
+			INSERT INTO EntriesFts(rowid, " + _ftsCols + ") VALUES (new.Id, " + _ftsNew + "); END",
+		],
+	'fts4' : [
+		"CREATE TRIGGER IF NOT EXISTS EntriesFts_Insert AFTER INSERT ON Entries BEGIN \
+			INSERT INTO EntriesFts(docid, " + _ftsCols + ") VALUES (new.Id, " + _ftsNew + "); END",
+		"CREATE TRIGGER IF NOT EXISTS EntriesFts_Delete BEFORE DELETE ON Entries BEGIN \
+			DELETE FROM EntriesFts WHERE docid = old.Id; END",
+		"CREATE TRIGGER IF NOT EXISTS EntriesFts_UpdateOld BEFORE UPDATE OF " + _ftsCols + " ON Entries BEGIN \
+			DELETE FROM EntriesFts WHERE docid = old.Id; END",
+		"CREATE TRIGGER IF NOT EXISTS EntriesFts_UpdateNew AFTER UPDATE OF " + _ftsCols + " ON Entries BEGIN \
+			INSERT INTO EntriesFts(docid, " + _ftsCols + ") VALUES (new.Id, " + _ftsNew + "); END",
+		],
+	}
+
+#relevance expression for each module. Lower is better, as for the FTS5 `bm25`
+FTS_RANK = {
+	'fts5' : "bm25(EntriesFts)",
+	'fts4' : "bm25fts4(matchinfo(EntriesFts, 'pcnalx'))",
+	}
+
+#join condition between the tags (t) and their associations (te), for each layout
+TAG_KEY = {
+	False : "t.Tag = te.Tag",
+	True  : "t.Id = te.TagId",
+	}
+
+#the tags of an entry, as aggregated by the entries queries. Cached in the column
+#Entries.Tagged_as, which is kept up to date by triggers
+def _tagsOf(entry, tagIds = False):
+	return "(SELECT GROUP_CONCAT(Tag) FROM (SELECT DISTINCT t.Tag FROM Tags__Entries AS te \
+		JOIN Tags AS t ON " + TAG_KEY[tagIds] + " WHERE te.Entry = " + entry + " ORDER BY t.Tag))"
+
+def _tagCacheUpdate(tagIds = False):
+	return "UPDATE Entries SET " + TAGGED + " = " + _tagsOf("Entries.Id", tagIds)
+
+def _tagCacheTriggers(tagIds = False):
+	update = _tagCacheUpdate(tagIds)
+	link   = "TagId" if tagIds else "Tag"
+	key    = "Id" if tagIds else "Tag"
+	return [
+		"CREATE TRIGGER TagCache_LinkInsert AFTER INSERT ON Tags__Entries BEGIN " \
+			+ update + " WHERE Id = new.Entry; END",
+		"CREATE TRIGGER TagCache_LinkDelete AFTER DELETE ON Tags__Entries BEGIN " \
+			+ update + " WHERE Id = old.Entry; END",
+		"CREATE TRIGGER TagCache_LinkUpdate AFTER UPDATE ON Tags__Entries BEGIN " \
+			+ update + " WHERE Id IN (old.Entry, new.Entry); END",
+		"CREATE TRIGGER TagCache_TagInsert AFTER INSERT ON Tags BEGIN " \
+			+ update + " WHERE Id IN \
+			(SELECT Entry FROM Tags__Entries WHERE " + link + " = new." + key + "); END",
+		"CREATE TRIGGER TagCache_TagDelete AFTER DELETE ON Tags BEGIN " \
+			+ update + " WHERE Id IN \
+			(SELECT Entry FROM Tags__Entries WHERE " + link + " = old." + key + "); END",
+		"CREATE TRIGGER TagCache_TagUpdate AFTER UPDATE ON Tags BEGIN " \
+			+ update + " WHERE Id IN \
+			(SELECT Entry FROM Tags__Entries WHERE " + link + " IN (old." + key + ", new." \
+			+ key + ")); END",
+		]
+
+TAG_CACHE_UPDATE   = _tagCacheUpdate()
+TAG_CACHE_TRIGGERS = _tagCacheTriggers()
+
+#number of entries of each tag, for each layout
+TAG_COUNTS = {
+	False : "SELECT Tag, Count(*) FROM Tags__Entries GROUP BY Tag;",
+	True  : "SELECT t.Tag, Count(*) FROM Tags__Entries AS te \
+		JOIN Tags AS t ON t.Id = te.TagId GROUP BY t.Tag;",
+	}
+
+def _tagJoin(prefix, tagIds):
+	"""Helper. Joins the entries (e) of the pre-defined queries to their tags (t)."""
+	return "\tLEFT JOIN " + prefix + "Tags__Entries AS te ON te.Entry = e.Id \n"\
+		+ "\tLEFT JOIN " + prefix + "Tags AS t ON " + TAG_KEY[tagIds] + " \n"
+
+def _upgradeSchema(cursor):
+	"""Helper. Adds everything missing from an older :ref:idb schema. Safe to run
+	multiple times on the same database."""
+	cursor.execute(MANIFEST_TABLE)
+	for command in INDEXES + TAG_INDEXES[_hasTagIds(cursor)]:
+		cursor.execute(command)
+	_upgradeTagCache(cursor)
+	_upgradeFts(cursor)
+
+def _upgradeTagCache(cursor):
+	"""Helper. Adds the tag cache column and (re)creates its triggers. The column is
+	filled only when it is added, see :func:`Connection.rebuildTagCache`."""
+	tagIds = _hasTagIds(cursor)
+	if not _hasColumn(cursor, 'Entries', TAGGED):
+		cursor.execute("ALTER TABLE Entries ADD COLUMN " + TAGGED + " TEXT")
+		cursor.execute(_tagCacheUpdate(tagIds))
+		logger.info("Created the tag cache")
+	for command in _tagCacheTriggers(tagIds):
+		name = command.split()[2]
+		cursor.execute("DROP TRIGGER IF EXISTS " + name)
+		cursor.execute(command)
+
+def _hasColumn(cursor, table, column, schema = 'main'):
+	"""Helper. Checks if a table has a column. A query, unlike `PRAGMA table_info`,
+	which in Python 2 commits the pending transaction."""
+	cursor.execute("SELECT name FROM pragma_table_info(?, ?)", (table, schema))
+	return column in [x[0] for x in cursor.fetchall()]
+
+def _hasTagIds(cursor, schema = 'main'):
+	"""Helper. Checks if the tag tables have the integer-keyed layout."""
+	return _hasColumn(cursor, 'Tags__Entries', 'TagId', schema)
+
+def _upgradeFts(cursor):
+	"""Helper. Adds the full-text index and (re)creates its triggers."""
+	module = _ftsModule(cursor)
+	for trigger in _ftsTriggerNames():
+		cursor.execute("DROP TRIGGER IF EXISTS " + trigger)
+	if module is None:
+		for module in FTS_MODULES:
+			try:
+				cursor.execute(FTS_TABLE[module])
+			except lite.OperationalError:
+				logger.debug("SQLite was built without " + module)
+				continue
+			cursor.execute("INSERT INTO EntriesFts(EntriesFts) VALUES ('rebuild')")
+			logger.info("Created the " + module + " full-text index")
+			break
+		else:
+			logger.warning("SQLite has no full-text search module. 'search' is disabled.")
+			return
+	for command in FTS_TRIGGERS[module]:
+		cursor.execute(command)
+
+def _ftsTriggerNames():
+	"""Helper. Names of all the triggers maintaining the full-text index."""
+	return set(re.search(r'EXISTS (\w+)', t).group(1)
+			for triggers in FTS_TRIGGERS.values() for t in triggers)
+
+def _ftsModule(cursor, schema = 'main'):
+	"""Helper. Returns the module of the full-text index (`fts5` or `fts4`) or `None`
+	if the database has none."""
+	cursor.execute("SELECT sql FROM " + schema + ".sqlite_master WHERE name = 'EntriesFts'")
+	row = cursor.fetchone()
+	if row is None:
+		return None
+	return 'fts5' if 'fts5' in row[0].lower() else 'fts4'
+
+def _bm25(matchinfo, k1 = 1.2, b = 0.75):
+	"""Helper. Okapi BM25 score of an FTS4 row, computed from its `matchinfo`
+	with the format string `pcnalx`. Returns the negated score, so that the lower
+	values are the better matches, as for the FTS5 built-in `bm25`."""
+	info = array.array('I', str(matchinfo))
+	nPhrase, nCol, nRows = info[0], info[1], info[2]
+	avgLen  = info[3:3 + nCol]
+	rowLen  = info[3 + nCol:3 + 2 * nCol]
+	hits    = info[3 + 2 * nCol:]
+	score   = 0.0
+	for i in range(nPhrase):
+		for j in range(nCol):
+			tf, docs = hits[3 * (i * nCol + j)], hits[3 * (i * nCol + j) + 2]
+			if not tf:
+				continue
+			idf  = max(math.log((nRows - docs + 0.5) / (docs + 0.5)), 1e-6)
+			norm = 1 - b + b * float(rowLen[j]) / (avgLen[j] or 1)
+			score += idf * tf * (k1 + 1) / (tf + k1 * norm)
+	return -score
+
 class SqLite3FilterParser():
+	"""Compiles a filter expression tree into a `LIKE` condition on the `base` column.
+	The patterns are collected in `params`, in order of appearance."""
 	def __init__ (self, base):
-		self.base = base
+		self.base   = base
+		self.params = []
 
 	def parseNode (self, op, l, r = None):
 		if op == 'TAG':
-			return self.base + " LIKE '%" + l + "%' "
+			self.params.append('%' + l + '%')
+			return self.base + " LIKE ? "
 		elif op == 'WILDB':
-			#return self.base + "LIKE '%" + l + "' "
-			return self.base + " LIKE '%" + l + "%' "
+			#self.params.append('%' + l)
+			self.params.append('%' + l + '%')
+			return self.base + " LIKE ? "
 		elif op == 'WILDA':
-			#return self.base + "LIKE '" + l + "%' "
-			return self.base + " LIKE '%" + l + "%' "
+			#self.params.append(l + '%')
+			self.params.append('%' + l + '%')
+			return self.base + " LIKE ? "
 		elif op == '/':
 			return 'NOT ' + self.parseNode(*l);
 		elif op == '()':
@@ -127,6 +375,95 @@ class SqLite3FilterParser():
 			return self.parseNode(*l) + ' AND ' + self.parseNode(*r)
 		elif op == '|':
 			return self.parseNode(*l) + ' OR ' + self.parseNode(*r)
+
+class SqLite3SetFilterParser():
+	"""Compiles a filter expression tree into a query returning the matching entry
+	ids. Each tag becomes an exact, parameterized lookup in `Tags__Entries` (served
+	by its index) and the logical operations become `INTERSECT`, `UNION` and
+	`EXCEPT`. The parameters are collected in `params`, in order of appearance.
+	The tables are prefixed with `prefix`, e.g. the name of an attached database.
+	With `tagIds` the tags are first looked up in `Tags`, for the integer layout."""
+	def __init__ (self, prefix = '', tagIds = False):
+		self.prefix = prefix
+		self.tagIds = tagIds
+		self.params = []
+
+	def parseNode (self, op, l, r = None):
+		if op == 'TAG':
+			self.params.append(l)
+			return self._lookup("= ?")
+		elif op == 'WILDB':
+			self.params.append('*' + l)
+			return self._lookup("GLOB ?")
+		elif op == 'WILDA':
+			self.params.append(l + '*')
+			return self._lookup("GLOB ?")
+		elif op == '/':
+			return "SELECT Id FROM " + self.prefix + "Entries EXCEPT " + self._subquery(l)
+		elif op == '()':
+			return self.parseNode(*l)
+		elif op == '&':
+			return self._subquery(l) + " INTERSECT " + self._subquery(r)
+		elif op == '|':
+			return self._subquery(l) + " UNION " + self._subquery(r)
+
+	def _subquery (self, node):
+		"""Wraps a compound select, since SQLite does not accept parentheses
+		around its members."""
+		return "SELECT * FROM (" + self.parseNode(*node) + ")"
+
+	def _lookup (self, condition):
+		"""The entries with the tags matching a condition."""
+		if self.tagIds:
+			return "SELECT Entry FROM " + self.prefix + "Tags__Entries WHERE TagId IN " \
+				+ "(SELECT Id FROM " + self.prefix + "Tags WHERE Tag " + condition + ")"
+		return "SELECT Entry FROM " + self.prefix + "Tags__Entries WHERE Tag " + condition
+
+#number of rows fetched at once by the streaming queries
+BATCH = 256
+
+#maximum length of the chains of cross-references followed by the queries
+CREF_DEPTH = 16
+
+#number of statements kept in the query log of a connection
+QUERY_LOG = 64
+
+#maximum size in bytes of the query results kept by a connection, 0 disables the cache
+RESULT_CACHE = 16 * 1024 * 1024
+
+#filter engines accepted by the queries based on tag filter expressions
+FILTER_ENGINES = ['like', 'set', 'bitmap']
+
+_filters = utils.LRUCache(256)
+
+def compileFilter(filterExp, engine, base = TAGGED, prefix = '', tagIds = False):
+	"""Compiles a filter expression into an SQL condition. The most recently used
+	compilations are cached, so repeated filters skip both parsing and compiling.
+
+	:parameter filterExp: Filter expression.
+	:type filterExp: str.
+	:parameter engine: `set` for a query returning matching entry ids, otherwise a
+	  `LIKE` condition on the `base` column.
+	:type engine: str.
+	:parameter prefix: Prefix of the tables read by the `set` query, e.g. `alias.`
+	  for an attached database.
+	:type prefix: str.
+	:parameter tagIds: If the `set` query reads the integer-keyed tag tables.
+	:type tagIds: bool.
+	:returns: str, (str,) -- the SQL text and its parameters.
+	"""
+	key = (engine, base, prefix, tagIds, filterExp)
+	compiled = _filters.get(key)
+	if compiled is None:
+		filterTree = getExpTree(filterExp)
+		if engine == 'set':
+			parser   = SqLite3SetFilterParser(prefix, tagIds)
+			compiled = (parser.parseNode(*filterTree), tuple(parser.params))
+		else:
+			parser   = SqLite3FilterParser(base)
+			compiled = (parser.parseNode(*filterTree), tuple(parser.params))
+		_filters.put(key, compiled)
+	return compiled
 	
 
 class Connection():
@@ -135,17 +472,265 @@ class Connection():
 
 	:parameter db: Path to the database.
 	:type db: str.
+	:parameter profile: Performance profile from :data:`phdb.tools.settings.PROFILES`
+	  applied to the connection. Defaults to the one in the `PHDB_PROFILE` environment
+	  variable, if set.
+	:type profile: str.
+	:parameter snapshot: If `True`, the database is copied into memory and all
+	  statements run on this read-only copy, which is re-synchronized only by
+	  :func:`refresh`. Queries then never read the file, nor wait for its writers.
+	:type snapshot: bool.
+
+	Other databases may be attached with :func:`attach`. The sources and entries
+	queries then run on all of them at once.
 	"""
-	def __init__(self, db): 
-		self.connection = lite.connect(db)
+	def __init__(self, db, profile = None, snapshot = False): 
+		self.db = db
+		self.snapshot = snapshot
+		self.attached = []
+		self.queries = collections.deque(maxlen = QUERY_LOG)
+		self._plans  = utils.LRUCache(QUERY_LOG)
+		self.results = utils.SizedLRUCache(RESULT_CACHE)
+		self._connect()
+		self.applyProfile(profile or os.getenv("PHDB_PROFILE", settings.DEFAULT_PROFILE))
+
+	def _connect(self):
+		"""Helper. Opens the SQLite connection, either to the database file or to a
+		snapshot of it in memory, and resets everything derived from its contents."""
+		if self.snapshot:
+			start = time.time()
+			self.connection = lite.connect(':memory:')
+			_copyDb(self.db, self.connection)
+			self.connection.set_authorizer(_readOnly)
+			logger.debug("Copied " + self.db + " into memory in %.3f s" % (time.time() - start))
+		else:
+			self.connection = lite.connect(self.db)
+		self.connection.create_function('bm25fts4', 1, _bm25)
 		self.cursor = self.connection.cursor() 
+		self._plans.clear()
+		self.results.clear()
+		self._dirty  = False
+		self._tagCache = {}
+		self._tagIds   = {}
+		self._manifest = False
+		self._bitmap = None
+		self._resultsToken = None
+		self._tempChanges  = 0
+
+	def refresh(self):
+		"""Copies the database file again into the snapshot, so that the queries see
+		the changes made to it since. Has no effect on connections which are not
+		snapshots.
+
+		:returns: bool -- `True` if the snapshot was refreshed.
+		"""
+		if not self.snapshot:
+			return False
+		self.connection.close()
+		self._connect()
+		self.applyProfile(self.profile)
+		return True
 		
 	def __del__(self):
+		try:
+			self.connection.close()
+		except lite.ProgrammingError:
+			pass # collected in another thread than its own
+
+	def close(self):
+		"""Overloads :func:`sqlite3.Connection.close function`"""
 		self.connection.close()
 
 	def commit(self):
 		"""Overloads :func:`sqlite3.Connection.commit function`"""
 		self.connection.commit()
+		self._dirty = False
+
+	def begin(self):
+		"""Starts a write transaction at once (`BEGIN IMMEDIATE`), instead of at the
+		first change, so that a batch of changes never waits for, or fails because
+		of, another writer half-way. Changes pending on this connection are
+		committed first. Ended by :func:`commit` or :func:`rollback`."""
+		self.commit()
+		self._run("BEGIN IMMEDIATE")
+		self._dirty = True
+
+	def rollback(self):
+		"""Overloads :func:`sqlite3.Connection.rollback function`"""
+		self.connection.rollback()
+		self._dirty = False
+
+	def upgradeDb(self):
+		"""Upgrades an existing :ref:idb to the schema created by :func:`createDb`
+		(e.g. adds missing indexes) and refreshes the query planner statistics."""
+		_upgradeSchema(self.cursor)
+		self.commit()
+		self._tagCache = {}
+		self._run("ANALYZE")
+		self.commit()
+		logger.info("Database schema is up to date.")
+
+	def applyProfile(self, profile):
+		"""Applies a performance profile, i.e. sets its PRAGMA values on this connection.
+
+		:parameter profile: Name of a profile in :data:`phdb.tools.settings.PROFILES`.
+		:type profile: str.
+		"""
+		if not profile in settings.PROFILES:
+			logger.warning("Unknown performance profile '" + profile + "'. Using '" \
+							+ settings.DEFAULT_PROFILE + "'.")
+			profile = settings.DEFAULT_PROFILE
+		for name, value in settings.PROFILES[profile]:
+			try:
+				self._run("PRAGMA " + name + " = " + str(value)).fetchall()
+			except lite.OperationalError as e:
+				logger.warning("Could not set " + name + ": " + str(e))
+		self.profile = profile
+		logger.debug("Using the '" + profile + "' performance profile on " + self.db)
+
+	def getPragmas(self):
+		"""Returns the active values of the PRAGMAs controlled by the performance profiles.
+
+		:returns: [(str,str),] -- pairs of PRAGMA name and value.
+		"""
+		return [(name, str(self._run("PRAGMA " + name).fetchone()[0]))
+				for name in settings.PRAGMAS]
+
+	def dataVersion(self):
+		"""Returns `PRAGMA data_version`, which changes when another connection
+		commits to the database. Values of different connections are not comparable.
+
+		:returns: int
+		"""
+		return self.connection.execute("PRAGMA data_version").fetchone()[0]
+
+	def hasTagCache(self, schema = 'main'):
+		"""Checks if the database has the tag cache column, which older databases get
+		with :func:`upgradeDb` or :func:`rebuildTagCache`.
+
+		:parameter schema: `main`, or the alias of an attached database.
+		:type schema: str.
+		:returns: bool
+		"""
+		if not schema in self._tagCache:
+			self._tagCache[schema] = _hasColumn(self.connection.cursor(), 'Entries', TAGGED, schema)
+		return self._tagCache[schema]
+
+	def rebuildTagCache(self):
+		"""Recomputes the tag cache of all entries, creating it first if needed. Only
+		needed if the database was changed by a version not maintaining the cache.
+
+		:returns: int -- the number of entries updated.
+		"""
+		_upgradeTagCache(self.cursor)
+		self._run(_tagCacheUpdate(self.hasTagIds()))
+		updated = self.cursor.rowcount
+		self.commit()
+		self._tagCache['main'] = True
+		return updated
+
+	def hasTagIds(self, schema = 'main'):
+		"""Checks if the tag tables have the integer-keyed layout, in which `Tags` has
+		an integer `Id` and `Tags__Entries` links entries to these ids. Older databases
+		get it with :func:`migrateTagIds`.
+
+		:parameter schema: `main`, or the alias of an attached database.
+		:type schema: str.
+		:returns: bool
+		"""
+		if not schema in self._tagIds:
+			self._tagIds[schema] = _hasTagIds(self.connection.cursor(), schema)
+		return self._tagIds[schema]
+
+	def migrateTagIds(self):
+		"""Converts the tag tables to the integer-keyed layout (see :data:`TAG_TABLES`),
+		in a single transaction. `Tags__Entries` then stores one `(Entry, TagId)` pair
+		per association in a `WITHOUT ROWID` table, instead of repeating the text of
+		the tag. Duplicate associations, and associations to tags missing from `Tags`
+		(which the queries never returned), are dropped. Connections to the database
+		opened before need to be opened again.
+
+		:returns: int -- the number of associations, or `None` if the database
+		  already had the integer layout.
+		"""
+		if self.hasTagIds():
+			return None
+		start = time.time()
+		self.commit()
+		isolation, self.connection.isolation_level = self.connection.isolation_level, None
+		try:
+			self._run("BEGIN")
+			for command in TAG_CACHE_TRIGGERS:
+				self._run("DROP TRIGGER IF EXISTS " + command.split()[2])
+			self._run("ALTER TABLE Tags__Entries RENAME TO TagsEntriesOld")
+			self._run("ALTER TABLE Tags RENAME TO TagsOld")
+			for command in TAG_TABLES[True]:
+				self._run(command)
+			self._run("INSERT INTO Tags(Tag) SELECT Tag FROM TagsOld ORDER BY Tag")
+			self._run("INSERT OR IGNORE INTO Tags__Entries(Entry, TagId) \
+				SELECT te.Entry, t.Id FROM TagsEntriesOld AS te JOIN Tags AS t ON t.Tag = te.Tag")
+			links = self.cursor.rowcount
+			self._run("DROP TABLE TagsEntriesOld")
+			self._run("DROP TABLE TagsOld")
+			_upgradeSchema(self.cursor)
+			self._run("COMMIT")
+		except:
+			self._run("ROLLBACK")
+			raise
+		finally:
+			self.connection.isolation_level = isolation
+			self._dirty = False
+		self._tagIds['main'] = True
+		logger.info("Migrated " + str(links) + " tag associations to integer tag ids in %.3f s" \
+			% (time.time() - start))
+		return links
+
+	def hasFullText(self):
+		"""Checks if the database has the full-text index needed by `search` queries.
+		Older databases get it with :func:`upgradeDb`.
+
+		:returns: bool
+		"""
+		return _ftsModule(self.connection.cursor()) is not None
+
+	def attach(self, path, alias):
+		"""Attaches another database under an alias. The sources and entries queries
+		then return the rows of all attached databases in one statement (a `UNION ALL`
+		of the same query on each of them, using their own indexes), with the alias
+		of their database (`main` for this one) in the first column, `Db`.
+
+		:parameter path: Path to the database.
+		:type path: str.
+		:parameter alias: The name of the database in the queries.
+		:type alias: str.
+		:raises: ValueError for invalid or used aliases, :class:`sqlite3.OperationalError`
+		  on snapshots.
+		"""
+		if self.snapshot:
+			raise lite.OperationalError("cannot attach databases to a snapshot")
+		if not re.match(r'^[A-Za-z_][A-Za-z0-9_]*$', alias) or alias.lower() in \
+				['main', 'temp'] + [x[0].lower() for x in self.attached]:
+			raise ValueError("invalid or used database alias '" + alias + "'")
+		self._run("ATTACH DATABASE ? AS " + alias, (path,))
+		self.attached.append((alias, path))
+		self._resultsToken = None
+
+	def detach(self, alias):
+		"""Detaches a database attached with :func:`attach`.
+
+		:parameter alias: The name of the database.
+		:type alias: str.
+		"""
+		self._run("DETACH DATABASE " + alias)
+		self.attached = [x for x in self.attached if x[0] != alias]
+		self._tagCache.pop(alias, None)
+		self._resultsToken = None
+
+	def schemas(self):
+		"""
+		:returns: [str,] -- `main` and the aliases of the attached databases.
+		"""
+		return ['main'] + [x[0] for x in self.attached]
 
 	def lastrowid(self):
 		return self.cursor.lastrowid
@@ -161,7 +746,7 @@ class Connection():
 		:type data: [(str,),]
 		"""
 		command   =	"INSERT OR IGNORE " + completeCommand(table, columns)
-		self.cursor.executemany(command, data)
+		self._runMany(command, data)
 
 	def insertOrReplace(self, table, columns, data):
 		"""`INSERT OR REPLACE` SQLite statement for introducing multiple rows.
@@ -174,7 +759,7 @@ class Connection():
 		:type data: [(str,),]
 		"""
 		command   =	"INSERT OR REPLACE " + completeCommand(table, columns)
-		self.cursor.executemany(command, data)
+		self._runMany(command, data)
 
 	def insert(self, table, columns, data):
 		"""`INSERT` SQLite statement for introducing multiple rows.
@@ -187,7 +772,7 @@ class Connection():
 		:type data: [(str,),]
 		"""
 		command   =	"INSERT " + completeCommand(table, columns)
-		self.cursor.executemany(command, data)
+		self._runMany(command, data)
 
 	def insertUnique(self, table, columns, data):
 		"""`INSERT` SQLite statement for introducing multiple rows.
@@ -200,9 +785,42 @@ class Connection():
 		:type data: (str,)
 		"""
 		command   =	"INSERT " + completeCommand(table, columns)
-		self.cursor.execute(command, data)
+		self._run(command, data)
 		return self.cursor.lastrowid
 
+	def insertEntries(self, entries):
+		"""Inserts entries with a single `executemany`. Their ids are assigned in bulk,
+		the same way `AUTOINCREMENT` would, instead of reading back the id of each
+		row (see :func:`insertUnique`). Meant to run inside a write transaction
+		(see :func:`begin`), so that no other connection takes the same ids.
+
+		:parameter entries: Source, At, Info, Label, Cites and Crefs of each entry.
+		:type entries: [(str,)]
+		:returns: [int] -- the ids of the entries, in order.
+		"""
+		self._run("SELECT MAX(IFNULL((SELECT seq FROM sqlite_sequence WHERE name = 'Entries'), 0), \
+			IFNULL((SELECT MAX(Id) FROM Entries), 0))")
+		first = self.cursor.fetchone()[0] + 1
+		ids   = range(first, first + len(entries))
+		self._runMany("INSERT INTO Entries (Id, Source, At, Info, Label, Cites, Crefs) \
+			VALUES (?, ?, ?, ?, ?, ?, ?)", [(x,) + tuple(e) for x, e in zip(ids, entries)])
+		return ids
+
+	def insertTagLinks(self, links):
+		"""Associates entries with tags, in either layout of the tag tables. With
+		integer tag ids, missing tags are added to `Tags` and existing associations
+		are ignored.
+
+		:parameter links: Pairs of entry id and tag.
+		:type links: [(int,str),]
+		"""
+		if not self.hasTagIds():
+			self.insert("Tags__Entries", "(Entry, Tag)", links)
+			return
+		self.insertOrIgnore("Tags", "(Tag)", [(tag,) for entry, tag in links])
+		self._runMany("INSERT OR IGNORE INTO Tags__Entries(Entry, TagId) \
+			SELECT ?, Id FROM Tags WHERE Tag = ?", links)
+
 	def getFrom(self, table, cols=None, groupBy=None):
 		"""Simple SQLite3 querry. Returns the colums from a table in an :ref:idb.
 
@@ -216,11 +834,11 @@ class Connection():
 		"""
 		command = ''
 		if groupBy:
-			command = "GROUP BY" + groupBy
+			command = " GROUP BY " + groupBy
 		command = "SELECT "	+ _colsListToStr("", cols, "*") +" FROM " + table \
 					+ command + ";"
-		self.cursor.execute(command)        
-		self.connection.commit()
+		self._run(command)        
+		self.commit()
 		col_names = [cn[0] for cn in self.cursor.description]
 		rows = self.cursor.fetchall()
 		return col_names, rows
@@ -237,13 +855,11 @@ class Connection():
 		:parameter exp: Filter expression based on the previous column.
 		:type exp: str.
 		"""
-		filterTree = getExpTree(exp)
-		parser     = SqLite3FilterParser(col)
-		condition  = parser.parseNode(*filterTree)
+		condition, params = compileFilter(exp, 'like', col)
 		command = 'DELETE FROM ' + table + " WHERE " + condition + ';'
 		
-		self.cursor.execute(command)        
-		self.connection.commit()
+		self._run(command, params)
+		self.commit()
 		
 
 	def replaceLinks(self, original, link, replacePairs):
@@ -258,26 +874,43 @@ class Connection():
 		 of the link that needs to be updated.
 		:type link: (str,str)
 		:parameter replacePairs: List with pairs of data (to be replaced, replace with).
+		  The pairs are applied in order, e.g. `[(a,b),(b,c)]` replaces both `a` and `b`
+		  with `c`.
 		:type replacePairs: [(str,str),]
+		:returns: {str:int} -- number of rows `added` to and `removed` from the
+		  original table and number of `relinked` rows in the link table.
 		"""
 		origTab = original[0]
 		origCol = original[1]
 		linkTab = link[0]
 		linkCol = link[1]
-		for data in replacePairs: 
-			logger.info("Replacing '" +data[0]+ "' with '" + data[1])
-			self.cursor.execute("INSERT OR IGNORE INTO " + origTab + " (" + origCol \
-					+ ") VALUES (?)", (data[1],) )
-			self.connection.commit()
-			command = "UPDATE " + linkTab + " SET " + linkCol + "='" + data[1] \
-					+ "' WHERE " + linkCol + "='" + data[0] + "';"
-			self.cursor.execute(command)    
-			self.connection.commit()
-			command = "DELETE FROM " + origTab + " WHERE " + origCol + " = '" \
-					+ data[0] + "';"
-			self.cursor.execute(command)  
-			self.connection.commit()  
-		return
+		mapping = _resolveReplacements(replacePairs)
+		for data in mapping: 
+			logger.info("Replacing '" +data[0]+ "' with '" + data[1] + "'")
+
+		self._run("CREATE TEMP TABLE IF NOT EXISTS Replacements(\
+			Old TEXT PRIMARY KEY, \
+			New TEXT)")
+		try:
+			self._run("DELETE FROM temp.Replacements")
+			self._runMany("INSERT INTO temp.Replacements VALUES (?,?)", mapping)
+			self._run("INSERT OR IGNORE INTO " + origTab + " (" + origCol + ") \
+				SELECT New FROM temp.Replacements")
+			added = self.cursor.rowcount
+			self._run("UPDATE " + linkTab + " SET " + linkCol + " = \
+				(SELECT New FROM temp.Replacements WHERE Old = " + linkTab + "." + linkCol + ") \
+				WHERE " + linkCol + " IN (SELECT Old FROM temp.Replacements)")
+			relinked = self.cursor.rowcount
+			# a replaced item may also be the replacement of another, e.g. [(a,b),(c,a)]
+			self._run("DELETE FROM " + origTab + " WHERE " + origCol + " IN \
+				(SELECT Old FROM temp.Replacements) AND " + origCol + " NOT IN \
+				(SELECT New FROM temp.Replacements)")
+			removed = self.cursor.rowcount
+			self.commit()
+		except:
+			self.rollback()
+			raise
+		return {'added':added, 'relinked':relinked, 'removed':removed}
 
 	def removeLinks(self, original, link, removeList):
 		"""Removes a set of linked data in an :ref:idb and takes care of removing the links.
@@ -286,6 +919,8 @@ class Connection():
 		:type db: str.
 		:parameter listOfTags: The database.
 		:type listOfTags: [str,].
+		:returns: {str:int} -- number of rows `removed` from the original table and
+		  of `unlinked` rows in the link table.
 		"""
 		origTab = original[0]
 		origCol = original[1]
@@ -293,13 +928,366 @@ class Connection():
 		linkCol = link[1]
 		for data in removeList:
 			logger.info("Removing '" + data + "'")
-			command = "DELETE FROM " + linkTab + " WHERE " + linkCol + " = '" + data + "';"
-			self.cursor.execute(command)    
-			self.connection.commit()
-			command = "DELETE FROM " + origTab + " WHERE " + origCol + " = '" + data + "';"
-			self.cursor.execute(command)  
-			self.connection.commit()    
-		return
+
+		self._run("CREATE TEMP TABLE IF NOT EXISTS Removals(\
+			Old TEXT PRIMARY KEY)")
+		try:
+			self._run("DELETE FROM temp.Removals")
+			self._runMany("INSERT OR IGNORE INTO temp.Removals VALUES (?)", 
+				[(x,) for x in removeList])
+			self._run("DELETE FROM " + linkTab + " WHERE " + linkCol + " IN \
+				(SELECT Old FROM temp.Removals)")
+			unlinked = self.cursor.rowcount
+			self._run("DELETE FROM " + origTab + " WHERE " + origCol + " IN \
+				(SELECT Old FROM temp.Removals)")
+			removed = self.cursor.rowcount
+			self.commit()
+		except:
+			self.rollback()
+			raise
+		return {'unlinked':unlinked, 'removed':removed}
+
+	def replaceTags(self, replacePairs):
+		"""Renames or merges tags, in either layout of the tag tables. See
+		:func:`replaceLinks` for the arguments and the result."""
+		if not self.hasTagIds():
+			return self.replaceLinks(('Tags','Tag'), ('Tags__Entries', 'Tag'), replacePairs)
+		mapping = _resolveReplacements(replacePairs)
+		for data in mapping: 
+			logger.info("Replacing '" +data[0]+ "' with '" + data[1] + "'")
+
+		self._run("CREATE TEMP TABLE IF NOT EXISTS TagIdReplacements(\
+			Old INTEGER PRIMARY KEY, \
+			New TEXT)")
+		self._run("CREATE TEMP TABLE IF NOT EXISTS TagIdRelinks(\
+			Entry INTEGER, \
+			TagId INTEGER)")
+		try:
+			self._run("DELETE FROM temp.TagIdReplacements")
+			self._runMany("INSERT OR IGNORE INTO temp.TagIdReplacements \
+				SELECT Id, ? FROM Tags WHERE Tag = ?", [(new, old) for old, new in mapping])
+			self._run("INSERT OR IGNORE INTO Tags (Tag) SELECT New FROM temp.TagIdReplacements")
+			added = self.cursor.rowcount
+			# the links are moved through a temporary table, since a replaced tag may
+			# also be the replacement of another, e.g. [(a,b),(c,a)]
+			self._run("DELETE FROM temp.TagIdRelinks")
+			self._run("INSERT INTO temp.TagIdRelinks \
+				SELECT te.Entry, t.Id FROM Tags__Entries AS te \
+				JOIN temp.TagIdReplacements AS r ON r.Old = te.TagId \
+				JOIN Tags AS t ON t.Tag = r.New")
+			self._run("DELETE FROM Tags__Entries WHERE TagId IN \
+				(SELECT Old FROM temp.TagIdReplacements)")
+			# entries which already have the new tag keep a single link
+			self._run("INSERT OR IGNORE INTO Tags__Entries (Entry, TagId) \
+				SELECT Entry, TagId FROM temp.TagIdRelinks")
+			relinked = self.cursor.rowcount
+			self._run("DELETE FROM Tags WHERE Id IN (SELECT Old FROM temp.TagIdReplacements) \
+				AND Tag NOT IN (SELECT New FROM temp.TagIdReplacements)")
+			removed = self.cursor.rowcount
+			self.commit()
+		except:
+			self.rollback()
+			raise
+		return {'added':added, 'relinked':relinked, 'removed':removed}
+
+	def removeTags(self, removeList):
+		"""Removes tags and their associations, in either layout of the tag tables.
+		See :func:`removeLinks` for the result."""
+		if not self.hasTagIds():
+			return self.removeLinks(('Tags','Tag'), ('Tags__Entries', 'Tag'), removeList)
+		for data in removeList:
+			logger.info("Removing '" + data + "'")
+		try:
+			condition, params = inList("Tag", removeList)
+			self._run("DELETE FROM Tags__Entries WHERE TagId IN \
+				(SELECT Id FROM Tags WHERE " + condition + ")", params)
+			unlinked = self.cursor.rowcount
+			self._run("DELETE FROM Tags WHERE " + condition, params)
+			removed = self.cursor.rowcount
+			self.commit()
+		except:
+			self.rollback()
+			raise
+		return {'unlinked':unlinked, 'removed':removed}
+
+	def removeSource(self, bibref):
+		"""Removes a source together with its entries, their tag associations and the
+		references it makes, so that it can be harvested again. Does not commit: the
+		source is meant to be removed and inserted again in the same transaction.
+
+		:parameter bibref: BibRef of the source.
+		:type bibref: str.
+		:returns: int -- the number of entries removed.
+		"""
+		self._run("DELETE FROM Tags__Entries WHERE Entry IN \
+			(SELECT Id FROM Entries WHERE Source = ?)", (bibref,))
+		self._run("DELETE FROM Entries WHERE Source = ?", (bibref,))
+		removed = self.cursor.rowcount
+		self._run("DELETE FROM Xrefs WHERE RefBy = ?", (bibref,))
+		self._run("DELETE FROM Source WHERE BibRef = ?", (bibref,))
+		return removed
+
+	def removeUnusedTags(self):
+		"""Removes the tags which are not associated to any entry anymore, in either
+		layout of the tag tables.
+
+		:returns: int -- the number of tags removed.
+		"""
+		if self.hasTagIds():
+			self._run("DELETE FROM Tags WHERE Id NOT IN (SELECT TagId FROM Tags__Entries)")
+		else:
+			self._run("DELETE FROM Tags WHERE Tag NOT IN (SELECT Tag FROM Tags__Entries)")
+		removed = self.cursor.rowcount
+		self.commit()
+		return removed
+
+	def getManifest(self, folder = None):
+		"""Returns the input files recorded in the manifest (see :data:`MANIFEST_TABLE`).
+		The table is created first on databases of older versions.
+
+		:parameter folder: Only the files in this folder. All files if `None`.
+		:type folder: str.
+		:returns: {str:(int, float, str, str)} -- the size, modification time, hash
+		  and BibRef by absolute path.
+		"""
+		if not self._manifest:
+			self._run(MANIFEST_TABLE)
+			self._manifest = True
+		self._run("SELECT Path, Size, Mtime, Hash, BibRef FROM Manifest")
+		rows = self.cursor.fetchall()
+		if folder is not None:
+			folder = os.path.abspath(folder)
+			rows = [row for row in rows if os.path.dirname(row[0]) == folder]
+		return dict((row[0], tuple(row[1:])) for row in rows)
+
+	def recordFiles(self, files):
+		"""Records harvested input files in the manifest. Does not commit.
+
+		:parameter files: Path, size, modification time, hash and BibRef of each file.
+		:type files: [(str, int, float, str, str)]
+		"""
+		self._runMany("INSERT OR REPLACE INTO Manifest (Path, Size, Mtime, Hash, BibRef) \
+			VALUES (?, ?, ?, ?, ?)", [(os.path.abspath(x[0]),) + tuple(x[1:]) for x in files])
+
+	def removeFile(self, path):
+		"""Removes an input file from the manifest, together with the source it
+		produced. Does not commit.
+
+		:returns: str -- the BibRef of the removed source, or `None`.
+		"""
+		path = os.path.abspath(path)
+		self._run("SELECT BibRef FROM Manifest WHERE Path = ?", (path,))
+		row = self.cursor.fetchone()
+		bibref = row[0] if row else None
+		if bibref:
+			self.removeSource(bibref)
+		self._run("DELETE FROM Manifest WHERE Path = ?", (path,))
+		return bibref
+
+	def _run(self, command, params = (), cursor = None):
+		"""Helper. Executes a statement and records it in the query log, together
+		with its execution time, the number of changed rows and, for queries, the
+		query plan. Every statement of this class goes through here.
+
+		:returns: :class:`sqlite3.Cursor` -- the cursor which executed the statement.
+		"""
+		cursor = cursor or self.cursor
+		record = self._record(command, params)
+		start  = time.time()
+		cursor.execute(command, params)
+		record['time'] = time.time() - start
+		if cursor.description is None:
+			record['rows'] = cursor.rowcount
+			self._dirty = self._dirty or _opensTransaction(command)
+		return cursor
+
+	def _runMany(self, command, data):
+		"""Helper. Same as :func:`_run`, for :func:`sqlite3.Cursor.executemany`."""
+		record = self._record(command, ())
+		start  = time.time()
+		self.cursor.executemany(command, data)
+		record['time'] = time.time() - start
+		record['rows'] = self.cursor.rowcount
+		self._dirty = self._dirty or _opensTransaction(command)
+		return self.cursor
+
+	def _record(self, command, params):
+		"""Helper. Appends a new record to the query log."""
+		record = {'sql' : command, 'params' : tuple(params), 'time' : 0.0, 'rows' : None,
+		          'plan' : self._plan(command, params), 'cached' : False}
+		self.queries.append(record)
+		return record
+
+	def _plan(self, command, params):
+		"""Helper. Returns the `EXPLAIN QUERY PLAN` of a query as indented lines, or
+		`None` for other statements. Plans are cached by the query text.
+
+		.. note::
+
+		   In Python 2 `EXPLAIN` commits the pending transaction, so no plan is
+		   captured while this connection has uncommitted changes.
+		"""
+		words = command.split(None, 1)
+		if not words or not words[0].upper() in ['SELECT', 'WITH']:
+			return None
+		plan = self._plans.get(command)
+		if plan is None:
+			if self._dirty:
+				return ['(not captured: uncommitted changes)']
+			try:
+				rows = self.connection.execute("EXPLAIN QUERY PLAN " + command, params)
+				plan = _formatPlan(rows.fetchall())
+			except lite.Error as e:
+				plan = ['(not captured: ' + str(e) + ')']
+			self._plans.put(command, plan)
+		return plan
+
+	def explain(self, command, params = ()):
+		"""Returns the query plan of a statement, without executing it.
+
+		:parameter command: The SQL statement.
+		:type command: str.
+		:returns: [str,] -- the plan, one indented line per step.
+		"""
+		return self._plan(command, params) or []
+
+	def slowestQueries(self, count = 10):
+		"""Returns the slowest statements in the query log, slowest first. Each is a
+		dictionary with the keys `sql`, `params`, `time` (in seconds), `rows` (returned
+		by queries, changed by the other statements), `plan` and `cached` (if the rows
+		came from the result cache).
+
+		:parameter count: Maximum number of statements returned.
+		:type count: int.
+		:returns: [{str:},]
+		"""
+		return sorted(self.queries, key = lambda q: q['time'], reverse = True)[:count]
+
+	def _stream(self, command, params = (), treat = False, key = None):
+		"""Helper. Executes a query on its own cursor and returns its column headers
+		and a generator over its rows, which are fetched in batches of :data:`BATCH`.
+		The time spent fetching is added to the query's record in the log. If a `key`
+		is given, the rows are stored under it in the result cache once all of them
+		were fetched, unless they outgrow the cache: then they are not kept at all, so
+		that large results are still streamed in constant memory.
+
+		.. note::
+
+		   In Python 2 a commit on the same connection resets all running queries,
+		   so nothing should be written through this connection while iterating.
+		"""
+		cursor = self._run(command, params, self.connection.cursor())
+		if cursor.description is None: # not a query, e.g. a custom UPDATE
+			self.commit()
+			return [], iter([])
+		record = self.queries[-1]
+		record['rows'] = 0
+		col_names = [cn[0] for cn in cursor.description]
+		def fetch():
+			start = time.time()
+			batch = cursor.fetchmany(BATCH)
+			record['time'] += time.time() - start
+			record['rows'] += len(batch)
+			return batch
+		def rows():
+			fetched = [] if key is not None else None
+			size    = 0
+			batch = fetch()
+			while batch:
+				for row in batch:
+					row = tuple(map(utils.treatStr, row)) if treat else row
+					if fetched is not None:
+						fetched.append(row)
+						size += _rowSize(row)
+						if size > self.results.size:
+							fetched = None # too large to cache, stop collecting
+					yield row
+				batch = fetch()
+			cursor.close()
+			if fetched is not None:
+				self.results.put(key, (col_names, fetched), size + sys.getsizeof(fetched))
+		return col_names, rows()
+
+	def _streamCached(self, command, params = (), treat = False):
+		"""Helper. Same as :func:`_stream`, but the rows are served from the result
+		cache if the same query was already run on the same state of the database."""
+		key = self._resultKey(command, params)
+		return self._cached(key, command, params) or \
+			self._stream(command, params, treat, key)
+
+	def _resultKey(self, command, params, extra = ()):
+		"""Helper. Returns the key of a query in the result cache: its text with the
+		whitespace normalized, its parameters and any `extra` values the rows depend
+		on. Returns `None` if the query should not be cached, i.e. while this
+		connection has uncommitted changes.
+
+		The whole cache is emptied when the state of the database changed since the
+		results were stored (see :func:`_dbToken`).
+		"""
+		if not self.results.size or self._dirty:
+			return None
+		token = self._dbToken()
+		if token != self._resultsToken:
+			if len(self.results):
+				logger.debug("Database changed, emptying the result cache")
+			self.results.clear()
+			self._resultsToken = token
+		return (' '.join(command.split()), tuple(params), extra)
+
+	def _dbToken(self):
+		"""Helper. Identifies the state of the database by its data version (changed
+		by the commits of other connections), its schema version, the rows changed
+		through this connection (except in temporary tables) and the modification
+		time and size of its file, and of the attached databases. Snapshots only
+		change with :func:`refresh`, so their file is not checked.
+		"""
+		token = (self.connection.total_changes - self._tempChanges,)
+		files = [('main', None if self.snapshot else self.db)] + self.attached
+		for schema, path in files:
+			token += (self.connection.execute("PRAGMA " + schema + ".data_version").fetchone()[0],
+			          self.connection.execute("PRAGMA " + schema + ".schema_version").fetchone()[0])
+			if path and os.path.isfile(path):
+				stat = os.stat(path)
+				token += (stat.st_mtime, stat.st_size)
+		return token
+
+	def _cached(self, key, command, params):
+		"""Helper. Returns the column headers and an iterator over the rows stored
+		under `key` in the result cache, or `None`. Hits are recorded in the query log.
+		"""
+		if key is None:
+			return None
+		result = self.results.get(key)
+		if result is None:
+			return None
+		record = self._record(command, params)
+		record['rows']   = len(result[1])
+		record['cached'] = True
+		return list(result[0]), iter(result[1])
+
+	def resultStats(self):
+		"""Returns the usage statistics of the result cache.
+
+		:returns: {str:int} -- `hits`, `misses`, stored `results`, `bytes` used and
+		  `capacity` in bytes.
+		"""
+		return {'hits':self.results.hits, 'misses':self.results.misses,
+		        'results':len(self.results), 'bytes':self.results.used,
+		        'capacity':self.results.size}
+
+	def clearResults(self):
+		"""Empties the result cache and resets its statistics."""
+		self.results.clear()
+		self.results.hits   = 0
+		self.results.misses = 0
+
+	def qIterCustom(self, q):
+		"""Same as :func:`qGetCustom`, but the rows are returned as a generator."""
+		try:
+			return self._stream(q)
+		except Exception as e:
+			logger.error(str(e.__class__) + " " + ', '.join(e.args))
+		return [], iter([])
 
 	def qGetCustom(self, q):
 		"""Executes a custom SQLite3 query. The user needs to know the architecture of
@@ -310,17 +1298,45 @@ class Connection():
 		:parameter q: The query.
 		:type q: str.
 		"""
-		col_names = []
-		rows = []
-		try:
-			self.cursor.execute(q)        
-			self.connection.commit()
-			col_names = [cn[0] for cn in self.cursor.description]
-			rows = self.cursor.fetchall()
-			logger.debug(str(rows))
-		except Exception as e:
-			logger.error(str(e.__class__) + " " + ', '.join(e.args))
-		return col_names, rows
+		col_names, rows = self.qIterCustom(q)
+		return col_names, list(rows)
+
+	def qIterSources(self, srcs = None):
+		"""Same as :func:`qGetSources`, but the rows are returned as a generator."""
+		command, params = self._sourcesQuery(srcs)
+		logger.debug(command)
+		return self._streamCached(command, params)
+
+	def explainSources(self, srcs = None):
+		"""Returns the query plan of :func:`qGetSources`, without executing it."""
+		return self.explain(*self._sourcesQuery(srcs))
+
+	def _sourcesQuery(self, srcs):
+		"""Helper. Builds the query of :func:`qGetSources`, on all attached databases.
+
+		:returns: str, (str,) -- the SQL text and its parameters.
+		"""
+		if self.attached:
+			return _union([(x, self._sourcesSelect(x, srcs)) for x in self.schemas()])
+		return self._sourcesSelect('main', srcs).add("; ").build()
+
+	def _sourcesSelect(self, schema, srcs):
+		"""Helper. Builds the query of :func:`qGetSources` on one database.
+
+		:returns: :class:`phdb.core.querybuilder.Query`
+		"""
+		p = _prefix(schema)
+		query = Query("\n" \
+			+ "\tSELECT s.BibRef, s.About, \n"\
+			+ "\t          GROUP_CONCAT(distinct x.RefTo) AS " + REFERS + ", \n"\
+			+ "\t          GROUP_CONCAT(distinct t.Tag) AS " + TAGS + " \n"\
+			+ "\tFROM " + p + "Source AS s \n"\
+			+ "\tLEFT JOIN " + p + "Entries AS e ON e.Source = s.BibRef \n"\
+			+ _tagJoin(p, self.hasTagIds(schema))\
+			+ "\tLEFT JOIN " + p + "Xrefs AS x ON x.RefBy = s.BibRef \n"\
+			+ "\tWHERE 1 ")
+		_addSources(query, "s.BibRef", srcs)
+		return query.add("\n\tGROUP BY s.BibRef")
 
 	def qGetSources(self, srcs = None):
 		"""Executes a pre-defined query which returns information about sources and
@@ -332,30 +1348,109 @@ class Connection():
 		:type srcs: [str,]
 		:returns: [str,] , [(str,),] -- column headers and data rows
 		"""
-		col_names = []
-		rows = []
-		command = "\n" \
-			+ "\tSELECT s.BibRef, s.About, \n"\
-			+ "\t          GROUP_CONCAT(distinct x.RefTo) AS " + REFERS + ", \n"\
-			+ "\t          GROUP_CONCAT(distinct t.Tag) AS " + TAGS + " \n"\
-			+ "\tFROM Source AS s \n"\
-			+ "\tLEFT JOIN Entries AS e ON e.Source = s.BibRef \n"\
-			+ "\tLEFT JOIN Tags__Entries AS te ON te.Entry = e.Id \n"\
-			+ "\tLEFT JOIN Tags AS t ON t.Tag = te.Tag \n"\
-			+ "\tLEFT JOIN Xrefs AS x ON x.RefBy = s.BibRef \n"\
-			+ "\t"+ _srcListToStr("s.BibRef", srcs) +" \n"\
-			+ "\tGROUP BY s.BibRef; "
+		col_names, rows = self.qIterSources(srcs)
+		return col_names, list(rows)
+
+	def qIterEntries(self, filterExp = None, srcs = None, engine = 'like', search = None):
+		"""Same as :func:`qGetEntries`, but the rows are returned as a generator."""
+		command, params = self._entriesQuery(filterExp, srcs, engine, search)
+		bitmapped = bool(filterExp) and engine == 'bitmap'
+		key = self._resultKey(command, params, (filterExp,) if bitmapped else ())
+		cached = self._cached(key, command, params)
+		if cached:
+			return cached
+		if bitmapped:
+			changes = self.connection.total_changes
+			self._run("DELETE FROM temp.Matches")
+			for schema in self.schemas():
+				ids = self._bitmapIndex(schema).match(getExpTree(filterExp))
+				self._runMany("INSERT INTO temp.Matches VALUES (?, ?)", [(schema, x) for x in ids])
+			self.commit()
+			self._tempChanges += self.connection.total_changes - changes
 		logger.debug(command)
-		self.cursor.execute(command)        
-		self.connection.commit()
-
-		col_names = [cn[0] for cn in self.cursor.description]
-		rows = self.cursor.fetchall()
-		logger.debug(str(rows))
-		return col_names, rows
+		return self._stream(command, params, treat = True, key = key)
+
+	def _bitmapIndex(self, schema = 'main'):
+		"""Helper. Returns the up to date bitmap index of the database, or of the
+		snapshot, which is built from the copy in memory."""
+		if schema != 'main':
+			return bitmap.getIndex(dict(self.attached)[schema])
+		if not self.snapshot:
+			return bitmap.getIndex(self.db)
+		if self._bitmap is None:
+			self._bitmap = bitmap.TagBitmapIndex(self.connection)
+			self._bitmap.refresh()
+		return self._bitmap
+
+	def explainEntries(self, filterExp = None, srcs = None, engine = 'like', search = None):
+		"""Returns the query plan of :func:`qGetEntries`, without executing it.
+
+		:returns: [str,] -- the plan, one indented line per step.
+		"""
+		try:
+			return self.explain(*self._entriesQuery(filterExp, srcs, engine, search))
+		except lite.Error as e:
+			return ['(not available: ' + str(e) + ')']
 
+	def _entriesQuery(self, filterExp, srcs, engine, search):
+		"""Helper. Builds the query of :func:`qGetEntries`, on all attached databases.
+		For the `bitmap` engine the query reads the matching ids from the temporary
+		table `Matches`, which is created here but filled by the caller.
 
-	def qGetEntries(self, filterExp = None, srcs = None):
+		:returns: str, (str,) -- the SQL text and its parameters.
+		"""
+		if filterExp and engine == 'bitmap':
+			self._run("CREATE TEMP TABLE IF NOT EXISTS Matches(Db TEXT, Id INTEGER, \
+				PRIMARY KEY (Db, Id))")
+		if self.attached:
+			return _union([(x, self._entriesSelect(x, filterExp, srcs, engine, search))
+				for x in self.schemas()])
+		return self._entriesSelect('main', filterExp, srcs, engine, search).add(";").build()
+
+	def _entriesSelect(self, schema, filterExp, srcs, engine, search):
+		"""Helper. Builds the query of :func:`qGetEntries` on one database. When the
+		database has the tag cache, the tags are read from it instead of being
+		aggregated through the tag tables.
+
+		:returns: :class:`phdb.core.querybuilder.Query`
+		"""
+		p = _prefix(schema)
+		cached = self.hasTagCache(schema)
+		query  = Query(" \n"\
+			+ "\tSELECT e.Id, e.Info, e.Source, e.At, e.Label, e.Cites, e.Crefs, \n"\
+			+ "\t       " + _taggedColumn(cached) + "\n"\
+			+ "\tFROM " + p + "Entries AS e\n")
+		if search:
+			module = _ftsModule(self.connection.cursor(), schema)
+			if module is None:
+				raise lite.OperationalError("no full-text index in '" + schema \
+					+ "'. Run 'upgrade_db' first")
+			query.add("\tJOIN (SELECT rowid AS Id, " + FTS_RANK[module] + " AS Rank \n"\
+				+ "\t      FROM " + p + "EntriesFts WHERE EntriesFts MATCH ? LIMIT -1) AS fts \n"\
+				+ "\t      ON fts.Id = e.Id \n", [search])
+		if not cached:
+			query.add(_tagJoin(p, self.hasTagIds(schema)))
+		query.add("\tWHERE 1 ")
+		_addSources(query, "e.Source", srcs)
+		if filterExp and engine == 'set':
+			subquery, params = compileFilter(filterExp, engine, prefix = p,
+				tagIds = self.hasTagIds(schema))
+			query.add("\n\tAND e.Id IN (" + subquery + ")", params)
+		elif filterExp and engine == 'bitmap':
+			query.add("\n\tAND e.Id IN (SELECT Id FROM temp.Matches WHERE Db = ?)", [schema])
+		if cached:
+			if filterExp and not engine in ['set', 'bitmap']:
+				query.add("\n\tAND (").add(*compileFilter(filterExp, engine, 'e.' + TAGGED))
+				query.add(")")
+			return query.add("\n\tORDER BY " + ("fts.Rank, " if search else "") + "e.Id")
+		query.add("\n\tGROUP BY e.Id ")
+		if filterExp and not engine in ['set', 'bitmap']:
+			query.add("\n\tHAVING ").add(*compileFilter(filterExp, engine))
+		if search:
+			query.add("\n\tORDER BY MIN(fts.Rank), e.Id")
+		return query
+
+	def qGetEntries(self, filterExp = None, srcs = None, engine = 'like', search = None):
 		"""Executes a pre-defined query which returns (idea) entries and
 		writes it to a chosen backend. Includes lable column.
 
@@ -366,32 +1461,92 @@ class Connection():
 		:parameter filterExp: Filter expression. Will be parsed according 
 		  to :mod:`phdbcommand.filterparse`
 		:type filterExp: str.
+		:parameter engine: Filter engine, one of :data:`FILTER_ENGINES`. `like` matches
+		  substrings of the aggregated tags, `set` matches exact tags through the index
+		  and `bitmap` matches exact tags using :mod:`phdb.core.bitmap`.
+		:type engine: str.
+		:parameter search: Full-text query over the info, page and label of the entries,
+		  in the SQLite full-text query syntax. If specified, only the matching entries
+		  are returned, the most relevant first. Needs :func:`hasFullText`.
+		:type search: str.
 		:returns: [str,] , [(str,),] -- column headers and data rows
 		"""
+		col_names, rows = self.qIterEntries(filterExp, srcs, engine, search)
+		return col_names, list(rows)
 
-		tags = ''
-		if filterExp:
-			filterTree = getExpTree(filterExp)
-			parser     = SqLite3FilterParser(TAGGED)
-			tags       = 'HAVING ' + parser.parseNode(*filterTree)
-
+	def qIterCrefs(self, srcs, lables):
+		"""Same as :func:`qGetCrefs`, but the rows are returned as a generator."""
+		cached  = self.hasTagCache()
 		command = " \n"\
-			+ "\tSELECT e.Id, e.Info, e.Source, e.At, e.Label, e.Cites, e.Crefs, \n"\
-			+ "\t       GROUP_CONCAT(distinct t.Tag) AS " + TAGGED + "\n"\
-			+ "\tFROM Entries AS e\n"\
-			+ "\tLEFT JOIN Tags__Entries AS te ON te.Entry = e.Id \n"\
-			+ "\tLEFT JOIN Tags AS t ON t.Tag = te.Tag \n"\
-			+ "\t" + _srcListToStr("e.Source", srcs) +" \n"\
-			+ "\tGROUP BY e.Id \n"\
-			+ "\t" + tags +";"
+			+ "\tSELECT e.Id, e.Info, e.Source, e.At, e.Label, \n"\
+			+ "\t   " + _taggedColumn(cached) + "\n"\
+			+ "\tFROM Entries AS e\n"
+		if not cached:
+			command = command + _tagJoin('', self.hasTagIds())
+		labels, params = inList("e.Label", lables)
+		command = command + "\tWHERE " + labels + " \n"\
+			+ ("\tORDER BY e.Id; " if cached else "\tGROUP BY e.Id; ")
 		logger.debug(command)
-		self.cursor.execute(command)        
-		self.connection.commit()
+		return self._streamCached(command, params, treat = True)
+
+	def qIterCrefClosure(self, lables, depth = CREF_DEPTH):
+		"""Same as :func:`qGetCrefClosure`, but the rows are returned as a generator."""
+		lables = sorted(set(lables))
+		if not _hasRecursiveCte() or not querybuilder.hasJson():
+			lables = self._crefClosure(lables, depth)
+			return self.qIterCrefs(None, lables)
+		cached  = self.hasTagCache()
+		command = " \n"\
+			+ "\tWITH RECURSIVE Closure(Label, Depth) AS ( \n"\
+			+ "\t    SELECT value, 1 FROM json_each(?) \n"\
+			+ "\t    UNION \n"\
+			+ "\t    SELECT r.value, c.Depth + 1 FROM Closure AS c \n"\
+			+ "\t    JOIN Entries AS e ON e.Label = c.Label \n"\
+			+ "\t    JOIN json_each(" + _jsonList("e.Crefs") + ") AS r \n"\
+			+ "\t    WHERE c.Depth < ? AND e.Crefs <> '') \n"\
+			+ "\tSELECT e.Id, e.Info, e.Source, e.At, e.Label, \n"\
+			+ "\t   " + _taggedColumn(cached) + "\n"\
+			+ "\tFROM Entries AS e\n"
+		if not cached:
+			command = command + _tagJoin('', self.hasTagIds())
+		command = command + "\tWHERE e.Label IN (SELECT Label FROM Closure) \n"\
+			+ ("\tORDER BY e.Id; " if cached else "\tGROUP BY e.Id; ")
+		logger.debug(command)
+		return self._streamCached(command, (json.dumps(lables), depth), treat = True)
 
-		col_names = [cn[0] for cn in self.cursor.description]
-		rows = self.cursor.fetchall()
-		rows = [tuple(map(utils.treatStr, x)) for x in rows]
-		return col_names, rows
+	def _crefClosure(self, lables, depth):
+		"""Helper. Fallback of :func:`qIterCrefClosure` for SQLite versions without
+		recursive queries or JSON functions. Follows the references one level per query.
+
+		:returns: [str,] -- all the labels reached.
+		"""
+		reached  = set(lables)
+		frontier = lables
+		for level in range(1, depth):
+			if not frontier:
+				break
+			condition, params = inList("Label", frontier)
+			cols, rows = self._stream("SELECT Crefs FROM Entries WHERE " + condition + \
+				" AND Crefs <> '';", params)
+			frontier = set(x for row in rows for x in row[0].split(',')) - reached
+			reached.update(frontier)
+			frontier = sorted(frontier)
+		return sorted(reached)
+
+	def qGetCrefClosure(self, lables, depth = CREF_DEPTH):
+		"""Executes a pre-defined query which returns the entries associated with a list
+		of labels, and all the entries they cross-reference (`[[Cref:...]]`), directly or
+		indirectly, in one query. Each entry is returned once.
+
+		:parameter lables: Labels of the entries referenced directly.
+		:type lables: [str,]
+		:parameter depth: The maximum length of the chains of references followed.
+		:type depth: int.
+		:returns: [str,] , [(str,),] -- column headers and data rows, as for
+		  :func:`qGetCrefs`
+		"""
+		col_names, rows = self.qIterCrefClosure(lables, depth)
+		return col_names, list(rows)
 
 	def qGetCrefs(self, srcs, lables):
 		"""Executes a pre-defined query which returns entries associated with a label.
@@ -404,51 +1559,37 @@ class Connection():
 		:type labels: [str,]
 		:returns: [str,] , [(str,),] -- column headers and data rows
 		"""
-		col_names = []
-		rows = []
-
-		command = " \n"\
-			+ "\tSELECT e.Id, e.Info, e.Source, e.At, e.Label, \n"\
-			+ "\t   GROUP_CONCAT(distinct t.Tag) AS " + TAGGED + "\n"\
-			+ "\tFROM Entries AS e\n"\
-			+ "\tLEFT JOIN Tags__Entries AS te ON te.Entry = e.Id \n"\
-			+ "\tLEFT JOIN Tags AS t ON t.Tag = te.Tag \n"\
-			+ "\tWHERE e.Label in ("+ _tagsListToStr(lables) +") \n"\
-			+ "\tGROUP BY e.Id; "
-		logger.debug(command)
-		self.cursor.execute(command)        
-		self.connection.commit()
-
-		col_names = [cn[0] for cn in self.cursor.description]
-		rows = self.cursor.fetchall()
-		rows = [tuple(map(utils.treatStr, x)) for x in rows]
-		return col_names, rows
+		col_names, rows = self.qIterCrefs(srcs, lables)
+		return col_names, list(rows)
 
 
 	def executeDumpDb(self, dumper):
 		"""Dumps the contents of a database in a chosen format, specified in :mod:`phdb.dumper.api`
 
+		All sources are read with a single query ordered by source, which is streamed
+		to the dumper one source (i.e. one group of contiguous rows) at a time.
+
 		:parameter dumper: An initialized dumper.
 		:type outp: :class:`phdb.dumper.api.DbDumper`.
 		"""
-		command = "SELECT BibRef FROM Source;"
-		self.cursor.execute(command)    
-		rows = self.cursor.fetchall()
-		logger.debug("All sources in DB: " + str(rows))
+		cached  = self.hasTagCache()
+		command = "\n"\
+			+ "\tSELECT s.BibRef, s.About, \n"\
+			+ "\t       (SELECT GROUP_CONCAT(distinct RefTo) FROM Xrefs WHERE RefBy = s.BibRef), \n"\
+			+ "\t       e.Id, e.Info, e.At, e.Label, " + _taggedColumn(cached) + " \n"\
+			+ "\tFROM Source AS s \n"\
+			+ "\tLEFT JOIN Entries AS e ON e.Source = s.BibRef \n"
+		if not cached:
+			command = command + _tagJoin('', self.hasTagIds()) \
+				+ "\tGROUP BY s.BibRef, e.Id \n"
+		command = command + "\tORDER BY s.BibRef, e.Id;"
+		logger.debug(command)
+		col_names, rows = self._stream(command)
 
-		for source in rows:
-			src = source[0]
+		for src, group in itertools.groupby(rows, key = lambda row: row[0]):
 			dumper.dumpNewSource(src)
-
-			command = "\n"\
-				+ "\tSELECT s.BibRef, s.About, GROUP_CONCAT(distinct x.RefTo) \n"\
-				+ "\t	FROM Source AS s \n"\
-				+ "\tLEFT JOIN Xrefs AS x ON x.RefBy = s.BibRef \n"\
-				+ "\tWHERE s.BibRef = '"+ src +"' \n"\
-				+ "\tGROUP BY s.BibRef; "
-			self.cursor.execute(command)    
-			data = self.cursor.fetchall()
-			data = map(utils.treatStr, list(data[0]))
+			first = next(group)
+			data = map(utils.treatStr, list(first[:3]))
 			logger.debug(str(data))		
 			dumper.dumpHeader({	
 				'BIBREF':data[0],
@@ -456,17 +1597,10 @@ class Connection():
 				"REFERENCES":data[2],
 				"TAGS":""}) 
 
-			command = " \n"\
-				+ "\tSELECT e.Info, e.At, e.Label, GROUP_CONCAT(distinct t.Tag)\n"\
-				+ "\tFROM Entries AS e\n"\
-				+ "\t	LEFT JOIN Tags__Entries AS te ON te.Entry = e.Id \n"\
-				+ "\t	LEFT JOIN Tags AS t ON t.Tag = te.Tag \n"\
-				+ "\tWHERE e.Source = '"+ src +"' \n"\
-				+ "\tGROUP BY e.Id;"	
-			self.cursor.execute(command)    
-			data = self.cursor.fetchall()
-			for entry in data:
-				entry = map(utils.treatStr, list(entry))
+			for row in itertools.chain([first], group):
+				if row[3] is None: # source without entries
+					continue
+				entry = map(utils.treatStr, list(row[4:]))
 				logger.debug(str(entry))	
 				dumper.dumpEntry({
 					'TAG':entry[3],
@@ -476,8 +1610,20 @@ class Connection():
 		return
 
 
+	def qGetTagCounts(self):
+		"""Returns all tags with the number of entries associated with them.
+
+		:returns: [str,] , [(str,int),] -- column headers and data rows
+		"""
+		command = "SELECT t.Tag, COUNT(te.Entry) AS Entries FROM Tags AS t \
+			LEFT JOIN Tags__Entries AS te ON " + TAG_KEY[self.hasTagIds()] \
+			+ " GROUP BY t.Tag ORDER BY t.Tag;"
+		col_names, rows = self._streamCached(command)
+		return col_names, list(rows)
+
 	def evaluateDb_typos (self, tolerance):
-		"""Evaluates an :ref:idb for typos in the tags.
+		"""Evaluates an :ref:idb for typos in the tags. Only plausible pairs of tags
+		are compared, see :mod:`phdb.core.typos`.
 
 		:parameter db: Path to the database.
 		:type db: str.
@@ -487,28 +1633,26 @@ class Connection():
 		:returns: [[(str,int),(str,int)],] -- typoed tags and their pair as tuple 
 		  containing the number of occurences
 		"""
-		command = "SELECT Tag, Count(*) FROM Tags__Entries GROUP BY Tag;"
-		self.cursor.execute(command)        
-		self.connection.commit()
-		col_names = [cn[0] for cn in self.cursor.description]
+		command = TAG_COUNTS[self.hasTagIds()]
+		col_names, rows = self._stream(command)
+		return typos.findTypos(list(rows), tolerance)
 
-		rows = self.cursor.fetchall()
-		typoList = []
-		for row in rows:
-			if not rows:
-				break
-			rows.pop(0)
-			currentTypos = [row]
-			for potential in rows:
-				similarity = 1
-				s = difflib.SequenceMatcher(None, row[0], potential[0])
-				similarity = s.ratio() if s.ratio() < similarity else similarity
-				if similarity >= tolerance:
-					currentTypos.append(potential)
-			if len(currentTypos) > 1:
-				typoList.append(currentTypos)
-			rows = [ x for x in rows if not x in currentTypos ]
-		return typoList 
+	def evaluateDb_typosReference (self, tolerance):
+		"""Reference implementation of :func:`evaluateDb_typos`, comparing all pairs
+		of tags (see :func:`phdb.core.typos.findTyposReference`). Kept for
+		equivalence tests.
+
+		:parameter db: Path to the database.
+		:type db: str.
+		:parameter tolerance: the percentage of similarity between two tags to 
+		  be considered a typo.
+		:type tolerance: int.
+		:returns: [[(str,int),(str,int)],] -- typoed tags and their pair as tuple 
+		  containing the number of occurences
+		"""
+		command = TAG_COUNTS[self.hasTagIds()]
+		col_names, rows = self._stream(command)
+		return typos.findTyposReference(list(rows), tolerance)
 
 	def evaluateDb_validTag (self, threshold):
 		"""Evaluates an :ref:idb for inconsistent tags (have too few entries associated).
@@ -520,9 +1664,9 @@ class Connection():
 		:type threshold: int.
 		:returns: [(str,int),] -- invalid tags and their count
 		"""
-		command = "SELECT Tag, Count(*) FROM Tags__Entries GROUP BY Tag;"
-		self.cursor.execute(command)        
-		self.connection.commit()
+		command = TAG_COUNTS[self.hasTagIds()]
+		self._run(command)        
+		self.commit()
 		col_names = [cn[0] for cn in self.cursor.description]
 		rows = self.cursor.fetchall()
 		invalidTags = []
@@ -531,6 +1675,183 @@ class Connection():
 				invalidTags.append(row)
 		return invalidTags
 
+class ConnectionRegistry():
+	"""Hands out long-lived connections to databases, one per database and thread,
+	so that consecutive queries keep SQLite's page and statement caches. Counts how
+	many requests were served by an already open connection.
+	"""
+	def __init__(self):
+		self.hits   = 0
+		self.misses = 0
+		self._local = threading.local()
+		self._open  = []
+		self._lock  = threading.Lock()
+
+	def get(self, db, snapshot = False):
+		"""Returns the connection to `db` owned by the calling thread.
+
+		:parameter db: Path to the database.
+		:type db: str.
+		:parameter snapshot: If `True`, returns a connection to an in-memory snapshot
+		  of the database instead (see :class:`Connection`).
+		:type snapshot: bool.
+		:returns: :class:`Connection`
+		"""
+		connections = self._local.__dict__.setdefault('connections', {})
+		key = (db, bool(snapshot))
+		if key in connections:
+			self.hits += 1
+			return connections[key]
+		self.misses += 1
+		connection = Connection(db, snapshot = snapshot)
+		connections[key] = connection
+		with self._lock:
+			self._open.append(connection)
+		return connection
+
+	def close(self):
+		"""Closes all connections handed out so far."""
+		with self._lock:
+			for connection in self._open:
+				try:
+					connection.close()
+				except lite.ProgrammingError:
+					pass # owned by another thread, closed when collected
+			self._open = []
+		self._local = threading.local()
+
+	def stats(self):
+		"""Returns the usage statistics.
+
+		:returns: {str:int} -- `hits`, `misses` and `open` connections.
+		"""
+		return {'hits':self.hits, 'misses':self.misses, 'open':len(self._open)}
+
+def getConnection(variables):
+	"""Returns the connection passed in a variable dictionary under `connection`
+	(e.g. by an interface to a backend), otherwise opens a new one to the database
+	under `db`.
+
+	:parameter variables: Dictionary with query variables.
+	:type variables: {str:}
+	:returns: :class:`Connection`
+	"""
+	if variables.get('connection'):
+		return variables['connection']
+	return Connection(variables['db'])
+
+def _resolveReplacements(replacePairs):
+	"""Helper. Turns an ordered list of replacements into an equivalent mapping which
+	can be applied at once. Replacing an item with itself has no effect."""
+	mapping = []
+	for old, new in replacePairs:
+		if old == new or any(x[0] == old for x in mapping):
+			continue # nothing to replace
+		mapping = [(x[0], new if x[1] == old else x[1]) for x in mapping]
+		mapping.append((old, new))
+	return [x for x in mapping if x[0] != x[1]]
+
+def _copyDb(path, target):
+	"""Helper. Copies a database file into an empty connection, e.g. to memory. Uses
+	the backup API where the :mod:`sqlite3` module has it (Python 3.7 and newer).
+	Otherwise the file is attached and its tables, the shadow tables of its virtual
+	tables, indexes, views and triggers are copied within one read transaction, so
+	that the copy is consistent even while another process writes the file.
+
+	:parameter path: Path to the database.
+	:type path: str.
+	:parameter target: The connection to copy into.
+	:type target: :class:`sqlite3.Connection`
+	"""
+	if hasattr(target, 'backup'):
+		source = lite.connect(path)
+		source.backup(target)
+		source.close()
+		return
+	isolation = target.isolation_level
+	target.isolation_level = None
+	target.execute("ATTACH DATABASE ? AS disk", (path,))
+	try:
+		target.execute("BEGIN")
+		objects = target.execute("SELECT type, name, sql FROM disk.sqlite_master \
+			WHERE sql IS NOT NULL AND name NOT LIKE 'sqlite_%'").fetchall()
+		virtual = [x[1] for x in objects if x[2].upper().startswith('CREATE VIRTUAL')]
+		def shadowsOf(table):
+			return [x[1] for x in objects if x[0] == 'table' and x[1].startswith(table + '_')]
+		shadows = [t for v in virtual for t in shadowsOf(v)]
+		for type, name, sql in objects:
+			if type == 'table' and not name in virtual and not name in shadows:
+				target.execute(sql)
+				_copyTable(target, name)
+		for type, name, sql in objects:
+			if name in virtual: # creates its shadow tables, which are then overwritten
+				target.execute(sql)
+				for table in shadowsOf(name):
+					target.execute("DELETE FROM main." + _quote(table))
+					_copyTable(target, table)
+		for kind in ['index', 'view', 'trigger']:
+			for type, name, sql in objects:
+				if type == kind:
+					target.execute(sql)
+		names = [x[0] for x in target.execute("SELECT name FROM disk.sqlite_master")]
+		if 'sqlite_sequence' in names:
+			target.execute("DELETE FROM main.sqlite_sequence")
+			target.execute("INSERT INTO main.sqlite_sequence SELECT * FROM disk.sqlite_sequence")
+		target.execute("COMMIT")
+	except:
+		target.execute("ROLLBACK")
+		raise
+	finally:
+		target.execute("DETACH DATABASE disk")
+		target.isolation_level = isolation
+	if 'sqlite_stat1' in names:
+		target.execute("ANALYZE main")
+
+#actions the authorizer of a snapshot denies, unless on the temporary database
+_WRITES = [lite.SQLITE_INSERT, lite.SQLITE_UPDATE, lite.SQLITE_DELETE, lite.SQLITE_ALTER_TABLE,
+	lite.SQLITE_CREATE_TABLE, lite.SQLITE_CREATE_INDEX, lite.SQLITE_CREATE_VIEW,
+	lite.SQLITE_CREATE_TRIGGER, lite.SQLITE_DROP_TABLE, lite.SQLITE_DROP_INDEX,
+	lite.SQLITE_DROP_VIEW, lite.SQLITE_DROP_TRIGGER, lite.SQLITE_REINDEX,
+	lite.SQLITE_ANALYZE, lite.SQLITE_ATTACH]
+
+def _readOnly(action, arg1, arg2, dbName, source):
+	"""Helper. Authorizer of snapshots: denies all changes, except to temporary
+	tables. Unlike `PRAGMA query_only`, it allows the temporary tables used by the
+	`bitmap` filter engine."""
+	if action == lite.SQLITE_PRAGMA and arg1 == 'writable_schema':
+		return lite.SQLITE_DENY
+	if action == lite.SQLITE_UPDATE and arg1 == 'sqlite_master':
+		return lite.SQLITE_OK # reported when preparing pragma_table_info, see _hasColumn
+	if action in _WRITES and dbName != 'temp':
+		return lite.SQLITE_DENY
+	return lite.SQLITE_OK
+
+def _copyTable(target, table):
+	"""Helper. Copies the rows of a table of the attached database `disk`."""
+	target.execute("INSERT INTO main." + _quote(table) + " SELECT * FROM disk." + _quote(table))
+
+def _quote(name):
+	"""Helper. Quotes an SQL identifier."""
+	return '"' + name.replace('"', '""') + '"'
+
+def _opensTransaction(command):
+	"""Helper. Python 2 opens a transaction implicitly only before data changes."""
+	words = command.split(None, 1)
+	return bool(words) and words[0].upper() in ['INSERT', 'UPDATE', 'DELETE', 'REPLACE']
+
+def _rowSize(row):
+	"""Helper. Estimates the memory used by a row of a query result, in bytes."""
+	return sys.getsizeof(row) + sum(sys.getsizeof(v) for v in row)
+
+def _formatPlan(rows):
+	"""Helper. Formats the rows of `EXPLAIN QUERY PLAN` as lines indented by depth."""
+	depth = {0 : -1}
+	lines = []
+	for row in rows:
+		depth[row[0]] = depth.get(row[1], -1) + 1
+		lines.append('  ' * depth[row[0]] + row[-1])
+	return lines
+
 def _colsListToStr(prefix, colLst, default):
 	"""Helper. Column list to string for query."""
 	string = ''
@@ -542,23 +1863,44 @@ def _colsListToStr(prefix, colLst, default):
 		string = default
 	return string
 
-def _tagsListToStr(tagLst):
-	"""Helper. Tag list to string for query."""
-	string = ''
-	for tag in tagLst:
-		string = string + "'" + tag + "', "
-	string = string[:-2]
-	return string
+def _hasRecursiveCte():
+	"""Helper. Recursive common table expressions need SQLite 3.8.3."""
+	return lite.sqlite_version_info >= (3, 8, 3)
 
-def _srcListToStr(column, srcList):
-	"""Helper. Sources list to string for query."""
-	string = ''
+def _jsonList(column):
+	"""Helper. SQL expression converting a comma-separated list to a JSON array."""
+	return "'[\"' || replace(replace(replace(" + column + ", '\\', '\\\\'), " \
+		+ "'\"', '\\\"'), ',', '\",\"') || '\"]'"
+
+def _prefix(schema):
+	"""Helper. The prefix of the tables of a database in the queries."""
+	return '' if schema == 'main' else schema + '.'
+
+def _union(selects):
+	"""Helper. Combines the same query run on several databases into one statement,
+	with the name of the database as the first column of each row.
+
+	:parameter selects: Pairs of database name and query.
+	:type selects: [(str,:class:`phdb.core.querybuilder.Query`),]
+	:returns: str, (str,) -- the SQL text and its parameters.
+	"""
+	query = Query()
+	for i, (schema, select) in enumerate(selects):
+		text, params = select.build()
+		query.add(("\nUNION ALL\n" if i else "") + "SELECT ? AS " + DATABASE \
+			+ ", * FROM (" + text + "\n\t)", [schema] + list(params))
+	return query.add(";").build()
+
+def _taggedColumn(cached):
+	"""Helper. The aggregated tags column of the entries queries."""
+	if cached:
+		return "e." + TAGGED + " AS " + TAGGED
+	return "GROUP_CONCAT(distinct t.Tag) AS " + TAGGED
+
+def _addSources(query, column, srcList):
+	"""Helper. Restricts a query to a list of sources, if given."""
 	if srcList:
-		string = "AND "+column+" IN ('"
-		for src in srcList:
-			string = string + src + "','"
-		string = string[:-2] + ")"
-	return string
+		query.add("AND ").add(*inList(column, srcList))
 
 def completeCommand(table, columns):
 	"""Helper for completing SQL statements"""
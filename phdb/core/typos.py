@@ -0,0 +1,101 @@
+"""
+.. module:: phdb.core.typos
+   :platform: Unix
+   :synopsis: Finds groups of similar tags (typos) without comparing all pairs.
+
+Tags are compared with :class:`difflib.SequenceMatcher`, as in the reference
+implementation :func:`findTyposReference`, but only for candidate pairs:
+
+ * candidates share at least one character bigram of the tags padded with `^` and
+   `$`, found through an inverted index. Two strings sharing no such bigram have a
+   ratio below 2/3, so for tolerances above it no similar pair is missed.
+ * candidates pass the length bound and the character-count bound (the values of
+   `real_quick_ratio` and `quick_ratio`), which are upper bounds of the ratio.
+
+.. moduleauthor:: George Ungureanu <ugeorge@kth.se>
+
+"""
+
+import bisect
+import collections
+import difflib
+
+def findTypos(rows, tolerance):
+	"""Groups similar tags. Each tag, in the given order, is grouped with all the
+	following, not yet grouped tags whose similarity to it is at least `tolerance`.
+
+	:parameter rows: tags and their number of occurrences.
+	:type rows: [(str,int),]
+	:parameter tolerance: the percentage of similarity between two tags to
+	  be considered a typo.
+	:type tolerance: float.
+	:returns: [[(str,int),(str,int)],] -- groups of rows with more than one tag.
+	"""
+	tags   = [row[0] for row in rows]
+	grams  = [_bigrams(tag) for tag in tags]
+	counts = [collections.Counter(tag) for tag in tags]
+	index  = collections.defaultdict(list)
+	for i, gram in enumerate(grams):
+		for g in gram:
+			index[g].append(i)
+
+	grouped  = [False] * len(tags)
+	typoList = []
+	for i, row in enumerate(rows):
+		if grouped[i]:
+			continue
+		grouped[i] = True
+		if tolerance > 2.0 / 3:
+			candidates = set()
+			for g in grams[i]:
+				postings = index[g]
+				candidates.update(postings[bisect.bisect_right(postings, i):])
+			candidates = sorted(candidates)
+		else:
+			candidates = range(i + 1, len(tags))
+
+		currentTypos = [row]
+		for j in candidates:
+			if grouped[j]:
+				continue
+			if _isSimilar(tags[i], tags[j], counts[i], counts[j], tolerance):
+				currentTypos.append(rows[j])
+				grouped[j] = True
+		if len(currentTypos) > 1:
+			typoList.append(currentTypos)
+	return typoList
+
+def findTyposReference(rows, tolerance):
+	"""Reference implementation of :func:`findTypos`, with the same arguments and
+	result, comparing all pairs of tags. Kept for equivalence tests."""
+	grouped  = [False] * len(rows)
+	typoList = []
+	for i, row in enumerate(rows):
+		if grouped[i]:
+			continue
+		grouped[i] = True
+		currentTypos = [row]
+		for j in range(i + 1, len(rows)):
+			if not grouped[j] and \
+					difflib.SequenceMatcher(None, row[0], rows[j][0]).ratio() >= tolerance:
+				currentTypos.append(rows[j])
+				grouped[j] = True
+		if len(currentTypos) > 1:
+			typoList.append(currentTypos)
+	return typoList
+
+def _isSimilar(a, b, countA, countB, tolerance):
+	"""Helper. Cheap upper bounds first, then :func:`difflib.SequenceMatcher.ratio`."""
+	length = len(a) + len(b)
+	if not length:
+		return True
+	if 2.0 * min(len(a), len(b)) / length < tolerance:
+		return False
+	if 2.0 * sum((countA & countB).values()) / length < tolerance:
+		return False
+	return difflib.SequenceMatcher(None, a, b).ratio() >= tolerance
+
+def _bigrams(tag):
+	"""Helper. The set of character bigrams of a padded tag."""
+	padded = '^' + tag + '$'
+	return set(padded[k:k+2] for k in range(len(padded) - 1))
@@ -0,0 +1,70 @@
+"""
+.. module:: phdb.core.versioned
+   :platform: Unix
+   :synopsis: Base class for in-memory structures derived from a database.
+
+The structures hold their own connection, used only for loading and for polling
+`PRAGMA data_version`, which changes whenever another connection commits changes
+to the database. They are rebuilt only then, or when the database file was replaced.
+The structures are shared by all threads, so their own connection may be used from
+any thread, one at a time.
+
+.. moduleauthor:: George Ungureanu <ugeorge@kth.se>
+
+"""
+
+import os
+import threading
+import sqlite3 as lite
+
+class VersionedCache():
+	"""In-memory structure loaded from a database and reloaded when it changes.
+	Subclasses implement :func:`_load`.
+
+	:parameter db: Path to the database, or an open connection, which is then
+	  shared and not closed by this structure.
+	:type db: str or :class:`sqlite3.Connection`
+	"""
+	def __init__(self, db):
+		self._owned   = not isinstance(db, lite.Connection)
+		self._db      = db
+		self._con     = self._connect() if self._owned else db
+		self._lock    = threading.RLock()
+		self._file    = self._fileId()
+		self._version = None
+
+	def __del__(self):
+		if self._owned:
+			self._con.close()
+
+	def refresh(self):
+		"""Reloads the structure if the database changed since the last load.
+
+		:returns: bool -- `True` if the structure was reloaded.
+		"""
+		with self._lock:
+			if self._owned and self._fileId() != self._file:
+				self._con.close()
+				self._con     = self._connect()
+				self._file    = self._fileId()
+				self._version = None
+			version = self._con.execute("PRAGMA data_version").fetchone()[0]
+			if version == self._version:
+				return False
+			self._load()
+			self._version = version
+			return True
+
+	def _connect(self):
+		"""Helper. Opens the own connection, usable from any thread."""
+		return lite.connect(self._db, check_same_thread = False)
+
+	def _fileId(self):
+		"""Helper. Identifies the database file, which may be deleted and created again."""
+		if self._owned and os.path.isfile(self._db):
+			stat = os.stat(self._db)
+			return (stat.st_dev, stat.st_ino)
+		return None
+
+	def _load(self):
+		raise NotImplementedError
@@ -28,17 +28,28 @@ class Frontend():
 	:type form: str.
 	:parameter path: Input path.
 	:type path: str.
+	:parameter workers: Number of processes parsing the input in parallel. By
+	  default the PHDB_JOBS environment variable, or 1.
+	:type workers: int.
 
 	.. note::
 	   All new frontends have to comply with this API.
 	"""
-	def __init__(self, connection, form, path):
-		self._front = plain.TextParser(connection, path)
+	def __init__(self, connection, form, path, workers = None):
+		self._front = plain.TextParser(connection, path, workers)
 	
 	def harvest(self):
 		'''Start parsing'''
 		self._front.harvest()	
 
+	def update(self):
+		'''Start parsing only the new or changed inputs
+
+		:returns: {str:int} -- the number of `new`, `changed`, `unchanged` and
+		  `removed` files.
+		'''
+		return self._front.update()
+
 	def harvestFile(self, filename, db):
 		'''Start parsing file'''
 		self._front.harvestFile(filename)
@@ -9,7 +9,11 @@
 
 import os
 import re
+import hashlib
 import logging
+import itertools
+import multiprocessing
+import cStringIO
 
 try:
 	confPath = os.path.join(os.getenv('PHDB_CFG_PATH'), "logger.conf")
@@ -20,6 +24,13 @@ logger = logging.getLogger(__name__)
 
 import phdb.tools.utils as utils
 
+#default number of worker processes parsing the input files, 1 parses them in the
+#process writing the database. Overridden by the PHDB_JOBS environment variable
+WORKERS = 1
+
+#number of entries written at once by a parallel harvest, in one transaction
+WRITE_BATCH = 4096
+
 #TODO: entry post-analysis
 class TextParser():
 	"""Plain text frontend parser.
@@ -28,107 +39,260 @@ class TextParser():
 	:type context: defined in :mod:`phdb.core`
 	:parameter path: Input path.
 	:type path: str.
+	:parameter workers: Number of worker processes parsing the files. With more
+	  than one, the files are parsed in parallel and written in large batches, with
+	  the same results.
+	:type workers: int.
 
 	"""
-	def __init__(self, connection, path):
+	def __init__(self, connection, path, workers = None):
 		self.logger = logging.getLogger('phdb.frontend.text')
 		self.path = path
 		self.con = connection
-		self.bibref = ''
-		self._genTags = []
+		self.workers = workers or int(os.getenv("PHDB_JOBS", WORKERS))
 
 	def harvest(self):
-		'''Start parsing all PhDB files from a folder'''
+		'''Start parsing all PhDB files from a folder. Files harvested before are
+		harvested again, replacing their sources.'''
 		self.logger.debug("Searching folder: " + self.path)
-		for filename in os.listdir (self.path):
-			self.logger.debug("Checking file: " + filename)
-			self.harvestFile(os.path.join(self.path,filename))
+		manifest = self.con.getManifest(self.path)
+		paths    = [os.path.join(self.path,x) for x in os.listdir (self.path)]
+		self._harvest([(x, manifest.get(os.path.abspath(x))) for x in paths if _isInput(x)])
+
+	def update(self):
+		'''Parse only the files of the folder which are new or changed since they were
+		last harvested, and remove the sources of the files which were deleted. A file
+		whose size and modification time are unchanged is not even read.
+
+		:returns: {str:int} -- the number of `new`, `changed`, `unchanged` and `removed`
+		  files.
+		'''
+		self.logger.debug("Updating from folder: " + self.path)
+		manifest = self.con.getManifest(self.path)
+		summary  = {'new':0, 'changed':0, 'unchanged':0, 'removed':0}
+		paths    = [os.path.join(self.path,x) for x in os.listdir (self.path)]
+		paths    = [x for x in paths if _isInput(x)]
+		# removed first, in case a source moved to another file
+		for path in set(manifest) - set(os.path.abspath(x) for x in paths):
+			self.logger.debug("Removing file: " + path)
+			self.con.removeFile(path)
+			self.con.commit()
+			summary['removed'] += 1
+		files = []
+		for path in paths:
+			known = manifest.get(os.path.abspath(path))
+			stat  = os.stat(path)
+			if known and known[:2] == (stat.st_size, stat.st_mtime):
+				summary['unchanged'] += 1
+			else:
+				files.append((path, known))
+		harvested = self._harvest(files, onlyChanged = True)
+		for path, known in files:
+			if path not in harvested:
+				summary['unchanged'] += 1
+			else:
+				summary['changed' if known else 'new'] += 1
+		if summary['changed'] or summary['removed']:
+			self.con.removeUnusedTags()
+		return summary
 
 	def harvestFile(self, filename):
 		'''Parse a PhDB text file'''
-		if os.path.isfile(filename) and '~' not in filename and '#' not in filename:
-			with open(filename, 'r') as f:
-				if "#!phdb" in f.readline():
-					self.logger.debug("Found phdb file: " + filename)
-					self.__parse_header(f)
-					self.__parse_entries(f)
-					self.con.commit()
-
-	def __parse_header(self, f):
-		'''Add the source info'''
-		header              = _strHeaderF(f)
-		self.bibref, header = _strBetween(header, 'BIBREF:', '\n')
-		about, header       = _strBetween(header, 'ABOUT:', '\n')
-		self.con.insertOrReplace(  "Source", "(BibRef, About)", [(self.bibref, about),])
-		self.logger.debug("Added source: " + self.bibref)
-
-		xrefs, header = _strBetween(header, 'REFERENCES:', '\n')
-		if xrefs.strip():
-			newXrefs = [(self.bibref, x.strip(),) for x in utils.splitBy(xrefs,',')]
-			self.con.insert( "Xrefs", "(RefBy, RefTo)", newXrefs)
-		
-		gTags, header = _strBetween(header, 'TAGS:', '\n')
-		self.genTags = map(str.strip, utils.splitBy(gTags,','))
-		if gTags.strip():
-			generalTags = [(x.strip(),) for x in self.genTags]
-			self.con.insertOrIgnore( "Tags", "(Tag)", generalTags)
-		self.logger.debug("Found general tags: " + str(self.genTags))
-
-	def __parse_entries(self, f):
-		'''Add the entries for a source'''
+		path = os.path.abspath(filename)
+		if _isInput(filename):
+			self._harvest([(filename, self.con.getManifest(os.path.dirname(path)).get(path))])
+
+	def _harvest(self, files, onlyChanged = False):
+		'''Parses files and writes them to the database together with their manifest
+		records, replacing the sources previously harvested from them. Each file is
+		written in its own transaction, or with more workers, in batches of
+		:data:`WRITE_BATCH` entries.
+
+		:parameter files: Paths and manifest records (or `None`) of the files.
+		:type files: [(str, tuple)]
+		:parameter onlyChanged: Skip the files whose contents did not change.
+		:type onlyChanged: bool.
+		:returns: set -- the paths of the files harvested.
+		'''
+		pool = None
+		if self.workers > 1 and len(files) > 1:
+			pool   = multiprocessing.Pool(min(self.workers, len(files)))
+			parsed = pool.imap(parseFile, [path for path, known in files], chunksize = 4)
+		else:
+			parsed = itertools.imap(parseFile, [path for path, known in files])
+		harvested, written = set(), set()
+		batch, entries = [], 0
+		try:
+			for (path, known), (size, mtime, digest, record) in itertools.izip(files, parsed):
+				if onlyChanged and known and known[2] == digest:
+					batch.append(((path, size, mtime, digest, known[3]), None, None))
+					continue
+				harvested.add(path)
+				bibref = record['bibref'] if record else None
+				batch.append(((path, size, mtime, digest, bibref), known and known[3], record))
+				entries += len(record['entries']) if record else 0
+				if not pool or entries >= WRITE_BATCH:
+					self._write(batch, written)
+					batch, entries = [], 0
+			self._write(batch, written)
+		finally:
+			if pool:
+				pool.terminate()
+				pool.join()
+		return harvested
+
+	def _write(self, batch, written):
+		'''Writes parsed files in a single explicit transaction. Their sources, entries,
+		tags, references and tag associations are buffered and written with one
+		`executemany` per table.
+
+		:parameter batch: For each file, its manifest record, the BibRef of the source
+		  previously harvested from it (or `None`) and the parsed contents (see
+		  :func:`parseFile`).
+		:type batch: [(tuple, str, dict)]
+		:parameter written: BibRefs of the sources written so far by this harvest,
+		  which are not removed anymore as previous sources of other files. Updated.
+		:type written: set.
+		'''
+		buf = _Buffer()
+		self.con.hasTagIds() # looked up before the transaction starts
+		try:
+			self.con.begin()
+			for manifest, removed, record in batch:
+				if removed and removed not in written:
+					self.con.removeSource(removed)
+				if not record:
+					continue
+				bibref = record['bibref']
+				if bibref in buf.bibrefs: # written again by a later file, which replaces it
+					self._flush(buf)
+					buf = _Buffer()
+				buf.add(record)
+				written.add(bibref)
+				self.con.removeSource(bibref) # e.g. harvested before the manifest existed
+			self._flush(buf)
+			self.con.recordFiles([manifest for manifest, removed, record in batch])
+			self.con.commit()
+		except:
+			self.con.rollback()
+			raise
+
+	def _flush(self, buf):
+		'''Helper. Writes the buffered sources, entries, tags, references and tag
+		associations. The ids of the entries are assigned in bulk.'''
+		self.con.insertOrReplace(  "Source", "(BibRef, About)", buf.sources)
+		ids = self.con.insertEntries(buf.entries)
+		self.con.insertOrIgnore( "Tags", "(Tag)", buf.tags)
+		self.con.insertOrIgnore( "Xrefs", "(RefBy, RefTo)", buf.xrefs)
+		self.con.insertTagLinks([(entryId, tag) for entryId, tags in zip(ids, buf.links)
+		                         for tag in tags])
+		self.logger.debug("Added sources: " + ', '.join(buf.bibrefs))
+
+
+class _Buffer():
+	"""Helper. The rows of parsed files waiting to be written, per table."""
+	def __init__(self):
+		self.bibrefs = set()
+		self.sources, self.entries, self.tags, self.xrefs, self.links = [], [], [], [], []
+
+	def add(self, record):
+		bibref = record['bibref']
+		self.bibrefs.add(bibref)
+		self.sources.append((bibref, record['about']))
+		self.tags  += [(tag,) for tag in record['tags']]
+		self.xrefs += [(bibref, ref) for ref in record['xrefs']]
+		for at, info, label, cites, crefs, entryTags in record['entries']:
+			self.entries.append((bibref, at, info, label, cites, crefs))
+			self.links.append(entryTags)
+
+
+def parseFile(filename):
+	"""Reads and parses a PhDB text file, without touching the database. Runs in the
+	worker processes of a parallel harvest.
+
+	:parameter filename: Path of the file.
+	:type filename: str.
+	:returns: int, float, str, dict -- the size, modification time and SHA-1 of the
+	  file, and its parsed contents, or `None` if it is not a PhDB file. These are
+	  the `bibref` and `about` of its source, the sources it refers to (`xrefs`), the
+	  tags it introduces (`tags`) and its `entries`, each as (at, info, label, cites,
+	  crefs, tags).
+	"""
+	stat = os.stat(filename)
+	with open(filename, 'r') as f:
+		data = f.read()
+	digest = hashlib.sha1(data).hexdigest()
+	record = None
+	f = cStringIO.StringIO(data)
+	if "#!phdb" in f.readline():
+		logger.debug("Found phdb file: " + filename)
+		record = _parseHeader(f)
 		entry,f = _strAfterF(f, 'TAG:')
 		while entry:
-			self.logger.debug("New entry found:")
-			self.__add_new_entry(entry)
+			logger.debug("New entry found:")
+			_parseEntry(record, entry)
 			entry,f = _strAfterF(f, 'TAG:')
+	return stat.st_size, stat.st_mtime, digest, record
+
+def _parseHeader(f):
+	'''Parses the source info'''
+	header         = _strHeaderF(f)
+	bibref, header = _strBetween(header, 'BIBREF:', '\n')
+	about, header  = _strBetween(header, 'ABOUT:', '\n')
+	record = {'bibref':bibref, 'about':about, 'xrefs':[], 'tags':[], 'entries':[]}
+
+	xrefs, header = _strBetween(header, 'REFERENCES:', '\n')
+	if xrefs.strip():
+		record['xrefs'] += [x.strip() for x in utils.splitBy(xrefs,',')]
+	
+	gTags, header = _strBetween(header, 'TAGS:', '\n')
+	record['genTags'] = [x for x in map(str.strip, utils.splitBy(gTags,',')) if x]
+	record['tags'] += record['genTags']
+	logger.debug("Found general tags: " + str(record['genTags']))
+	return record
+
+def _parseEntry(record, entry):
+	'''Parses an entry of a source'''
+	bibref       = record['bibref']
+	tags, entry  = _strBetween(entry, 'TAG:', '\n')
+	at, entry    = _strBetween(entry, 'AT:', '\n')
+	label, entry = _strBetween(entry, 'LABEL:', '\n')
+	logger.debug(str(tags))
+
+	stripped_tags = [tag.strip() for tag in utils.splitBy(tags,',') if tag.strip()]
+	record['tags'] += stripped_tags
+
+	if label:
+		label = bibref + '/' + label
+
+	refs = re.findall(r'\[\[(.+?)\]\]', entry) #find in-text references of type [[foo]]
+	cites = []
+	crefs = []
+	for ref in refs:
+		if ref.startswith('Ref:'):
+			newref = utils.strAfter(ref,'Ref:')
+			cites.append(newref)
+			record['xrefs'].append(newref)
+			logger.debug("Found reference to: " + newref)
+		elif ref.startswith('Cref:'):
+			cref = utils.strAfter(ref,'Cref:')
+			if  '/' in cref:
+				newref = utils.splitBy(cref,'/')[0]
+				record['xrefs'].append(newref)
+				logger.debug("Found reference to: " + newref)
+			else:
+				cref = bibref + '/' + cref 
+			crefs.append(cref)
+	citestr = ','.join(cites)
+	crefstr = ','.join(crefs)
+
+	record['entries'].append((at, entry, label, citestr, crefstr,
+	                          stripped_tags + record['genTags']))
 
-	def __add_new_entry(self, entry):
-		'''Add a new entry to this source'''
-		tags, entry  = _strBetween(entry, 'TAG:', '\n')
-		at, entry    = _strBetween(entry, 'AT:', '\n')
-		label, entry = _strBetween(entry, 'LABEL:', '\n')
-		self.logger.debug(str(tags))
-
-		stripped_tags = []
-		for tag in utils.splitBy(tags,','):
-			self.con.insertOrIgnore( "Tags", "(Tag)", [(tag.strip(),),])
-			stripped_tags.append(tag.strip())
-
-		if label:
-			label = self.bibref + '/' + label
-
-		refs = re.findall(r'\[\[(.+?)\]\]', entry) #find in-text references of type [[foo]]
-		cites = []
-		crefs = []
-		for ref in refs:
-			if ref.startswith('Ref:'):
-				newref = utils.strAfter(ref,'Ref:')
-				cites.append(newref)
-				self.con.insertOrIgnore( "Xrefs", "(RefBy, RefTo)", [(self.bibref, newref),])
-				self.logger.debug("Added new reference to: " + newref)
-			elif ref.startswith('Cref:'):
-				cref = utils.strAfter(ref,'Cref:')
-				if  '/' in cref:
-					newref = utils.splitBy(cref,'/')[0]
-					self.con.insertOrIgnore( "Xrefs", "(RefBy, RefTo)", [(self.bibref, newref),])
-					self.logger.debug("Added new reference to: " + newref)
-				else:
-					tmp = cref
-					cref = self.bibref + '/' + cref 
-					entry.replace('Cref:'+tmp, 'Cref:'+cref)
-				crefs.append(cref)
-		citestr = ','.join(cites)
-		crefstr = ','.join(crefs)
-		
-
-		entryId = str(self.con.insertUnique( "Entries", "(Source, At, Info, Label, Cites, Crefs)", 
-					(self.bibref, at, entry, label, citestr, crefstr)))
-		self.logger.debug("Created entry #" + entryId)
-		for tag in stripped_tags:
-			self.con.insert( "Tags__Entries", "(Entry, Tag)", [(entryId, tag),])
-		for tag in self.genTags:
-			self.con.insert( "Tags__Entries", "(Entry, Tag)", [(entryId, tag),])
 
+def _isInput( path ):
+	"""Checks if a path is a candidate input file, i.e. not a backup or lock file."""
+	return os.path.isfile(path) and '~' not in path and '#' not in path
 
 def _strAfterF( f, key ):
 	"""Searches for the first occurrence of a keyword in a text file and
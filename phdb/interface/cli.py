@@ -31,6 +31,8 @@ from phdb.frontend import Frontend
 from phdb.dumper import DbDumper
 import phdb.tools.utils as utils
 import phdb.core.sqlite3cmd as dbapi
+import phdb.core.graph as graph
+from phdb.tools.settings import PROFILES
 
 
 class ConsoleContext(object):
@@ -46,6 +48,8 @@ class ConsoleContext(object):
 	 * core history
 	 * active menu
 	 * all the valid tags in the currently-loaded database (for auto-completion)/
+	 * whether the queries run on an in-memory snapshot of the database
+	 * the other databases attached to it, queried together with it
 	 * context setters/dumpers
 
 	.. note::
@@ -58,6 +62,8 @@ class ConsoleContext(object):
 		self.confPath = settings.configPath
 
 		dbFile        = ''
+		snapshot      = False
+		attached      = []
 		self.vTags    = []
 		self.hist     = []
 		self.active   = ''
@@ -65,29 +71,98 @@ class ConsoleContext(object):
 
 		try :
 			with open(self.confFile) as f:
-				dbFile, self.vTags, self.active = pickle.load(f)
+				state = pickle.load(f)
+				dbFile, self.vTags, self.active = state[:3]
+				snapshot = state[3] if len(state) > 3 else False
+				attached = state[4] if len(state) > 4 else []
 		except Exception, e:
 			log.debug(str(e.__class__) + " " + str(e.args))
 
 		self.db = ''
+		self.snapshot = False
+		self.attached = []
+		self.connections = dbapi.ConnectionRegistry()
 		if (settings.db):
 			self.use_db(settings.db)
 		elif dbFile:
-			self.use_db(dbFile)
+			self.use_db(dbFile, snapshot)
+			for alias, path in attached:
+				self.attach_db(path, alias)
 
-	def use_db(self,args):
+	def use_db(self, args, snapshot = False):
 		"""Database setter. It sets all context (e.g. valid tags) according to the database. 
 
 		:param args: database.
 		:type args: str.
+		:param snapshot: run the queries on an in-memory snapshot of the database.
+		:type snapshot: bool.
 		"""
 		if dbapi.isDatabase(args):
+			self.connections.close()
 			self.db = args
-			dbCon = dbapi.Connection(args)
-			self.vTags = dbCon.getFrom('Tags')
+			self.snapshot = snapshot
+			self.attached = []
+			self.vTags = self.connection().getFrom('Tags', ['Tag'])
 		else:
 			log.error("Database does not exist!")
 
+	def attach_db(self, path, alias):
+		"""Attaches another database to the loaded one. The sources and entries queries
+		then return the rows of all of them, in one statement.
+
+		:param path: database.
+		:type path: str.
+		:param alias: name of the database in the query results.
+		:type alias: str.
+		"""
+		if not dbapi.isDatabase(path):
+			log.error("Database does not exist!")
+			return
+		try:
+			self.connection().attach(os.path.abspath(path), alias)
+		except (ValueError, dbapi.lite.OperationalError) as e:
+			log.error("Cannot attach '" + path + "': " + str(e))
+			return
+		self.attached.append((alias, os.path.abspath(path)))
+
+	def detach_db(self, alias):
+		"""Detaches a database attached with :func:`attach_db`.
+
+		:param alias: name of the database.
+		:type alias: str.
+		"""
+		if not alias in [x[0] for x in self.attached]:
+			log.error("No database is attached as '" + alias + "'!")
+			return
+		self.attached = [x for x in self.attached if x[0] != alias]
+		self.connections.close()
+
+	def connection(self, writable = False):
+		"""Returns the long-lived connection to the loaded database.
+
+		:param writable: return a connection to the database file, even if the
+		  queries run on a snapshot. Snapshots have no other databases attached.
+		:type writable: bool.
+		:returns: :class:`phdb.core.sqlite3cmd.Connection`
+		"""
+		dbCon = self.connections.get(self.db, self.snapshot and not writable)
+		for alias, path in ([] if dbCon.snapshot else self.attached):
+			if not alias in dbCon.schemas():
+				dbCon.attach(path, alias)
+		return dbCon
+
+	def refresh(self):
+		"""Re-synchronizes the snapshot of the loaded database with its file."""
+		if not self.snapshot:
+			log.info("The queries run on the database file, nothing to refresh.")
+			return
+		self.connection().refresh()
+		self.vTags = self.connection().getFrom('Tags', ['Tag'])
+
+	def close(self):
+		"""Closes all connections to the loaded database."""
+		self.connections.close()
+
 	def dump(self):
 		"""Dumps the context in PHDB_CFG_PATH using :mod:`pickle`
 
@@ -95,7 +170,7 @@ class ConsoleContext(object):
 		:type args: str.
 		"""
 		with open(self.confFile, 'w') as f:
-			pickle.dump([self.db, self.vTags, self.active], f)		
+			pickle.dump([self.db, self.vTags, self.active, self.snapshot, self.attached], f)		
 		
 
 class Console(cmd.Cmd):
@@ -174,10 +249,97 @@ class Console(cmd.Cmd):
 
 
 	def do_use_db(self,args):
-		'''use_db <database_file> 
-		Loads the given database.
+		'''use_db <database_file> [-snapshot]
+		Loads the given database. With '-snapshot' the database is copied into
+		memory and all queries run on this read-only copy, so they never read the
+		file nor wait for a harvest writing it. Use 'refresh' to copy it again.
+		The db-admin commands always work on the file.
 		'''
-		self.context.use_db(args)	
+		args = args.split()
+		if not args:
+			log.error("Expected a database file!")
+			return
+		self.context.use_db(args[0], '-snapshot' in args[1:])
+
+	def do_attach_db(self, args):
+		"""attach_db [<database_file> <alias>]
+		Attaches another database to the loaded one. The reviews and entries queries
+		then run on all attached databases at once, and their results start with
+		the column 'Db', holding <alias> ('main' for the loaded database). Without
+		arguments, lists the attached databases. Not available with '-snapshot'."""
+		args = args.split()
+		if not args:
+			for alias, path in self.context.attached:
+				print alias.ljust(12), ":", path
+			return
+		if len(args) != 2:
+			log.error("Expected a database file and an alias!")
+			return
+		if self.context.snapshot:
+			log.error("Cannot attach databases to a snapshot!")
+			return
+		self.context.attach_db(args[0], args[1])
+
+	def do_detach_db(self, args):
+		"""detach_db <alias>
+		Detaches a database attached with 'attach_db'."""
+		self.context.detach_db(args.strip())
+	def complete_detach_db(self, text, line, begidx, endidx):
+		return [ x[0] for x in self.context.attached if x[0].startswith(text) ]
+
+	def do_refresh(self, args):
+		"""refresh
+		Copies the database file again into the in-memory snapshot (see 'use_db'),
+		e.g. after a harvest or after changes made from the db-admin menu."""
+		if not dbapi.isDatabase(self.context.db):
+			log.error("No database loaded!")
+			return
+		self.context.refresh()
+
+	def do_connections(self, args):
+		"""Prints how many database connections are open and how often an open
+		connection was reused (hits) instead of opening a new one (misses)."""
+		stats = self.context.connections.stats()
+		print "open:", stats['open'], " hits:", stats['hits'], " misses:", stats['misses']
+
+	def do_cache(self, args):
+		"""cache [clear]
+		Prints how often the results of the reviews and entries queries were served
+		from the result cache of the loaded database (hits) instead of being queried
+		again (misses), and how much memory the cache uses. The cache is emptied
+		automatically whenever the database changes. 'clear' empties it now."""
+		if not dbapi.isDatabase(self.context.db):
+			log.error("No database loaded!")
+			return
+		dbCon = self.context.connection()
+		if args.strip() == 'clear':
+			dbCon.clearResults()
+		stats = dbCon.resultStats()
+		print "results:", stats['results'], " hits:", stats['hits'], \
+			" misses:", stats['misses'], \
+			" size: %.1f / %.1f kB" % (stats['bytes'] / 1024.0, stats['capacity'] / 1024.0)
+
+	def do_stats(self, args):
+		"""stats [count]
+		Prints the slowest of the recent statements run on the loaded database
+		(default 10), with their time, the number of rows they returned or changed
+		and their query plan. A 'SCAN' step not using an index reads a whole table.
+		Queries answered by the result cache (see 'cache') are marked 'cached'."""
+		if not dbapi.isDatabase(self.context.db):
+			log.error("No database loaded!")
+			return
+		try:
+			count = int(args) if args.strip() else 10
+		except ValueError:
+			log.error("The argument should be a number!")
+			return
+		for query in self.context.connection().slowestQueries(count):
+			rows = '-' if query['rows'] is None else str(query['rows'])
+			sql  = ' '.join(query['sql'].split())
+			time = 'cached' if query['cached'] else "%.2f ms" % (query['time'] * 1000)
+			print "%12s %7s rows | %s" % (time, rows, sql[:100])
+			for line in query['plan'] or []:
+				print " " * 26 + "| " + line
 
 	# assumes that _format and formats are members of the child class.
 	# the child class takes care to nullify this method otherwise
@@ -260,6 +422,7 @@ class MainConsole(Console):
 		self.menu['entries']       = EntriesConsole(context)
 		self.menu['reviews']       = ReviewsConsole(context)
 		self.menu['custom-querry'] = CustomConsole(context)
+		self.menu['graph']         = GraphConsole(context)
 		self.menu['db-admin']      = DbAdminConsole(context)
 
 	def preloop(self):
@@ -273,6 +436,7 @@ class MainConsole(Console):
 		Console.postloop(self)
 		print "Exiting PhDB console..."
 		self.context.dump()
+		self.context.close()
 		
 	def do_menu(self, arg):
 		"""Enter a menu."""
@@ -340,7 +504,7 @@ class ReviewsConsole(Console):
 
 		self._sources = []
 		self._columns = []
-		self._format  = ['console',['30']]
+		self._format  = {'format':'console', 'widths':[30], 'flags':[]}
 		self._outfile = utils.getFileName(self.context.db) + '.out'
 		self._valid   = False
 		try :
@@ -413,10 +577,16 @@ class ReviewsConsole(Console):
 
 		print '              GET: reviews'
 		print '[use_db]      FROM', db			
+		for alias, path in self.context.attached:
+			print '[attach_db]     AND', path, 'AS', alias
 		print '[sources]     FOR SOURCES:', sources
 		print '[columns]     SHOWING COLUMNS:', columns
 		print '[format]      PRINTING INFO AS:', form
 		print '[outfile]     INTO FILE:', outfile
+		if dbapi.isDatabase(self.context.db):
+			print '              QUERY PLAN:'
+			for line in self.context.connection().explainSources(self._sources):
+				print '                ', line
 
 		self._validate()
 		if self._valid:
@@ -448,9 +618,10 @@ class ReviewsConsole(Console):
 			log.warn("Query is not valid. Check what is missing with 'show_query' ")
 			return
 
-		backend = Backend(form = self._format, outp = self._outfile)
+		backend = Backend(self._format, self._outfile)
 		backend.writeout(msg = 'reviews', 
 		                 varDict  = {'db'      : self.context.db, 
+		                             'connection' : self.context.connection(),
 		                             'sources' : self._sources,
 		                             'columns' : self._columns})
 
@@ -493,7 +664,8 @@ class EntriesConsole(Console):
 		self._columns  = []
 		self._filterExp = []
 		self._exclTags = []
-		self._format  = ['console',['30']]
+		self._engine   = 'like'
+		self._format  = {'format':'console', 'widths':[30], 'flags':[]}
 		self._outfile = utils.getFileName(self.context.db) + '.out'
 		self._valid   = False
 		try :
@@ -504,7 +676,8 @@ class EntriesConsole(Console):
 				self._exclTags,\
 				self._format,  \
 				self._outfile, \
-				self._valid    = pickle.load(f)
+				self._valid,   \
+				self._engine   = pickle.load(f)
 		except Exception, e:
 			log.debug(str(e.__class__) + " " + str(e.args))
 		self.do__debug('')
@@ -520,7 +693,8 @@ class EntriesConsole(Console):
 					      self._exclTags,\
 						  self._format,  \
 						  self._outfile, \
-						  self._valid], f)
+						  self._valid,   \
+						  self._engine], f)
 
 	def do_sources(self, arg):
 		"""sources [ref1 [ref2...]]
@@ -568,6 +742,25 @@ class EntriesConsole(Console):
 							]
 		return completions
 
+	def do_filter_engine(self, arg):
+		'''filter_engine <engine>
+		Chooses how the 'filter_by' expression is evaluated:
+
+		 * like : (default) matches tag names as substrings, e.g. 'opt' also
+		   matches 'optimization'.
+		 * set  : matches tag names exactly, using the tag index. Wildcards
+		   restrict the match to a prefix ('opt*') or a suffix ('*tion').
+		 * bitmap : same matches as 'set', evaluated on an in-memory index which
+		   is loaded once and reused until the database changes. Fastest for
+		   repeated queries.
+		'''
+		if arg in dbapi.FILTER_ENGINES:
+			self._engine = arg
+		else:
+			log.error("Unrecognized filter engine!")
+	def complete_filter_engine(self, text, line, begidx, endidx):
+		return [ f for f in dbapi.FILTER_ENGINES if f.startswith(text) ]
+
 	def do_outfile(self,arg):
 		'''outfile <file>
 		Output file to store the query results.
@@ -600,11 +793,20 @@ class EntriesConsole(Console):
 
 		print '              GET: entries'	
 		print '[use_db]      FROM', db		
+		for alias, path in self.context.attached:
+			print '[attach_db]     AND', path, 'AS', alias
 		print '[sources]     FROM SOURCES:', sources
 		print '[filter_by]   FILTERED BY:', filterExp
+		print '[filter_engine] USING:', self._engine
 		print '[columns]     SHOWING COLUMNS:', columns
 		print '[format]      PRINTING INFO AS:', form
 		print '[outfile]     INTO FILE:', outfile
+		if dbapi.isDatabase(self.context.db):
+			print '              QUERY PLAN:'
+			plan = self.context.connection().explainEntries(self._filterExp, 
+					self._sources, self._engine)
+			for line in plan:
+				print '                ', line
 
 		self._validate()
 		if self._valid:
@@ -625,24 +827,53 @@ class EntriesConsole(Console):
 			"\n * srcs : " + str(self._sources) +   \
 			"\n * cols : " + str(self._columns) +   \
 			"\n * fexp : " + str(self._filterExp) + \
+			"\n * feng : " + str(self._engine) +    \
 			"\n * frmt : " + str(self._format) +    \
 			"\n * outf : " + str(self._outfile) +   \
 			"\n * val  : " + str(self._valid))
 
 	def do_run(self, arg):
 		'''Executes a valid query. Verify if query is valid with 'show_query' '''
+		self._execute()
+
+	def do_search(self, arg):
+		'''search <terms>
+		Executes the query, keeping only the entries whose info, page or label
+		match <terms>, the most relevant first. The terms follow the SQLite
+		full-text query syntax, e.g.:
+		 * marshmallow*           : words starting with 'marshmallow'
+		 * baby NOT love          : entries with 'baby', but without 'love'
+		 * "have a marshmallow"   : the exact phrase
+		Older databases need 'upgrade_db' (in the 'dbadmin' menu) first.
+		'''
+		if not arg:
+			log.error("No search terms given!")
+			return
+		self._validate()
+		if self._valid and not self.context.connection().hasFullText():
+			log.error("The database has no full-text index. Run 'upgrade_db' first.")
+			return
+		try:
+			self._execute(arg)
+		except dbapi.lite.OperationalError, e:
+			log.error("Search failed: " + str(e))
 
+	def _execute(self, search = None):
+		"""Executes the query built so far, optionally ranked by a full-text search."""
 		self._validate()
 		if not self._valid:
 			log.warn("Query is not valid. Check what is missing with 'show_query' ")
 			return
 
-		backend = Backend(form = self._format, outp = self._outfile)
+		backend = Backend(self._format, self._outfile)
 		backend.writeout(msg = 'entries', 
 		                 varDict  = {'db'      : self.context.db, 
+		                             'connection' : self.context.connection(),
 		                             'sources' : self._sources,
 		                             'columns' : self._columns,
-		                             'filter'  : self._filterExp})
+		                             'filter'  : self._filterExp,
+		                             'engine'  : self._engine,
+		                             'search'  : search})
 
 		
 
@@ -674,7 +905,7 @@ class CustomConsole(Console):
 		Console.preloop(self)
 		log.debug("Entering the custom console...")
 		self._query   = ''
-		self._format  = ['console',['30']]
+		self._format  = {'format':'console', 'widths':[30], 'flags':[]}
 		self._outfile = utils.getFileName(self.context.db) + '.out'
 		try :
 			with open(self.confFile) as f:
@@ -704,7 +935,7 @@ class CustomConsole(Console):
 	def default(self, line):       
 		if line.strip().endswith(';'):
 			self._query = self._query + line.strip()
-			dbCon = dbapi.Connection(self.context.db)
+			dbCon = self.context.connection()
 			col_names, rows = dbCon.qGetCustom(self._query)
 			backend = Backend(self._format, self._outfile)
 			backend.writeout(msg      = 'custom', 
@@ -720,6 +951,136 @@ class CustomConsole(Console):
 		'''
 		self._outfile = os.path.abspath(arg)
 
+class GraphConsole(Console):
+	''' Citation graph menu console.
+
+	:param context:  console context. 
+	:type context: :class:`phdb.interface.cli.ConsoleContext`
+
+	This class contains methods for exploring the citations between the sources
+	(see :mod:`phdb.core.graph`). The graph is loaded once and kept in memory
+	until the database changes.
+	'''
+	def __init__(self,context):
+		"""Class constructor.
+
+		.. note::
+		
+		   Needs to define accepted output formats (`self.formats`) and menu help string
+		   (`self.menuHelp`).
+		"""
+		Console.__init__(self, context)
+		self.formats  = ['plain', 'console']
+		self.menuHelp = "\nCitation graph menu. You can explore which sources cite each other."
+		self.confFile = os.path.join(self.context.confPath,"cliGraph.pickle")
+		self.prompt   = 'PhDB - graph> '
+		log.debug("Initialized graph console...")
+
+	def preloop(self):
+		Console.preloop(self)
+		log.debug("Entering the graph console...")
+		self._format  = {'format':'console', 'widths':[30], 'flags':[]}
+		self._outfile = utils.getFileName(self.context.db) + '.out'
+		try :
+			with open(self.confFile) as f:
+				self._format, \
+				self._outfile = pickle.load(f)
+		except Exception, e:
+			log.debug(str(e.__class__) + " " + str(e.args))
+		self.do__debug('')
+	
+	def postloop(self):
+		Console.postloop(self)
+		log.debug("Exiting the graph console...")
+		with open(self.confFile, 'w') as f:
+			pickle.dump([ self._format, \
+						  self._outfile], f)
+
+	def do__debug(self,args):
+		log.debug("Environment vars:" +    \
+			"\n * db   : " + str(self.context.db) +  \
+			"\n * frmt : " + str(self._format) +   \
+			"\n * outf : " + str(self._outfile))
+
+	def do_outfile(self,arg):
+		'''outfile <file>
+		Output file to store the query results
+		'''
+		self._outfile = os.path.abspath(arg)
+
+	def do_neighbours(self, arg):
+		'''neighbours <bibref> [hops] [direction]
+		Lists the sources reachable from <bibref> by following at most [hops]
+		citations (default 1). [direction] is one of:
+		 * out  : the sources cited by <bibref> (default)
+		 * in   : the sources citing <bibref>
+		 * both : citations in either direction
+		'''
+		args = arg.split()
+		if not args:
+			log.error("Expected a source (BibRef)!")
+			return
+		try:
+			hops = int(args[1]) if len(args) > 1 else 1
+		except ValueError:
+			log.error("The number of hops must be an integer!")
+			return
+		direction = args[2] if len(args) > 2 else 'out'
+		if not direction in graph.DIRECTIONS:
+			log.error("Unrecognized direction! Choose from: " + ', '.join(graph.DIRECTIONS))
+			return
+		try:
+			rows = self._graph().neighbours(args[0], hops, direction)
+		except KeyError:
+			log.error("'" + args[0] + "' is not a source in the database!")
+			return
+		self._write(['BibRef', 'Distance'], rows, len(rows))
+	def complete_neighbours(self, text, line, begidx, endidx):
+		if len(line[:begidx].split()) == 3:
+			return [ d for d in graph.DIRECTIONS if d.startswith(text) ]
+		return []
+
+	def do_cited(self, arg):
+		'''cited [count]
+		Lists the [count] most cited sources (default 20).'''
+		self._write(['BibRef', 'Cited by'], self._graph().degrees('in'), arg)
+
+	def do_citing(self, arg):
+		'''citing [count]
+		Lists the [count] sources citing the most other sources (default 20).'''
+		self._write(['BibRef', 'Cites'], self._graph().degrees('out'), arg)
+
+	def do_pagerank(self, arg):
+		'''pagerank [count]
+		Lists the [count] sources with the highest PageRank (default 20), i.e. the
+		sources cited by many, or by other influential, sources.'''
+		rows = [(bibref, "%.6f" % rank) for bibref, rank in self._graph().pageRank()]
+		self._write(['BibRef', 'PageRank'], rows, arg)
+
+	def do_components(self, arg):
+		'''components [count]
+		Lists the [count] largest groups of sources connected by citations
+		(default 20), regardless of their direction.'''
+		rows = [(len(c), ', '.join(c)) for c in self._graph().components()]
+		self._write(['Size', 'Sources'], rows, arg)
+
+	def _graph(self):
+		"""Helper. The up to date citation graph of the loaded database."""
+		return graph.getGraph(self.context.db)
+
+	def _write(self, header, rows, count = None):
+		"""Helper. Prints the first `count` rows through the backend."""
+		try:
+			count = int(count) if count else 20
+		except ValueError:
+			log.error("The count must be an integer!")
+			return
+		rows = [[str(v) for v in row] for row in rows[:count]]
+		backend = Backend(self._format, self._outfile)
+		backend.writeout(msg      = 'custom', 
+				         varDict  = {'header' : header, 
+				                     'data'   : rows})
+
 class DbAdminConsole(Console):
 	''' Database administration menu console.
 
@@ -747,7 +1108,7 @@ class DbAdminConsole(Console):
 	def preloop(self):
 		Console.preloop(self)
 		log.debug("Entering the db-admin console...")
-		self._format  = ['plain']
+		self._format  = {'format':'plain'}
 		self._outpath = utils.getFileName(self.context.db)
 		try :
 			with open(self.confFile) as f:
@@ -786,7 +1147,7 @@ class DbAdminConsole(Console):
 		Dumps the database as [format] in the <path> directory."""
 		if arg:
 			self.do_outpath(arg)
-		dbCon = dbapi.Connection(self.context.db)
+		dbCon = self.context.connection(writable = True)
 		dumper = DbDumper(self._format, self._outpath)
 		dbCon.executeDumpDb(dumper);
 
@@ -815,7 +1176,7 @@ class DbAdminConsole(Console):
 		#try:
 		dbapi.createDb(name = dbname, loc = dbloc, resources = dbres)
 		self.context.use_db(os.path.join(dbloc,dbname+'.db'))
-		dbCon = dbapi.Connection(self.context.db)
+		dbCon = self.context.connection(writable = True)
 		parser = Frontend(dbCon, 'plain', dbin)
 		parser.harvest()
 		#except Exception as e:
@@ -823,6 +1184,81 @@ class DbAdminConsole(Console):
 		#return 
 
 
+	def do_update_db(self, args):
+		"""update_db [folder]
+		Harvests only the input files which are new or changed since they were last
+		harvested, replacing the entries of their sources, and removes the sources of
+		deleted files. Without <folder>, updates all folders harvested before."""
+		dbCon = self.context.connection(writable = True)
+		if args.strip():
+			folders = [os.path.abspath(args.strip())]
+		else:
+			folders = sorted(set(os.path.dirname(x) for x in dbCon.getManifest()))
+		if not folders:
+			log.error("No harvested folders are recorded. Please give the path to the input files.")
+			return
+		for folder in folders:
+			if not os.path.isdir(folder):
+				log.error("'" + folder + "' is not a folder")
+				continue
+			summary = Frontend(dbCon, 'plain', folder).update()
+			log.info(folder + ": " + ', '.join(str(summary[x]) + ' ' + x 
+				for x in ['new', 'changed', 'unchanged', 'removed']) + " files")
+
+	def do_upgrade_db(self, args):
+		"""upgrade_db
+		Upgrades the loaded database to the current schema (e.g. adds the indexes
+		missing from databases created by older versions, the tag cache, or the
+		full-text index used by 'search') and runs ANALYZE."""
+		dbCon = self.context.connection(writable = True)
+		dbCon.upgradeDb()
+
+	def do_migrate_tags(self, args):
+		"""migrate_tags
+		Converts the tag tables of the loaded database to integer tag ids: the
+		associations between entries and tags then store two integers instead of
+		repeating the text of the tag, which makes them smaller and faster to join.
+		The queries return the same results. Older versions of this program cannot
+		read the converted database."""
+		dbCon = self.context.connection(writable = True)
+		if dbCon.migrateTagIds() is None:
+			log.info("The database already has integer tag ids.")
+			return
+		self.context.close() # the other connections still expect the old layout
+
+	def do_rebuild_tag_cache(self, args):
+		"""rebuild_tag_cache
+		Recomputes the tags cached with each entry, which the entries queries read
+		instead of aggregating the tag tables. The cache is kept up to date
+		automatically, so this is needed only for databases created or changed by
+		older versions."""
+		dbCon = self.context.connection(writable = True)
+		updated = dbCon.rebuildTagCache()
+		log.info("Rebuilt the tag cache of " + str(updated) + " entries.")
+
+	def do_pragma(self, args):
+		"""pragma [profile]
+		Shows the performance profile and the active SQLite PRAGMA values of the
+		connection to the loaded database. If <profile> is given, it is applied
+		first. Available profiles:
+		 * safe      : SQLite defaults. Durable commits, keeps the journal mode of
+		   the database (rollback journal, unless switched to WAL).
+		 * fast-read : WAL journal, large page cache and memory-mapped reads.
+		 * bulk-load : like 'fast-read', but without syncing to disk. For large
+		   harvests only, a power failure may corrupt the database.
+		The profile used at start-up is set with '--profile' or PHDB_PROFILE."""
+		dbCon = self.context.connection(writable = True)
+		if args:
+			if not args.strip() in PROFILES:
+				log.error("Unrecognized performance profile!")
+				return
+			dbCon.applyProfile(args.strip())
+		print "profile      :", dbCon.profile
+		for name, value in dbCon.getPragmas():
+			print name.ljust(12), ":", value
+	def complete_pragma(self, text, line, begidx, endidx):
+		return [ p for p in sorted(PROFILES.keys()) if p.startswith(text) ]
+
 	# Evaluate database
 	def do_evaluate_db(self, args):
 		'''evaluate_db [threshold] [typo_tolerance]
@@ -834,7 +1270,7 @@ class DbAdminConsole(Console):
 		 * <typo_tolerance> determines the percentage of similarity between two tags to 
 		   be considered a typo (default is 0.75).
 		'''
-		dbCon = dbapi.Connection(self.context.db)
+		dbCon = self.context.connection(writable = True)
 		threshold = 2
 		tolerance = 0.75
 		msg = filter(None,args.split(' '))
@@ -865,7 +1301,9 @@ class DbAdminConsole(Console):
 						tagsToModify.append((i[0], mostFrequent))
 					elif not answer.strip() in ['n', 'N', 'no', 'NO', '']:
 						tagsToModify.append((i[0], answer))
-		dbCon.replaceLinks(('Tags','Tag'), ('Tags__Entries', 'Tag'), tagsToModify)
+		summary = dbCon.replaceTags(tagsToModify)
+		log.info("Merged " + str(summary['removed']) + " tags, relinked " \
+			+ str(summary['relinked']) + " entries.")
 
 		invTags = dbCon.evaluateDb_validTag(threshold)
 		log.debug(str(invTags))
@@ -875,9 +1313,11 @@ class DbAdminConsole(Console):
 				+ i[0] + "'. Do you want to remove this tag? (y/N) ")
 			if answer.strip() in ['y', 'Y', 'yes', 'YES']:
 				tagsToRemove.append(i[0])
-		dbCon.removeLinks(('Tags','Tag'), ('Tags__Entries', 'Tag') , tagsToRemove)
+		summary = dbCon.removeTags(tagsToRemove)
+		log.info("Removed " + str(summary['removed']) + " tags, unlinked " \
+			+ str(summary['unlinked']) + " entries.")
 
-		self.context.vTags = dbCon.getFrom('Tags')
+		self.context.vTags = dbCon.getFrom('Tags', ['Tag'])
 		log.debug(str(self.context.vTags))
 
 	def do_show_tags(self, args):
@@ -889,9 +1329,9 @@ class DbAdminConsole(Console):
 		"""remove_tag <tag1>
 		Removes a set of tags from the database (and all its links)."""
 		if arg in self.context.vTags:
-			dbCon = dbapi.Connection(self.context.db)
-			dbCon.removeLinks(('Tags','Tag'), ('Tags__Entries', 'Tag'), [arg])
-			self.context.vTags = dbCon.getFrom('Tags')
+			dbCon = self.context.connection(writable = True)
+			dbCon.removeTags([arg])
+			self.context.vTags = dbCon.getFrom('Tags', ['Tag'])
 		else:
 			print "Tag does not exist!"
 	def complete_remove_tag(self, text, line, begidx, endidx):
@@ -910,9 +1350,9 @@ class DbAdminConsole(Console):
 		"""
 		modify = tuple(arg.split(' '))
 		if modify[0] in self.context.vTags:
-			dbCon = dbapi.Connection(self.context.db)
-			dbCon.replaceLinks(('Tags','Tag'), ('Tags__Entries', 'Tag'), [modify])
-			self.context.vTags = dbCon.getFrom('Tags')
+			dbCon = self.context.connection(writable = True)
+			dbCon.replaceTags([modify])
+			self.context.vTags = dbCon.getFrom('Tags', ['Tag'])
 		else:
 			print "Tag does not exist!"
 	def complete_rename_tag(self, text, line, begidx, endidx):
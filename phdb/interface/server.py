@@ -0,0 +1,265 @@
+"""
+.. module:: phdb.interface.server
+   :platform: Unix, Windows
+   :synopsis: Read-only HTTP/JSON interface to a database.
+
+Serves the entries, sources, cross-references and tags of a database as JSON, using
+only the standard library. The requests are handled by a fixed pool of worker
+threads, each holding its own long-lived read connection (see
+:class:`phdb.core.sqlite3cmd.ConnectionRegistry`). With the `fast-read` profile
+the database is in WAL mode, so the workers keep reading while another program
+writes to it.
+
+Every response carries an `ETag` which changes when `PRAGMA data_version` reports
+a change of the database. Clients sending it back in `If-None-Match` receive
+`304 Not Modified` as long as the database is unchanged.
+
+Endpoints (all `GET`, lists are comma-separated)::
+
+  /entries?filter=<exp>&engine=<engine>&sources=<bibref,>&search=<text>
+  /sources?sources=<bibref,>
+  /crefs?labels=<label,>&closure=1
+  /tags
+
+Each returns `{"columns": [str,], "rows": [[value,],]}`.
+
+.. moduleauthor:: George Ungureanu <ugeorge@kth.se>
+
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import logging.config
+import threading
+import urlparse
+import Queue
+import BaseHTTPServer
+import SocketServer
+
+try:
+	confPath = os.path.join(os.getenv('PHDB_CFG_PATH'), "logger.conf")
+	logging.config.fileConfig(confPath)
+except AttributeError:
+	print "PHDB_CFG_PATH was not set. Cannot continue execution."
+	sys.exit(1)
+
+import phdb.core.sqlite3cmd as dbapi
+
+logger = logging.getLogger('')
+
+#default number of worker threads (and read connections)
+WORKERS = 4
+
+def _list(args, name):
+	"""Helper. A comma-separated list argument, or `None` if not given."""
+	if not args.get(name):
+		return None
+	return [x.strip() for x in args[name].split(',') if x.strip()]
+
+def _entries(dbCon, args):
+	engine = args.get('engine', 'like')
+	if not engine in dbapi.FILTER_ENGINES:
+		raise ValueError("unknown filter engine '" + engine + "'")
+	return dbCon.qGetEntries(args.get('filter') or None, _list(args, 'sources'),
+	                         engine, args.get('search') or None)
+
+def _sources(dbCon, args):
+	return dbCon.qGetSources(_list(args, 'sources'))
+
+def _crefs(dbCon, args):
+	labels = _list(args, 'labels')
+	if not labels:
+		raise ValueError("no labels given")
+	if args.get('closure') in ['1', 'true', 'yes']:
+		return dbCon.qGetCrefClosure(labels)
+	return dbCon.qGetCrefs(None, labels)
+
+def _tags(dbCon, args):
+	return dbCon.qGetTagCounts()
+
+#request path -> function(connection, arguments) returning column headers and rows
+ENDPOINTS = {
+	'/entries' : _entries,
+	'/sources' : _sources,
+	'/crefs'   : _crefs,
+	'/tags'    : _tags,
+	}
+
+
+class RequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+	"""Answers the `GET` requests of the :data:`ENDPOINTS`."""
+	server_version = 'phdb'
+
+	def do_GET(self):
+		url  = urlparse.urlparse(self.path)
+		args = dict((k, v[-1]) for k, v in urlparse.parse_qs(url.query).iteritems())
+		endpoint = ENDPOINTS.get(url.path.rstrip('/'))
+		if endpoint is None:
+			self._reply(404, {'error' : "unknown endpoint '" + url.path + "'",
+			                  'endpoints' : sorted(ENDPOINTS.keys())})
+			return
+		dbCon = self.server.connection()
+		etag  = self.server.etag()
+		match = [x.strip() for x in self.headers.get('If-None-Match', '').split(',')]
+		if etag in match or '*' in match:
+			self._reply(304, None, etag)
+			return
+		try:
+			col_names, rows = endpoint(dbCon, args)
+		except (NameError, ValueError, dbapi.lite.Error) as e:
+			self._reply(400, {'error' : str(e)})
+			return
+		self._reply(200, {'columns' : col_names, 'rows' : rows}, etag)
+
+	def _reply(self, code, body, etag = None):
+		"""Helper. Sends a response with a JSON body."""
+		data = '' if body is None else json.dumps(body)
+		self.send_response(code)
+		if etag:
+			self.send_header('ETag', etag)
+			self.send_header('Cache-Control', 'no-cache')
+		if body is not None:
+			self.send_header('Content-Type', 'application/json; charset=utf-8')
+		self.send_header('Content-Length', str(len(data)))
+		self.end_headers()
+		self.wfile.write(data)
+
+	def log_message(self, format, *args):
+		logger.debug(self.address_string() + " " + format % args)
+
+
+class PoolMixIn:
+	"""Mix-in class handling the requests of a :class:`SocketServer.TCPServer` in a
+	fixed number of threads, instead of a new thread per request
+	(:class:`SocketServer.ThreadingMixIn`). Each thread calls `self.startWorker()`
+	once before handling requests and `self.stopWorker()` when stopped.
+	"""
+	workers = WORKERS
+
+	def startPool(self):
+		"""Starts the threads, one after the other, so that they do not compete
+		while opening their connections."""
+		self._requests = Queue.Queue()
+		self._threads  = []
+		ready = threading.Semaphore(0)
+		for i in range(self.workers):
+			thread = threading.Thread(target = self._work, args = (ready,),
+			                          name = 'phdb-server-' + str(i))
+			thread.daemon = True
+			thread.start()
+			ready.acquire()
+			self._threads.append(thread)
+
+	def stopPool(self):
+		"""Lets the threads finish the queued requests, then stops them."""
+		for thread in self._threads:
+			self._requests.put(None)
+		for thread in self._threads:
+			thread.join()
+		self._threads = []
+
+	def process_request(self, request, client_address):
+		self._requests.put((request, client_address))
+
+	def _work(self, ready):
+		try:
+			self.startWorker()
+		finally:
+			ready.release()
+		while True:
+			item = self._requests.get()
+			if item is None:
+				break
+			request, client_address = item
+			try:
+				self.finish_request(request, client_address)
+			except Exception:
+				self.handle_error(request, client_address)
+			finally:
+				self.shutdown_request(request)
+		self.stopWorker()
+
+
+class Server(PoolMixIn, BaseHTTPServer.HTTPServer):
+	"""HTTP server over a database.
+
+	:parameter db: Path to the database.
+	:type db: str.
+	:parameter address: Host and port to listen on. Port 0 picks a free port.
+	:type address: (str, int).
+	:parameter workers: Number of worker threads, i.e. requests handled at once.
+	:type workers: int.
+
+	The `ETag` of the responses is a generation number, increased whenever the data
+	version changes. The data versions of different connections cannot be compared,
+	so the version is always polled on one connection owned by the server, which
+	the workers share under a lock. Thus every change of the database increases
+	the generation exactly once, no matter how many workers serve requests.
+	"""
+	allow_reuse_address = True
+
+	def __init__(self, db, address, workers = WORKERS):
+		BaseHTTPServer.HTTPServer.__init__(self, address, RequestHandler)
+		self.db       = db
+		self.workers  = workers
+		self.registry = dbapi.ConnectionRegistry()
+		self._lock    = threading.Lock()
+		self._started = '%x' % int(time.time() * 1000)
+		self._generation = 0
+		self._watch   = dbapi.lite.connect(db, check_same_thread = False)
+		self._version = self._dataVersion()
+		self.startPool()
+
+	def connection(self):
+		"""Returns the read connection of the calling worker."""
+		return self.registry.get(self.db)
+
+	def startWorker(self):
+		self.connection()
+
+	def stopWorker(self):
+		self.connection().close()
+
+	def etag(self):
+		"""Returns the current entity tag, after checking the data version of the
+		database.
+
+		:returns: str
+		"""
+		with self._lock:
+			version = self._dataVersion()
+			if version != self._version:
+				self._version = version
+				self._generation += 1
+			return '"' + self._started + '-' + str(self._generation) + '"'
+
+	def _dataVersion(self):
+		"""Helper. Polls `PRAGMA data_version` on the server's own connection."""
+		return self._watch.execute("PRAGMA data_version").fetchone()[0]
+
+	def server_close(self):
+		BaseHTTPServer.HTTPServer.server_close(self)
+		self.stopPool()
+		self._watch.close()
+
+
+def serve(db, host = 'localhost', port = 8080, workers = WORKERS):
+	"""Serves a database until interrupted.
+
+	:parameter db: Path to the database.
+	:type db: str.
+	"""
+	if not dbapi.isDatabase(db):
+		logger.error("'" + db + "' is not a valid database")
+		return
+	server = Server(db, (host, port), workers)
+	logger.info("Serving " + db + " on http://%s:%d/" % server.server_address[:2])
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		pass
+	finally:
+		server.server_close()
@@ -7,6 +7,7 @@
 
 """
 import os
+import sys
 import argparse
 import logging
 
@@ -23,7 +24,11 @@ def main():
 	   configuration variables.
 	3. starts the main interface. Currently the only one implemented is the.core-line
 	   interface :mod:`phdb.interface.cli`
+
+	`phdb serve ...` starts the HTTP interface instead (see :func:`serve`).
 	'''
+	if sys.argv[1:2] == ['serve']:
+		return serve(sys.argv[2:])
 	parser = argparse.ArgumentParser(version= 'phdb-' + __init__.__version__ +
                                      '  (c) 2014 ugeorge@kth.se', description=
                                      ' - PhDB - PhD Personal Academic Database')
@@ -34,12 +39,19 @@ def main():
 	parser.add_argument("-l", "--log", help="Write the debug log in\
                         the application path (default PHDB_CFG_PATH).", 
 						action='store_true')
+	parser.add_argument("-p", "--profile", help="SQLite performance profile \
+                        (default " + DEFAULT_PROFILE + ").", 
+                        choices=sorted(PROFILES.keys()))
+	parser.add_argument("-j", "--jobs", type=int, help="Number of processes \
+                        parsing the input files of a harvest (default 1).")
 	args = parser.parse_args()
 
 	settings = Settings(args)
 	# set the configuration path as an environment variable for modules that cannot
 	# load a settings object
 	os.environ["PHDB_CFG_PATH"] = settings.configPath
+	os.environ["PHDB_PROFILE"]  = settings.profile
+	os.environ["PHDB_JOBS"]     = str(settings.jobs)
 
 	
 	#command execution
@@ -48,4 +60,33 @@ def main():
 	console = cli.MainConsole(context)
 	console.cmdloop()
 
+def serve(argv = None):
+	'''Starts the read-only HTTP/JSON interface :mod:`phdb.interface.server` over
+	a database. The connections use the `fast-read` profile (WAL mode) unless
+	another profile is given.
+	'''
+	parser = argparse.ArgumentParser(prog = 'phdb serve', description=
+                                     ' - PhDB - HTTP/JSON interface to a database')
+	parser.add_argument("database", help="Path to the database.")
+	parser.add_argument("--host", default='localhost', help="Address to listen on \
+                        (default localhost).")
+	parser.add_argument("--port", type=int, default=8080, help="Port to listen on \
+                        (default 8080).")
+	parser.add_argument("-w", "--workers", type=int, default=4, help="Number of \
+                        worker threads, each with its own connection (default 4).")
+	parser.add_argument("-d", "--debug", help="Terminal debug.",
+                        action='store_true')
+	parser.add_argument("-l", "--log", help="Write the debug log in\
+                        the application path (default PHDB_CFG_PATH).", 
+						action='store_true')
+	parser.add_argument("-p", "--profile", help="SQLite performance profile \
+                        (default fast-read).", default='fast-read',
+                        choices=sorted(PROFILES.keys()))
+	args = parser.parse_args(argv)
+
+	settings = Settings(args)
+	os.environ["PHDB_CFG_PATH"] = settings.configPath
+	os.environ["PHDB_PROFILE"]  = settings.profile
 
+	import interface.server as server
+	server.serve(settings.db, args.host, args.port, args.workers)
@@ -12,6 +12,28 @@ import sys
 import shutil
 import logging
 
+#SQLite performance profiles, applied to every connection as PRAGMA statements, in
+#order. Only `journal_mode` is stored in the database file, the rest are per
+#connection. `cache_size` is in KiB when negative, `mmap_size` in bytes.
+PRAGMAS  = ['journal_mode', 'synchronous', 'cache_size', 'mmap_size', 'temp_store', 
+            'busy_timeout']
+PROFILES = {
+	# the SQLite defaults: durable commits, 2 MB cache, no mmap. The journal mode of
+	# the database is kept, i.e. a rollback journal unless it was switched to WAL
+	'safe'      : [('synchronous', 'FULL'), 
+	               ('cache_size', -2000), ('mmap_size', 0),
+	               ('temp_store', 'DEFAULT'), ('busy_timeout', 5000)],
+	# concurrent readers next to a writer, large cache and memory-mapped reads
+	'fast-read' : [('journal_mode', 'WAL'), ('synchronous', 'NORMAL'), 
+	               ('cache_size', -65536), ('mmap_size', 268435456),
+	               ('temp_store', 'MEMORY'), ('busy_timeout', 5000)],
+	# large harvests: no syncing, the database may be lost on a power failure
+	'bulk-load' : [('journal_mode', 'WAL'), ('synchronous', 'OFF'), 
+	               ('cache_size', -262144), ('mmap_size', 268435456),
+	               ('temp_store', 'MEMORY'), ('busy_timeout', 5000)],
+	}
+DEFAULT_PROFILE = 'safe'
+
 
 class Settings:
 	''' Model class for initializing and storing the run-time configuration.
@@ -30,6 +52,17 @@ class Settings:
 		self.db = ''
 		if args.database:
 			self.db = args.database
+		# the performance profile is either given as an argument, or as an environment
+		# variable
+		self.profile = getattr(args, 'profile', None) \
+					or os.getenv("PHDB_PROFILE", DEFAULT_PROFILE)
+		if not self.profile in PROFILES:
+			print "Unknown performance profile '" + self.profile + "'. Using '" \
+					+ DEFAULT_PROFILE + "'."
+			self.profile = DEFAULT_PROFILE
+		self.pragmas = PROFILES[self.profile]
+		# the number of processes parsing the input files of a harvest
+		self.jobs = getattr(args, 'jobs', None) or int(os.getenv("PHDB_JOBS", 1))
 		# the user path is either given as an environment variable, or the home folder
 		configPath = os.getenv("PHDB_CFG_PATH",  os.path.join(os.path.expanduser("~"),".phdb"))
 		if not os.path.exists(configPath):
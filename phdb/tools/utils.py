@@ -9,6 +9,8 @@
 
 import re
 import logging
+import threading
+import collections
 from tempfile import mkstemp
 from os import remove, close
 from shutil import move
@@ -117,3 +119,79 @@ def splitBy(string,char):
 	l_str = [x.strip() for x in string.split(char)]
 	return l_str
 
+
+class LRUCache(object):
+	"""A dictionary holding at most a given number of items. When full, the least
+	recently used item is discarded. Keeps hit and miss counters. Safe to share
+	between threads, e.g. the module-level caches of parsed filters.
+
+	:param size: the maximum number of items.
+	:type size: int.
+	"""
+	def __init__(self, size):
+		self.size   = size
+		self.hits   = 0
+		self.misses = 0
+		self._items = collections.OrderedDict()
+		self._lock  = threading.Lock()
+
+	def __len__(self):
+		return len(self._items)
+
+	def get(self, key, default=None):
+		"""Returns the value stored for `key`, or `default` on a miss."""
+		with self._lock:
+			try:
+				value = self._items.pop(key)
+			except KeyError:
+				self.misses += 1
+				return default
+			self._items[key] = value
+			self.hits += 1
+			return value
+
+	def put(self, key, value):
+		"""Stores a value, discarding the least recently used one if full."""
+		with self._lock:
+			self._items.pop(key, None)
+			self._items[key] = value
+			if len(self._items) > self.size:
+				self._items.popitem(last=False)
+
+	def clear(self):
+		with self._lock:
+			self._items.clear()
+
+class SizedLRUCache(LRUCache):
+	"""An :class:`LRUCache` bounded by the total size of its values instead of their
+	number. The size of each value is given when it is stored. Values larger than
+	the whole cache are not stored.
+
+	:param capacity: the maximum total size, e.g. in bytes.
+	:type capacity: int.
+	"""
+	def __init__(self, capacity):
+		LRUCache.__init__(self, capacity)
+		self.used   = 0
+		self._sizes = {}
+
+	def put(self, key, value, size=0):
+		"""Stores a value of a given size, discarding the least recently used ones
+		until all fit."""
+		with self._lock:
+			self.used -= self._sizes.pop(key, 0)
+			self._items.pop(key, None)
+			if size > self.size:
+				return
+			self._items[key] = value
+			self._sizes[key] = size
+			self.used += size
+			while self.used > self.size:
+				old, value = self._items.popitem(last=False)
+				self.used -= self._sizes.pop(old)
+
+	def clear(self):
+		with self._lock:
+			self._items.clear()
+			self._sizes.clear()
+			self.used = 0
@@ -0,0 +1,100 @@
+import os
+import shutil
+import time
+import unittest
+
+
+class DummyArgs:
+	def __init__(self):
+		self.database = ''
+		self.log = False
+		self.debug = True
+
+import phdb.tools.settings as settings
+
+dargs = DummyArgs()
+settings = settings.Settings(dargs)
+os.environ["PHDB_CFG_PATH"] = settings.configPath
+
+import phdb.core.sqlite3cmd as dbapi
+import phdb.core.asyncdb as test
+
+#counts forever, until interrupted
+ENDLESS = "WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c) \
+	SELECT COUNT(*) FROM c;"
+
+class TestAsyncDb(unittest.TestCase):
+
+	def setUp(self):
+		if not os.path.isdir('.temp'):
+			os.makedirs('.temp')
+		dbapi.createDb('test', '.temp', os.path.join('tests','resources'))
+		self.db = os.path.join('.temp', 'test.db')
+		self.conn = test.AsyncConnection(self.db, readers = 2)
+		entries = [('a', 'entry ' + str(i)) for i in range(1000)]
+		self.conn.insert('Source', '(BibRef)', [('a',)])
+		self.conn.insert('Entries', '(Source, Info)', entries).result()
+		self.conn.commit().result()
+
+	def tearDown(self):
+		self.conn.close()
+		shutil.rmtree('.temp')
+
+	def test_queries(self):
+		blocking = dbapi.Connection(self.db)
+		futures = [self.conn.qGetEntries(), self.conn.qGetSources(),
+		           self.conn.qGetCustom("SELECT COUNT(*) FROM Entries;")]
+		self.assertEqual(futures[0].result(), blocking.qGetEntries())
+		self.assertEqual(futures[1].result(), blocking.qGetSources())
+		self.assertEqual(futures[2].result()[1], [(1000,)])
+		done = []
+		futures[0].addDoneCallback(done.append)
+		self.assertEqual(done, [futures[0]])
+
+	def test_writer(self):
+		ident = self.conn.insertUnique('Tags', '(Tag)', ('x',))
+		update = self.conn.qGetCustom("UPDATE Entries SET At = 'p1';")
+		self.conn.commit()
+		self.assertEqual(ident.result(), 1)
+		update.result()
+		cols, rows = self.conn.qGetCustom("SELECT DISTINCT At FROM Entries;").result()
+		self.assertEqual(rows, [('p1',)])
+		failed = self.conn.insertUnique('Tags', '(Tag)', ('x',))
+		self.assertRaises(dbapi.lite.IntegrityError, failed.result)
+
+	def test_stream(self):
+		stream = self.conn.qIterEntries()
+		self.assertEqual(stream.header()[0], 'Id')
+		rows = list(stream)
+		self.assertEqual(len(rows), 1000)
+		self.assertEqual(stream.future.result(), 1000)
+		self.assertEqual(rows, self.conn.qGetEntries().result()[1])
+
+		buffered, test.STREAM_BUFFER = test.STREAM_BUFFER, 1
+		stream = self.conn.qIterEntries()
+		test.STREAM_BUFFER = buffered
+		stream.next()
+		self.assertTrue(stream.cancel())
+		self.assertRaises(test.CancelledError, stream.next)
+		self.assertRaises(test.CancelledError, stream.future.result, 5)
+
+		stream = self.conn.qIterCustom("SELECT * FROM Missing;")
+		self.assertEqual(list(stream), [])
+
+	def test_cancel(self):
+		slow = [self.conn.qGetCustom(ENDLESS) for i in range(3)]
+		time.sleep(0.1)
+		self.assertFalse(slow[0].done())
+		self.assertTrue(slow[2].cancel())
+		self.assertTrue(slow[2].done())
+		self.assertRaises(test.TimeoutError, slow[0].result, 0.1)
+		start = time.time()
+		for future in slow[:2]:
+			self.assertTrue(future.cancel())
+			self.assertRaises(test.CancelledError, future.result, 5)
+		self.assertTrue(time.time() - start < 5)
+		self.assertFalse(slow[0].cancel())
+		self.assertEqual(self.conn.qGetCustom("SELECT 1;").result(5)[1], [(1,)])
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,82 @@
+import os
+import shutil
+import sqlite3
+import unittest
+import phdb.core.graph as test
+
+EDGES = [('a', 'b'), ('a', 'c'), ('b', 'c'), ('c', 'd'), ('e', 'c'), ('f', 'g')]
+
+def pageRank(nodes, edges, damping, iterations):
+	"""Dense power iteration, as a reference."""
+	n = len(nodes)
+	out = dict((v, [b for a, b in edges if a == v]) for v in nodes)
+	rank = dict((v, 1.0 / n) for v in nodes)
+	for i in range(iterations):
+		dangling = sum(rank[v] for v in nodes if not out[v])
+		new = dict((v, (1.0 - damping) / n + damping * dangling / n) for v in nodes)
+		for v in nodes:
+			for w in out[v]:
+				new[w] += damping * rank[v] / len(out[v])
+		rank = new
+	return rank
+
+class TestGraph(unittest.TestCase):
+
+	def setUp(self):
+		if not os.path.isdir('.temp'):
+			os.makedirs('.temp')
+		self.db = os.path.join('.temp', 'graph.db')
+		con = sqlite3.connect(self.db)
+		con.execute("DROP TABLE IF EXISTS Source")
+		con.execute("DROP TABLE IF EXISTS Xrefs")
+		con.execute("CREATE TABLE Source(BibRef TEXT PRIMARY KEY, Link TEXT, About TEXT)")
+		con.execute("CREATE TABLE Xrefs(RefBy TEXT NOT NULL, RefTo TEXT NOT NULL)")
+		con.executemany("INSERT INTO Source(BibRef) VALUES (?)", [(x,) for x in 'abcdefgh'])
+		con.executemany("INSERT INTO Xrefs VALUES (?,?)", EDGES)
+		con.commit()
+		con.close()
+		self.graph = test.CitationGraph(self.db)
+		self.graph.refresh()
+
+	def tearDown(self):
+		shutil.rmtree('.temp')
+
+	def test_neighbours(self):
+		self.assertEqual(self.graph.neighbours('a'), [('b', 1), ('c', 1)])
+		self.assertEqual(self.graph.neighbours('a', 2), [('b', 1), ('c', 1), ('d', 2)])
+		self.assertEqual(self.graph.neighbours('c', 1, 'in'), [('a', 1), ('b', 1), ('e', 1)])
+		self.assertEqual(self.graph.neighbours('d', 2, 'both'),
+			[('c', 1), ('a', 2), ('b', 2), ('e', 2)])
+		self.assertEqual(self.graph.neighbours('h', 3, 'both'), [])
+		self.assertRaises(KeyError, self.graph.neighbours, 'x')
+
+	def test_degrees(self):
+		self.assertEqual(self.graph.degrees('in')[:2], [('c', 3), ('b', 1)])
+		self.assertEqual(self.graph.degrees('out')[0], ('a', 2))
+		self.assertEqual(len(self.graph.degrees()), 8)
+
+	def test_pageRank(self):
+		nodes = list('abcdefgh')
+		reference = pageRank(nodes, EDGES, 0.85, 200)
+		ranks = self.graph.pageRank()
+		self.assertAlmostEqual(sum(r for v, r in ranks), 1.0)
+		for v, r in ranks:
+			self.assertAlmostEqual(r, reference[v], places = 8)
+		self.assertEqual(ranks[0][0], 'd')
+
+	def test_components(self):
+		self.assertEqual(self.graph.components(),
+			[['a', 'b', 'c', 'd', 'e'], ['f', 'g'], ['h']])
+
+	def test_reload(self):
+		self.assertFalse(self.graph.refresh())
+		con = sqlite3.connect(self.db)
+		con.execute("INSERT INTO Xrefs VALUES ('h', 'a')")
+		con.commit()
+		con.close()
+		self.assertTrue(self.graph.refresh())
+		self.assertEqual(self.graph.edges(), len(EDGES) + 1)
+		self.assertEqual(self.graph.components()[0], ['a', 'b', 'c', 'd', 'e', 'h'])
+
+if __name__ == '__main__':
+	unittest.main()
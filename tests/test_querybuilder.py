@@ -0,0 +1,52 @@
+import json
+import sqlite3
+import unittest
+import phdb.core.querybuilder as test
+
+class TestQueryBuilder(unittest.TestCase):
+
+	def setUp(self):
+		self.con = sqlite3.connect(':memory:')
+		self.con.execute("CREATE TABLE T(Id INTEGER PRIMARY KEY, Name TEXT)")
+		self.con.executemany("INSERT INTO T VALUES (?,?)", 
+			[(i, 'n' + str(i)) for i in range(2000)])
+
+	def tearDown(self):
+		self.con.close()
+
+	def select(self, values):
+		condition, params = test.inList("Name", values)
+		command, params = test.Query("SELECT Id FROM T WHERE ") \
+			.add(condition, params).add(" ORDER BY Id").build()
+		return command, [x[0] for x in self.con.execute(command, params)]
+
+	def test_bucket(self):
+		self.assertEqual([test.bucket(x) for x in [1, 2, 3, 5, 64]], [1, 2, 4, 8, 64])
+
+	def test_stableText(self):
+		text3, ids = self.select(['n1', 'n5', 'n7'])
+		self.assertEqual(ids, [1, 5, 7])
+		text4, ids = self.select(['n2', 'n3', 'n4', 'n9'])
+		self.assertEqual(ids, [2, 3, 4, 9])
+		self.assertEqual(text3, text4)
+		self.assertEqual(test.inList("Name", []), ("0", ()))
+
+	def test_longLists(self):
+		values = ['n' + str(i) for i in range(0, 2000, 2)]
+		text, ids = self.select(values)
+		self.assertEqual(ids, range(0, 2000, 2))
+		if test.hasJson():
+			self.assertTrue('json_each' in text)
+			self.assertEqual(test.inList("Name", values)[1], (json.dumps(values),))
+		saved = test._json[:]
+		test._json[:] = [False]
+		try:
+			text, ids = self.select(values)
+		finally:
+			test._json[:] = saved
+		self.assertEqual(ids, range(0, 2000, 2))
+		self.assertTrue(' OR ' in text)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import os
+import json
+import shutil
+import threading
+import unittest
+import urllib2
+
+
+class DummyArgs:
+	def __init__(self):
+		self.database = ''
+		self.log = False
+		self.debug = True
+
+import phdb.tools.settings as settings
+
+dargs = DummyArgs()
+settings = settings.Settings(dargs)
+os.environ["PHDB_CFG_PATH"] = settings.configPath
+
+import phdb.core.sqlite3cmd as dbapi
+import phdb.interface.server as test
+from phdb.frontend import Frontend
+
+class TestServer(unittest.TestCase):
+
+	def setUp(self):
+		if not os.path.isdir('.temp'):
+			os.makedirs('.temp')
+		dbapi.createDb('test', '.temp', os.path.join('tests','resources'))
+		self.db = os.path.join('.temp', 'test.db')
+		dbCon = dbapi.Connection(self.db, 'fast-read')
+		Frontend(dbCon, 'plain', os.path.join('tests','resources')).harvest()
+		dbCon.close()
+		self.server = test.Server(self.db, ('localhost', 0), workers = 2)
+		self.url = 'http://localhost:%d' % self.server.server_address[1]
+		self.thread = threading.Thread(target = self.server.serve_forever)
+		self.thread.start()
+
+	def tearDown(self):
+		self.server.shutdown()
+		self.thread.join()
+		self.server.server_close()
+		shutil.rmtree('.temp')
+
+	def get(self, path, etag = None):
+		request = urllib2.Request(self.url + path)
+		if etag:
+			request.add_header('If-None-Match', etag)
+		try:
+			response = urllib2.urlopen(request)
+		except urllib2.HTTPError as e:
+			return e.code, e.headers.get('ETag'), e.read()
+		return response.code, response.headers.get('ETag'), json.loads(response.read())
+
+	def test_endpoints(self):
+		dbCon = dbapi.Connection(self.db)
+		code, etag, body = self.get('/entries')
+		self.assertEqual(code, 200)
+		self.assertEqual(body['columns'][0], 'Id')
+		self.assertEqual(len(body['rows']), len(dbCon.qGetEntries()[1]))
+		for engine in dbapi.FILTER_ENGINES:
+			code, etag, body = self.get('/entries?engine=' + engine + '&filter=%2Fmodel')
+			self.assertEqual([r[0] for r in body['rows']],
+				[r[0] for r in dbCon.qGetEntries('/model', engine = engine)[1]])
+		code, etag, body = self.get('/sources?sources=ugeorge14')
+		self.assertEqual([r[0] for r in body['rows']], ['ugeorge14'])
+		code, etag, body = self.get('/tags')
+		self.assertEqual(len(body['rows']), 7)
+		self.assertEqual(sum(r[1] for r in body['rows']), 12)
+		self.assertEqual(self.get('/crefs')[0], 400)
+		self.assertEqual(self.get('/entries?filter=a%20b')[0], 400)
+		self.assertEqual(self.get('/missing')[0], 404)
+
+	def test_etag(self):
+		code, etag, body = self.get('/sources')
+		for i in range(4):
+			self.assertEqual(self.get('/sources', etag)[0], 304)
+		dbCon = dbapi.Connection(self.db)
+		dbCon.insert('Source', '(BibRef)', [('new',)])
+		dbCon.commit()
+		code, changed, body = self.get('/sources', etag)
+		self.assertEqual(code, 200)
+		self.assertNotEqual(changed, etag)
+		self.assertTrue('new' in [r[0] for r in body['rows']])
+		for i in range(4):
+			self.assertNotEqual(self.get('/sources', etag)[0], 304)
+		self.assertEqual(self.get('/sources', '*')[0], 304)
+
+	def test_etagOnce(self):
+		code, etag, body = self.get('/sources')
+		dbCon = dbapi.Connection(self.db)
+		dbCon.insert('Source', '(BibRef)', [('new',)])
+		dbCon.commit()
+		changed = set(self.get('/sources')[1] for i in range(3 * self.server.workers))
+		self.assertEqual(len(changed), 1)
+		self.assertNotEqual(changed.pop(), etag)
+		self.assertEqual(self.server._generation, 1)
+
+if __name__ == '__main__':
+	unittest.main()
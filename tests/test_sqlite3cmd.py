@@ -1,5 +1,6 @@
 import os
 import shutil
+import threading
 import unittest
 
 
@@ -16,6 +17,7 @@ settings = settings.Settings(dargs)
 os.environ["PHDB_CFG_PATH"] = settings.configPath
 
 import phdb.core.sqlite3cmd as test
+import phdb.tools.utils as utils
 
 class TestSettings(unittest.TestCase):
 	
@@ -45,6 +47,482 @@ class TestSettings(unittest.TestCase):
 		cols, rows = conn.getFrom('Tags')
 		self.assertEqual(len(rows), 3)
 
+	def test_resolveReplacements(self):
+		self.assertEqual(test._resolveReplacements([('a','b'), ('b','c'), ('d','d')]),
+						[('a','c'), ('b','c')])
+		self.assertEqual(test._resolveReplacements([('a','b'), ('b','a')]), [('b','a')])
+
+	def test_chainedReplacements(self):
+		#applied at once, the replacements give the same links as applied one by one
+		cases = [[('a','b'), ('c','a')], [('a','b'), ('b','c'), ('c','a')], [('c','a'), ('a','c')]]
+		for tagIds in [False, True]:
+			for pairs in cases:
+				results = []
+				for i, steps in enumerate([[pairs], [[x] for x in pairs]]):
+					test.createDb('chain' + str(i), '.temp', '', tagIds = tagIds)
+					conn = test.Connection(os.path.join('.temp', 'chain' + str(i) + '.db'))
+					conn.insertTagLinks([(1, 'a'), (2, 'c'), (3, 'a'), (3, 'b')])
+					conn.insertOrIgnore('Tags', '(Tag)', [('a',), ('b',), ('c',)])
+					conn.commit()
+					for step in steps:
+						if tagIds:
+							conn.replaceTags(step)
+						else:
+							conn.replaceLinks(('Tags','Tag'), ('Tags__Entries', 'Tag'), step)
+					results.append([sorted(x[0] for x in conn.getFrom('Tags', ['Tag'])[1]),
+						sorted(set(conn.qGetCustom("SELECT te.Entry, t.Tag FROM Tags__Entries \
+						AS te JOIN Tags AS t ON " + test.TAG_KEY[tagIds] + ";")[1]))])
+				self.assertEqual(results[0], results[1])
+			self.assertEqual(results[0][0], ['b', 'c'])
+
+	def test_indexes(self):
+		conn = test.Connection(self.db)
+		cols, rows = conn.qGetCustom("SELECT name FROM sqlite_master WHERE type = 'index';")
+		names = [x[0] for x in rows]
+		self.assertTrue('TagsEntries_TagEntry' in names)
+		self.assertTrue('Entries_Source' in names)
+
+	def test_upgradeDb(self):
+		conn = test.Connection(self.db)
+		conn.qGetCustom('DROP INDEX Entries_Label;')
+		conn.upgradeDb()
+		cols, rows = conn.qGetCustom("SELECT name FROM sqlite_master WHERE type = 'index';")
+		self.assertTrue('Entries_Label' in [x[0] for x in rows])
+		cols, rows = conn.qGetCustom("SELECT name FROM sqlite_master WHERE name = 'sqlite_stat1';")
+		self.assertEqual(len(rows), 1)
+
+	def test_fullTextSearch(self):
+		conn = test.Connection(self.db)
+		conn.insert('Entries', '(Source, Info)', [('a', 'marshmallow and more marshmallow'),
+			('a', 'a marshmallow among many other words'), ('b', 'no sweets here')])
+		conn.commit()
+		self.assertTrue(conn.hasFullText())
+		cols, rows = conn.qGetEntries(search = 'marshmallow')
+		self.assertEqual([x[0] for x in rows], ['1', '2'])
+		cols, rows = conn.qGetEntries(search = 'marshmallow', srcs = ['b'])
+		self.assertEqual(len(rows), 0)
+		conn.qGetCustom("DELETE FROM Entries WHERE Id = 1;")
+		cols, rows = conn.qGetEntries(search = 'marshmallow')
+		self.assertEqual([x[0] for x in rows], ['2'])
+
+		conn.qGetCustom("DROP TABLE EntriesFts;")
+		self.assertFalse(conn.hasFullText())
+		modules = test.FTS_MODULES
+		test.FTS_MODULES = ['fts4']
+		try:
+			conn.upgradeDb()
+		finally:
+			test.FTS_MODULES = modules
+		conn.qGetCustom("UPDATE Entries SET Info = 'sweets, marshmallow' WHERE Id = 3;")
+		cols, rows = conn.qGetEntries(search = 'marshmallow')
+		self.assertEqual([x[0] for x in rows], ['3', '2'])
+		cols, rows = conn.qGetCustom("SELECT sql FROM sqlite_master WHERE name = 'EntriesFts';")
+		self.assertTrue('fts4' in rows[0][0])
+
+	def test_profiles(self):
+		conn = test.Connection(self.db)
+		self.assertEqual(conn.profile, 'safe')
+		pragmas = dict(conn.getPragmas())
+		self.assertEqual(pragmas['journal_mode'], 'delete')
+		self.assertEqual(pragmas['synchronous'], '2')
+		conn.close()
+		conn = test.Connection(self.db, 'fast-read')
+		pragmas = dict(conn.getPragmas())
+		self.assertEqual(pragmas['journal_mode'], 'wal')
+		self.assertEqual(pragmas['mmap_size'], '268435456')
+		conn.applyProfile('bulk-load')
+		self.assertEqual(dict(conn.getPragmas())['synchronous'], '0')
+		conn.applyProfile('safe')
+		self.assertEqual(dict(conn.getPragmas())['synchronous'], '2')
+		self.assertEqual(dict(conn.getPragmas())['journal_mode'], 'wal')
+		conn.close()
+		self.assertEqual(dict(test.Connection(self.db).getPragmas())['journal_mode'], 'wal')
+
+	def test_queryLog(self):
+		conn = test.Connection(self.db)
+		conn.insert('Entries', '(Source, Info)', [('a', 'foo'), ('b', 'bar')])
+		self.assertEqual(conn.queries[-1]['rows'], 2)
+		cols, rows = conn.qGetEntries(srcs = ['a'])
+		self.assertEqual(conn.queries[-1]['plan'], ['(not captured: uncommitted changes)'])
+		conn.commit()
+		cols, rows = conn.qGetEntries(filterExp = 'foo', engine = 'set')
+		query = conn.queries[-1]
+		self.assertEqual(query['rows'], len(rows))
+		self.assertTrue(query['time'] > 0)
+		self.assertTrue([x for x in query['plan'] if 'TagsEntries_TagEntry' in x])
+		self.assertEqual(conn.explainEntries('foo', engine = 'set'), query['plan'])
+		for i in range(test.QUERY_LOG):
+			conn.qGetSources()
+		self.assertEqual(len(conn.queries), test.QUERY_LOG)
+		self.assertEqual(len(conn.slowestQueries(5)), 5)
+
+	def test_tagCache(self):
+		conn = test.Connection(self.db)
+		conn.insert('Entries', '(Source, Info)', [('a', 'foo'), ('b', 'bar')])
+		conn.insert('Tags', '(Tag)', [('x',), ('y',)])
+		conn.insert('Tags__Entries', '(Entry, Tag)', [(1, 'y'), (1, 'x'), (2, 'z')])
+		conn.commit()
+		cols, rows = conn.qGetCustom("SELECT Tagged_as FROM Entries ORDER BY Id;")
+		self.assertEqual(rows, [('x,y',), (None,)])
+		conn.insert('Tags', '(Tag)', [('z',)])
+		conn.qGetCustom("UPDATE Tags__Entries SET Entry = 2 WHERE Tag = 'x';")
+		cols, rows = conn.qGetCustom("SELECT Tagged_as FROM Entries ORDER BY Id;")
+		self.assertEqual(rows, [('y',), ('x,z',)])
+
+		for name in [x.split()[2] for x in test.TAG_CACHE_TRIGGERS]:
+			conn.qGetCustom("DROP TRIGGER " + name + ";")
+		conn.qGetCustom("ALTER TABLE Entries DROP COLUMN Tagged_as;")
+		conn = test.Connection(self.db)
+		self.assertFalse(conn.hasTagCache())
+		cols, uncached = conn.qGetEntries('x | y')
+		conn.upgradeDb()
+		self.assertTrue(conn.hasTagCache())
+		self.assertEqual(conn.qGetEntries('x | y'), (cols, uncached))
+
+	def test_tagIds(self):
+		from phdb.frontend import Frontend
+		test.createDb('ids', '.temp', os.path.join('tests','resources'), tagIds = True)
+		dbs = [self.db, os.path.join('.temp', 'ids.db'), os.path.join('.temp', 'migrated.db')]
+		test.createDb('migrated', '.temp', os.path.join('tests','resources'))
+		conns = [test.Connection(db) for db in dbs]
+		for conn in conns:
+			Frontend(conn, 'plain', os.path.join('tests','resources')).harvest()
+		self.assertFalse(conns[2].hasTagIds())
+		self.assertEqual(conns[2].migrateTagIds(), 12)
+		self.assertEqual(conns[2].migrateTagIds(), None)
+		for conn in conns[1:]:
+			cols, rows = conn.qGetCustom("PRAGMA table_info(Tags__Entries);")
+			self.assertEqual([x[1] for x in rows], ['Entry', 'TagId'])
+		legacy, ids, migrated = conns
+		self.assertFalse(legacy.hasTagIds())
+		self.assertTrue(test.Connection(dbs[2]).hasTagIds())
+
+		def sortTags(result):
+			#the order of aggregated tags is not defined, unless read from the tag cache
+			cols, rows = result
+			tagged = [cols.index(x) for x in [test.TAGS, test.TAGGED] if x in cols]
+			return cols, [tuple(sorted(x.strip() for x in v.split(',')) if i in tagged and v else v
+				for i, v in enumerate(row)) for row in rows]
+		def results(conn):
+			queries = [conn.qGetSources(), conn.qGetTagCounts(), conn.qGetCrefs(None,
+				['haddaway93/what']), conn.qGetCrefClosure(['ugeorge14/art'])]
+			for engine in test.FILTER_ENGINES:
+				for exp in [None, 'marshmallow & /plea', 'catch* | *sophy']:
+					queries.append(conn.qGetEntries(exp, engine = engine))
+			return map(sortTags, queries) + [conn.evaluateDb_typos(0.75),
+				conn.evaluateDb_validTag(2)]
+		expected = results(legacy)
+		for conn in [ids, migrated]:
+			self.assertEqual(results(conn), expected)
+			conn._tagCache = {'main': False}
+			self.assertEqual(results(conn), expected)
+			conn._tagCache = {}
+
+		for conn in conns:
+			conn.replaceTags([('catchphraze', 'catchphrase'), ('plea', 'motivation')])
+			conn.removeTags(['state-of-the-art'])
+		expected = results(legacy)
+		self.assertEqual(results(ids), expected)
+		self.assertEqual(results(migrated), expected)
+		migrated.insertTagLinks([(5, 'new'), (5, 'new')])
+		migrated.commit()
+		self.assertEqual(migrated.qGetEntries('new')[1][0][-1], 'modern-philosophy, motivation, new')
+
+	def test_update(self):
+		from phdb.frontend import Frontend
+		inp = os.path.join('.temp', 'input')
+		shutil.copytree(os.path.join('tests','resources'), inp)
+		conn = test.Connection(self.db)
+		Frontend(conn, 'plain', inp).harvest()
+		def contents(conn):
+			return [conn.qGetSources(), conn.qGetTagCounts(), conn.qGetCustom(
+				"SELECT Source, At, Info, Label, Tagged_as FROM Entries ORDER BY Source, Info;"),
+				conn.qGetCustom("SELECT * FROM Xrefs ORDER BY RefBy, RefTo;")]
+		harvested = contents(conn)
+		self.assertEqual(sorted(x[3] for x in conn.getManifest(inp).values()),
+			[None, 'haddaway93', 'ugeorge14'])
+		self.assertEqual(Frontend(conn, 'plain', inp).update(),
+			{'new':0, 'changed':0, 'unchanged':3, 'removed':0})
+		Frontend(conn, 'plain', inp).harvest()
+		self.assertEqual(contents(conn), harvested)
+
+		ids = dict(conn.qGetCustom("SELECT Info, Id FROM Entries;")[1])
+		with open(os.path.join(inp, 'tst1'), 'a') as f:
+			f.write("TAG: plea, novelty\nOne more marshmallow.\n\n")
+		os.utime(os.path.join(inp, 'tst2'), (0, 0))
+		self.assertEqual(Frontend(conn, 'plain', inp).update(),
+			{'new':0, 'changed':1, 'unchanged':2, 'removed':0})
+		cols, rows = conn.qGetCustom("SELECT Info, Id, Source FROM Entries;")
+		self.assertEqual(len(rows), 6)
+		for info, entry, source in rows:
+			self.assertEqual(info in ids and ids[info] == entry, source == 'haddaway93')
+		test.createDb('fresh', '.temp', inp)
+		fresh = test.Connection(os.path.join('.temp', 'fresh.db'))
+		Frontend(fresh, 'plain', inp).harvest()
+		self.assertEqual(contents(conn), contents(fresh))
+
+		os.rename(os.path.join(inp, 'tst1'), os.path.join(inp, 'moved'))
+		os.remove(os.path.join(inp, 'tst2'))
+		self.assertEqual(Frontend(conn, 'plain', inp).update(),
+			{'new':1, 'changed':0, 'unchanged':1, 'removed':2})
+		self.assertEqual([x[0] for x in conn.qGetSources()[1]], ['ugeorge14'])
+		test.createDb('fresh', '.temp', inp)
+		fresh = test.Connection(os.path.join('.temp', 'fresh.db'))
+		Frontend(fresh, 'plain', inp).harvest()
+		self.assertEqual(contents(conn), contents(fresh))
+
+	def test_parallelHarvest(self):
+		from phdb.frontend import Frontend, plain
+		inp = os.path.join('.temp', 'input')
+		shutil.copytree(os.path.join('tests','resources'), inp)
+		for i in range(6):
+			with open(os.path.join(inp, 'gen' + str(i)), 'w') as f:
+				f.write("#!phdb\n%%\n%% BIBREF: gen" + str(i) + "\n%% REFERENCES: gen"
+					+ str(i - 1) + "\n%% TAGS: generated\n%%\n\n")
+				for j in range(i):
+					f.write("TAG: t" + str(j) + ", catchphrase\nLABEL: l" + str(j)
+						+ "\n[[Ref:haddaway93]] [[Cref:l0]]\n\n")
+		def contents(db):
+			conn = test.Connection(db)
+			return [conn.qGetCustom("SELECT * FROM " + table + ";") for table in
+				['Source', 'Entries', 'Tags', 'Tags__Entries', 'Xrefs']]
+		batch = plain.WRITE_BATCH
+		plain.WRITE_BATCH = 4
+		try:
+			for tagIds in [False, True]:
+				dbs = []
+				for workers in [1, 3]:
+					name = 'w' + str(workers) + str(tagIds)
+					test.createDb(name, '.temp', inp, tagIds = tagIds)
+					dbs.append(os.path.join('.temp', name + '.db'))
+					Frontend(test.Connection(dbs[-1]), 'plain', inp, workers).harvest()
+				self.assertEqual(contents(dbs[1]), contents(dbs[0]))
+				self.assertEqual(len(contents(dbs[1])[1][1]), 20)
+		finally:
+			plain.WRITE_BATCH = batch
+
+	def test_begin(self):
+		from phdb.frontend import Frontend
+		test.createDb('ids', '.temp', '', tagIds = True)
+		for db in [self.db, os.path.join('.temp', 'ids.db')]:
+			conn = test.Connection(db)
+			conn.begin()
+			conn.insert('Source', '(BibRef)', [('a',)])
+			conn.insertTagLinks([(1, 'x')])
+			conn.insert('Source', '(BibRef)', [('b',)])
+			conn.rollback()
+			self.assertEqual(conn.qGetCustom("SELECT COUNT(*) FROM Source;")[1], [(0,)])
+
+			conn = test.Connection(db)
+			def fail(files):
+				raise test.lite.Error("failed")
+			conn.recordFiles = fail
+			self.assertRaises(test.lite.Error, Frontend(conn, 'plain',
+				os.path.join('tests','resources')).harvest)
+			for table in ['Source', 'Entries', 'Tags', 'Tags__Entries', 'Xrefs']:
+				self.assertEqual(conn.qGetCustom("SELECT COUNT(*) FROM " + table + ";")[1],
+					[(0,)])
+
+	def test_insertEntries(self):
+		conn = test.Connection(self.db)
+		conn.begin()
+		self.assertEqual(conn.insertEntries([('a', '', 'foo', '', '', '')]), [1])
+		last = conn.insertUnique('Entries', '(Source, Info)', ('a', 'bar'))
+		conn.qGetCustom("DELETE FROM Entries WHERE Id = " + str(last) + ";")
+		conn.begin()
+		ids = conn.insertEntries([('b', '', x, '', '', '') for x in ['x', 'y']])
+		conn.rollback()
+		self.assertEqual(ids, [last + 1, last + 2])
+		self.assertEqual(conn.insertUnique('Entries', '(Source, Info)', ('a', 'baz')), last + 1)
+		conn.commit()
+
+	def test_emptyTags(self):
+		from phdb.frontend import Frontend
+		inp = os.path.join('.temp', 'input')
+		os.makedirs(inp)
+		with open(os.path.join(inp, 'notags'), 'w') as f:
+			f.write("#!phdb\n%%\n%% BIBREF: notags\n%%\n\nTAG: alpha\nFirst.\n\n"
+				+ "TAG: beta, , \nSecond.\n\n")
+		test.createDb('ids', '.temp', inp, tagIds = True)
+		results = []
+		for db in [self.db, os.path.join('.temp', 'ids.db')]:
+			conn = test.Connection(db)
+			Frontend(conn, 'plain', inp).harvest()
+			cols, rows = conn.qGetEntries()
+			results.append(([x[-1] for x in rows], conn.qGetTagCounts()))
+		self.assertEqual(results[0], results[1])
+		self.assertEqual(results[0][0], ['alpha', 'beta'])
+		self.assertEqual(sorted(results[0][1][1]), [('alpha', 1), ('beta', 1)])
+
+	def test_crefClosure(self):
+		conn = test.Connection(self.db)
+		conn.insert('Entries', '(Source, Info, Label, Crefs)', [('a', '1', 'a/1', 'a/2'),
+			('a', '2', 'a/2', 'a/3,a/1'), ('a', '3', 'a/3', ''), ('a', '4', 'a/4', 'a/1')])
+		conn.commit()
+		cols, rows = conn.qGetCrefClosure(['a/1'])
+		self.assertEqual([x[0] for x in rows], ['1', '2', '3'])
+		cols, rows = conn.qGetCrefClosure(['a/4', 'a/4'], depth = 2)
+		self.assertEqual([x[0] for x in rows], ['1', '4'])
+		self.assertEqual(conn._crefClosure(['a/4'], 2), ['a/1', 'a/4'])
+		self.assertEqual(conn._crefClosure(['a/1'], 10), ['a/1', 'a/2', 'a/3'])
+
+	def test_compileFilter(self):
+		sql, params = test.compileFilter('(foo & /bar) | baz*', 'set')
+		self.assertEqual(params, ('foo', 'bar', 'baz*'))
+		hits = test._filters.hits
+		self.assertEqual(test.compileFilter('(foo & /bar) | baz*', 'set'), (sql, params))
+		self.assertEqual(test._filters.hits, hits + 1)
+		self.assertFalse(os.path.exists('parser.out'))
+
+	def test_resultCache(self):
+		conn = test.Connection(self.db)
+		conn.insert('Entries', '(Source, Info)', [('a', 'foo'), ('b', 'bar')])
+		conn.insert('Tags', '(Tag)', [('x',)])
+		conn.insert('Tags__Entries', '(Entry, Tag)', [(1, 'x'), (2, 'x')])
+		conn.commit()
+		for engine in test.FILTER_ENGINES:
+			first = conn.qGetEntries('x', engine = engine)
+			self.assertEqual(conn.qGetEntries('x', engine = engine), first)
+			self.assertTrue(conn.queries[-1]['cached'])
+		self.assertEqual(conn.resultStats()['hits'], 3)
+		self.assertEqual(conn.qGetEntries(' x', srcs = ['a']), conn.qGetEntries('x', srcs = ['a']))
+
+		other = test.Connection(self.db)
+		other.insert('Entries', '(Source, Info)', [('a', 'baz')])
+		other.insert('Tags__Entries', '(Entry, Tag)', [(3, 'x')])
+		other.commit()
+		cols, rows = conn.qGetEntries('x', engine = 'bitmap')
+		self.assertEqual(len(rows), 3)
+		self.assertFalse(conn.queries[-1]['cached'])
+		conn.removeFrom('Tags__Entries', 'Tag', 'x')
+		cols, rows = conn.qGetEntries('x', engine = 'set')
+		self.assertEqual(rows, [])
+
+		conn.clearResults()
+		self.assertEqual(conn.resultStats()['results'], 0)
+		conn.results.size = 1
+		conn.qGetSources()
+		conn.qGetSources()
+		self.assertEqual(conn.resultStats()['hits'], 0)
+
+		conn.clearResults()
+		conn.insert('Entries', '(Source, Info)', [('c', 'x' * 100) for i in range(50)])
+		conn.commit()
+		conn.results.size = 2000
+		stored = []
+		put = conn.results.put
+		conn.results.put = lambda *args: stored.append(args) or put(*args)
+		cols, rows = conn.qIterEntries()
+		self.assertEqual(len(list(rows)), 53)
+		self.assertEqual(stored, [])
+		self.assertEqual(conn.resultStats()['results'], 0)
+		cols, rows = conn.qIterEntries(srcs = ['a'])
+		self.assertEqual(len(list(rows)), 2)
+		self.assertEqual(conn.resultStats()['results'], 1)
+
+	def test_snapshot(self):
+		conn = test.Connection(self.db)
+		conn.insert('Entries', '(Source, Info, Label)', [('a', 'foo bar', 'a/1'), ('b', 'bar', 'a/2')])
+		conn.insert('Tags', '(Tag)', [('x',), ('y',)])
+		conn.insert('Tags__Entries', '(Entry, Tag)', [(1, 'x'), (2, 'y')])
+		conn.commit()
+		conn.upgradeDb()
+		snap = test.Connection(self.db, snapshot = True)
+		for engine in test.FILTER_ENGINES:
+			self.assertEqual(snap.qGetEntries('x | y', engine = engine),
+				conn.qGetEntries('x | y', engine = engine))
+		self.assertEqual(snap.qGetEntries(search = 'bar'), conn.qGetEntries(search = 'bar'))
+		self.assertEqual(snap.qGetSources(), conn.qGetSources())
+		schema = "SELECT type, name, sql FROM sqlite_master ORDER BY name;"
+		self.assertEqual(snap.qGetCustom(schema), conn.qGetCustom(schema))
+		self.assertRaises(test.lite.DatabaseError, snap._run, "DELETE FROM Tags")
+		self.assertRaises(test.lite.DatabaseError, snap._run, "DROP TABLE Tags")
+
+		conn.insert('Tags__Entries', '(Entry, Tag)', [(2, 'x')])
+		conn.commit()
+		self.assertEqual(len(snap.qGetEntries('x', engine = 'bitmap')[1]), 1)
+		self.assertTrue(snap.refresh())
+		self.assertEqual(len(snap.qGetEntries('x', engine = 'bitmap')[1]), 2)
+		self.assertFalse(conn.refresh())
+
+	def test_attach(self):
+		test.createDb('other', '.temp', os.path.join('tests','resources'))
+		other = os.path.join('.temp', 'other.db')
+		for db, info in [(self.db, 'foo'), (other, 'bar')]:
+			conn = test.Connection(db)
+			conn.insert('Source', '(BibRef)', [(info + '01',)])
+			conn.insert('Entries', '(Source, Info)', [(info + '01', info), (info + '01', 'spam')])
+			conn.insert('Tags', '(Tag)', [('x',), ('y',)])
+			conn.insert('Tags__Entries', '(Entry, Tag)', [(1, 'x'), (2, 'y')])
+			conn.commit()
+			conn.upgradeDb()
+		single = [test.Connection(self.db), test.Connection(other)]
+		conn = test.Connection(self.db)
+		conn.attach(other, 'other')
+		self.assertRaises(ValueError, conn.attach, other, 'other')
+		self.assertEqual(conn.schemas(), ['main', 'other'])
+		for args in [(), ('x',), ('x', None, 'set'), ('/x', None, 'bitmap'), (None, None, 'like', 'spam')]:
+			cols, rows = conn.qGetEntries(*args)
+			self.assertEqual(cols[0], test.DATABASE)
+			expected = []
+			for schema, single_conn in zip(conn.schemas(), single):
+				expected += [(schema,) + x for x in single_conn.qGetEntries(*args)[1]]
+			self.assertEqual(rows, expected)
+		cols, rows = conn.qGetSources()
+		self.assertEqual([x[:2] for x in rows], [('main', 'foo01'), ('other', 'bar01')])
+		plan = conn.explainEntries('x', engine = 'set')
+		self.assertEqual(len([x for x in plan if 'TagsEntries_TagEntry' in x]), 2)
+
+		single[1].insert('Tags__Entries', '(Entry, Tag)', [(2, 'x')])
+		single[1].commit()
+		self.assertEqual(len(conn.qGetEntries('x')[1]), 3)
+		conn.detach('other')
+		self.assertEqual(conn.qGetEntries('x'), single[0].qGetEntries('x'))
+
+	def test_sizedLRUCache(self):
+		cache = utils.SizedLRUCache(10)
+		cache.put('a', 1, 4)
+		cache.put('b', 2, 4)
+		cache.get('a')
+		cache.put('c', 3, 4)
+		self.assertEqual(cache.get('b'), None)
+		self.assertEqual((cache.get('a'), cache.get('c'), cache.used), (1, 3, 8))
+		cache.put('d', 4, 11)
+		self.assertEqual((len(cache), cache.used), (2, 8))
+
+	def test_lruCacheThreads(self):
+		cache  = utils.LRUCache(8)
+		errors = []
+		def work(seed):
+			try:
+				for i in range(20000):
+					key = (i * seed) % 16
+					if cache.get(key) is None:
+						cache.put(key, i)
+			except Exception as e:
+				errors.append(e)
+		threads = [threading.Thread(target = work, args = (x,)) for x in [3, 5, 7, 11]]
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+		self.assertEqual(errors, [])
+		self.assertTrue(len(cache) <= 8)
+
+	def test_connectionRegistry(self):
+		registry = test.ConnectionRegistry()
+		conn = registry.get(self.db)
+		self.assertTrue(registry.get(self.db) is conn)
+		other = []
+		thread = threading.Thread(target=lambda: other.append(registry.get(self.db)))
+		thread.start()
+		thread.join()
+		self.assertFalse(other[0] is conn)
+		self.assertEqual(registry.stats(), {'hits':1, 'misses':2, 'open':2})
+		registry.close()
+		self.assertEqual(registry.stats()['open'], 0)
+		self.assertFalse(registry.get(self.db) is conn)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -52,8 +52,14 @@ class TestStandaloneCase1(unittest.TestCase):
 		dbCon = dbapi.Connection(self.db)
 		col_names, rows = dbCon.qGetSources()
 		self.assertEqual(len(rows), 2)
+		col_names, rows = dbCon.qGetSources(srcs = ['ugeorge14'])
+		self.assertEqual([x[0] for x in rows], ['ugeorge14'])
 		col_names, rows = dbCon.qGetEntries()
 		self.assertEqual(len(rows), 5)
+		iter_names, iter_rows = dbCon.qIterEntries()
+		self.assertEqual(iter_names, col_names)
+		self.assertEqual(next(iter_rows), rows[0])
+		self.assertEqual(list(iter_rows), rows[1:])
 		col_names, rows = dbCon.qGetEntries(filterExp = '(catchphrase & /motivation) | plea', 
 							srcs = ['ugeorge14',])
 		self.assertEqual(len(rows), 1)
@@ -71,6 +77,34 @@ class TestStandaloneCase1(unittest.TestCase):
 				if ref.startswith('Cref:'):
 					testcref = utils.strAfter(ref,'Cref:')
 					self.assertTrue(testcref in cref)
+		col_names, rows = dbCon.qGetEntries(filterExp = '(catchphrase & /motivation) | plea', 
+							srcs = ['ugeorge14',], engine = 'set')
+		self.assertEqual(len(rows), 1)
+		col_names, rows = dbCon.qGetEntries(filterExp = '(catchphrase & /motivation) | plea',
+							engine = 'set')
+		self.assertEqual(len(rows), 2)
+		col_names, rows = dbCon.qGetEntries(filterExp = 'catch')
+		self.assertEqual(len(rows), 3)
+		col_names, rows = dbCon.qGetEntries(filterExp = 'catch', engine = 'set')
+		self.assertEqual(len(rows), 0)
+		col_names, rows = dbCon.qGetEntries(filterExp = 'catch* & /*tion', engine = 'set')
+		self.assertEqual(len(rows), 1)
+		for exp in ['catch', 'catch* & /*tion', '(catchphrase & /motivation) | plea']:
+			col_names, setRows = dbCon.qGetEntries(filterExp = exp, engine = 'set')
+			col_names, bmpRows = dbCon.qGetEntries(filterExp = exp, engine = 'bitmap')
+			self.assertEqual(setRows, bmpRows)
+		col_names, rows = dbCon.qGetCrefClosure(['haddaway93/what', 'ugeorge14/art'])
+		self.assertEqual([x[col_names.index("Id")] for x in rows], ['2', '4', '5'])
+		col_names, rows = dbCon.qGetCrefClosure(['haddaway93/what'], depth = 1)
+		self.assertEqual([x[col_names.index("Id")] for x in rows], ['5'])
+		self.assertEqual(dbCon._crefClosure(['haddaway93/what', 'ugeorge14/art'], 16), 
+			['haddaway93/question', 'haddaway93/what', 'ugeorge14/art'])
+		col_names, rows = dbCon.qGetEntries(search = 'marshmallow*')
+		self.assertEqual(len(rows), 3)
+		for engine in dbapi.FILTER_ENGINES:
+			col_names, rows = dbCon.qGetEntries(filterExp = 'plea', engine = engine,
+								search = 'baby')
+			self.assertEqual([x[col_names.index("Id")] for x in rows], ['5'])
 
 	def test_3_database_manipulation(self):
 		import phdb.core.sqlite3cmd as dbapi
@@ -78,17 +112,30 @@ class TestStandaloneCase1(unittest.TestCase):
 		dbCon = dbapi.Connection(self.db)
 		typos = dbCon.evaluateDb_typos(0.8)
 		self.assertEqual(len(typos),1)
+		self.assertEqual(typos, dbCon.evaluateDb_typosReference(0.8))
 		inval = dbCon.evaluateDb_validTag(2)
 		self.assertEqual(len(inval),3)
-		dbCon.replaceLinks(('Tags','Tag'), ('Tags__Entries', 'Tag'), 
+		summary = dbCon.replaceLinks(('Tags','Tag'), ('Tags__Entries', 'Tag'), 
 						[(typos[0][1][0],typos[0][0][0]),] )
+		self.assertEqual(summary, {'added':0, 'relinked':1, 'removed':1})
 		inval = dbCon.evaluateDb_validTag(2)
 		self.assertEqual(len(inval),2)
-		dbCon.removeLinks(('Tags','Tag'), ('Tags__Entries', 'Tag'), 
+		summary = dbCon.removeLinks(('Tags','Tag'), ('Tags__Entries', 'Tag'), 
 						["marshmallow",] )
+		self.assertEqual(summary, {'unlinked':3, 'removed':1})
 		cols, tags = dbCon.getFrom('Tags')
 		tagstr = [x[0] for x in tags]
 		self.assertFalse("marshmallow" in tagstr)
+		cols, rows = dbapi.Connection(self.db).qGetEntries('marshmallow', engine = 'bitmap')
+		self.assertEqual(len(rows), 0)
+		self.assertTrue(dbCon.hasTagCache())
+		cols, cached = dbCon.qGetEntries()
+		dbCon._tagCache = {'main': False}
+		self.assertEqual(dbCon.qGetEntries(), (cols, cached))
+		dbCon._tagCache = {}
+		dbCon.qGetCustom("UPDATE Entries SET " + dbapi.TAGGED + " = NULL;")
+		self.assertEqual(dbCon.rebuildTagCache(), 5)
+		self.assertEqual(dbCon.qGetEntries(), (cols, cached))
 
 	def test_4_database_dump(self):
 		import phdb.core.sqlite3cmd as dbapi
@@ -0,0 +1,44 @@
+import random
+import unittest
+import phdb.core.typos as test
+
+class TestTypos(unittest.TestCase):
+	
+	def setUp(self):
+		rnd = random.Random(42)
+		words = ['optimization', 'scheduling', 'memory', 'compiler', 'parallel', 'ab']
+		tags = set()
+		for word in words:
+			for i in range(20):
+				tag = list(word)
+				for k in range(rnd.randint(0, 3)):
+					tag[rnd.randrange(len(tag))] = rnd.choice('abcdefghij')
+				tags.add(''.join(tag))
+		self.rows = [(tag, 1) for tag in sorted(tags)]
+
+	def test_equivalence(self):
+		for tolerance in [0.5, 0.7, 0.75, 0.8, 0.9]:
+			self.assertEqual(test.findTypos(self.rows, tolerance), 
+							test.findTyposReference(self.rows, tolerance))
+		rnd = random.Random(7)
+		for i in range(200):
+			rows = sorted(set((''.join(rnd.choice('abc') for k in range(rnd.randint(1, 4))), 1)
+				for j in range(rnd.randint(2, 12))))
+			for tolerance in [0.5, 0.8]:
+				self.assertEqual(test.findTypos(rows, tolerance),
+								test.findTyposReference(rows, tolerance))
+
+	def test_reference(self):
+		rows = [('aa', 1), ('bb', 1), ('cc', 1)]
+		self.assertEqual(test.findTyposReference(rows, 0.5), [])
+		rows = [('ab', 2), ('abc', 1), ('xy', 1), ('abd', 1)]
+		self.assertEqual(test.findTyposReference(rows, 0.8),
+						[[('ab', 2), ('abc', 1), ('abd', 1)]])
+
+	def test_padding(self):
+		rows = [('ab', 1), ('axb', 1), ('xy', 1)]
+		self.assertEqual(test.findTypos(rows, 0.8), [[('ab', 1), ('axb', 1)]])
+
+
+if __name__ == '__main__':
+    unittest.main()